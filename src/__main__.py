@@ -0,0 +1,45 @@
+"""
+全ての処理をまとめた入口
+
+    python -m src {サブコマンド} [引数...]
+
+サブコマンドごとのモジュールは, 選ばれたものだけをimportする.
+各モジュールは引数を定義する add_arguments(parser) と main(args) を持ち, polars や pulp は main の中で読み込むため,
+--help の表示や引数の誤りの検出はそれらを読み込まずに終わる.
+"""
+import argparse
+import importlib
+import sys
+
+# サブコマンド -> (モジュール名, 説明)
+COMMANDS = {
+    "constraints": ("step1_constraints", "ユーザープロファイルから栄養素の制約条件を計算する"),
+    "foods": ("step2_foods", "使用する食品と値段を設定する"),
+    "optimize": ("step3_optimize", "値段が最も安くなる食品の組み合わせを求める"),
+    "sensitivity": ("step3_sensitivity", "双対価格と値段の範囲を求め, 制約値や値段を変化させて解き直す"),
+    "plan": ("step3_plan", "複数日分の献立を1つの問題として解く"),
+    "scenarios": ("step3_scenarios", "値段のシナリオごとの最適な組み合わせと費用を求める"),
+    "batch": ("step3_batch", "マニフェストの各行の最適化を並列に実行する"),
+    "server": ("server", "ワーカーを保持したままHTTPで最適化を受け付ける"),
+    "benchmark": ("benchmark", "処理段階ごとの所要時間を計測する"),
+}
+
+def build_parser(argv: list[str]) -> argparse.ArgumentParser:
+    """argv の先頭で選ばれたサブコマンドのモジュールだけを読み込んで引数を定義する"""
+    parser = argparse.ArgumentParser(prog="python -m src", description="栄養素最適化計算機")
+    subparsers = parser.add_subparsers(dest="command", metavar="{サブコマンド}", required=True)
+    selected = argv[0] if argv else None
+    for command, (module_name, description) in COMMANDS.items():
+        subparser = subparsers.add_parser(command, help=description, description=description)
+        if command == selected:
+            module = importlib.import_module(f".{module_name}", __package__)
+            module.add_arguments(subparser)
+            subparser.set_defaults(_main=module.main)
+    return parser
+
+def main(argv: list[str]) -> int:
+    args = build_parser(argv).parse_args(argv)
+    return args._main(args)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,59 @@
+import argparse
+import sys
+from core.options import SOLVER_BACKENDS
+
+def main(args: argparse.Namespace) -> int:
+    from core.benchmark import DEFAULT_FOOD_COUNTS, STARTUP_BUDGET, compare_results, measure_startup, over_budget, run_benchmarks, save_results
+
+    food_counts = DEFAULT_FOOD_COUNTS if args.foods is None else [n if n > 0 else None for n in args.foods]
+    print(f"=== ベンチマークを実行します (繰り返し: {args.repeats}回) ===")
+    if args.startup_only:
+        results = measure_startup(repeats=args.repeats)
+    else:
+        results = run_benchmarks(repeats=args.repeats, food_counts=food_counts, backends=args.solvers)
+    for result in results:
+        iterations = f", 反復 {result.params['iterations']}回" if result.params.get("iterations") is not None else ""
+        print(f"{result.name}: 中央値 {result.median * 1000:.2f}ms (最小 {min(result.times) * 1000:.2f}ms{iterations})")
+    save_results(results, args.output)
+    print(f"計測結果が保存されました: {args.output}")
+
+    exit_code = 0
+    budget = STARTUP_BUDGET if args.startup_budget is None else args.startup_budget / 1000
+    slow = over_budget(results, budget)
+    if slow:
+        print(f"\n起動時間の上限 ({budget * 1000:.0f}ms) を超えたサブコマンドがあります。")
+        for result in slow:
+            print(f"  {result.name}: 中央値 {result.median * 1000:.2f}ms")
+        exit_code = 1
+
+    if args.compare is None:
+        return exit_code
+    print(f"\n=== 比較: {args.compare} ===")
+    n_regressions = 0
+    for name, before, after, ratio in compare_results(args.output, args.compare):
+        mark = ""
+        if ratio > args.threshold:
+            mark = " <- 悪化"
+            n_regressions += 1
+        print(f"{name}: {before * 1000:.2f}ms -> {after * 1000:.2f}ms (x{ratio:.2f}){mark}")
+    if n_regressions:
+        print(f"{n_regressions}項目が{args.threshold}倍を超えて遅くなりました。")
+        return 1
+    return exit_code
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-o", "--output", type=str, default="/app/data/benchmark/results.json", help="計測結果を書き出すJSONファイルのパス")
+    parser.add_argument("-n", "--repeats", type=int, default=5, help="各項目の繰り返し回数")
+    parser.add_argument("-f", "--foods", type=int, nargs="+", required=False, help="最適化に使う食品数の一覧 (0はテンプレート全体)")
+    parser.add_argument("-b", "--solvers", type=str, nargs="+", choices=SOLVER_BACKENDS, default=list(SOLVER_BACKENDS), help="計測する求解器")
+    parser.add_argument("-c", "--compare", type=str, required=False, help="比較する基準の計測結果 (JSONファイル) のパス")
+    parser.add_argument("-t", "--threshold", type=float, default=1.2, help="基準の何倍を超えたら悪化とみなすか")
+    parser.add_argument("--startup_budget", type=float, required=False, help="python -m src {サブコマンド} --help の起動時間の上限 (ms, 既定値250). 超えた場合は終了コード1で終了する")
+    parser.add_argument("--startup_only", action="store_true", help="起動時間だけを計測する")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    sys.exit(main(args))
@@ -0,0 +1,131 @@
+import time
+from dataclasses import dataclass, field, replace
+from typing import Optional
+import highspy
+import numpy as np
+import polars as pl
+import pulp
+from core.model_builder import build_diet_model
+from core.options import SolverOptions
+from core.persistent_model import PersistentDietModel, has_feasible_solution, to_pulp_status
+from core.tracing import get_tracer
+
+# これより少ない購入単位数は使っていないものとみなす
+MIN_UNITS = 1e-6
+# 上限を求められない食品 (値段が0で, 上限のある栄養素を含まないもの) の購入単位数の上限
+DEFAULT_MAX_UNITS = 1000.0
+
+@dataclass
+class AlternativeMenu:
+    """
+    最適に近い組み合わせの1つ
+
+    rank: 費用の安い順の番号 (1は最適解)
+    status: pulp.LpStatus
+    food_units: 食品データの行と同じ順序の購入単位数
+    foods: 使用する食品名
+    """
+    rank: int
+    status: int
+    objective: float
+    food_units: np.ndarray
+    foods: list[str] = field(default_factory=list)
+    elapsed: float = 0.0
+
+def _unit_bounds(persistent_model: PersistentDietModel, budget: float, slack: float) -> np.ndarray:
+    """
+    費用が budget 以下の解で, 各食品の購入単位数がとりうる上限
+
+    最適解の被約費用 d_j > 0 の食品は, 費用の増加が slack 以下であることから x_j <= 下限 + slack / d_j となる.
+    値段が正の食品は x_j <= budget / 値段, 栄養素の係数は非負なので上限のある栄養素からも上限が決まる.
+    """
+    model = persistent_model.model
+    reduced_cost = persistent_model.reduced_costs()[:model.n_foods]
+    bounds = model.col_upper[:model.n_foods].copy()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        bounds = np.minimum(bounds, np.where(model.cost[:model.n_foods] > 0, budget / model.cost[:model.n_foods], np.inf))
+        bounds = np.minimum(bounds, np.where(reduced_cost > 1e-9, model.col_lower[:model.n_foods] + slack / reduced_cost, np.inf))
+        matrix = model.matrix[:model.n_foods]
+        row_bounds = np.where(matrix > 0, model.row_upper[None, :] / matrix, np.inf).min(axis=1, initial=np.inf)
+    bounds = np.minimum(bounds, row_bounds)
+    return np.where(np.isfinite(bounds), bounds, DEFAULT_MAX_UNITS)
+
+def find_alternative_menus(df_foods: pl.DataFrame, df_constraints: pl.DataFrame, k: int = 5, cost_tolerance: float = 0.1, min_difference: int = 1, constraints_to_ignore=None, solver_options: Optional[SolverOptions] = None) -> list[AlternativeMenu]:
+    """
+    費用が最適解の (1 + cost_tolerance) 倍以下で, 使用する食品の組み合わせが異なる献立を安い順に最大k個求める
+
+    最適解をLPで求めたあと, 同じHiGHSのモデルに食品ごとの使用の有無を表す0-1変数 y_j (x_j <= U_j y_j) と
+    費用の上限の行を追加し, 整数計画として解く. 組み合わせ S が見つかるたびに, S の食品を全ては使わない
+    (sum_{j in S} y_j <= |S| - min_difference) という行 (no-good cut) を追加して解き直すため, モデルは作り直さない.
+    このため各献立は, それまでの全ての献立から少なくとも min_difference 個の食品を外したものになる.
+    U_j は最適解の被約費用と費用の上限から求め, 最適から遠い食品ほど小さくなる.
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame
+        k (int): 求める献立の数 (最適解を含む)
+        cost_tolerance (float): 最適解の費用に対して許容する増加の割合 (0.1なら10%増しまで)
+        min_difference (int): それまでの各献立から外す食品の数の下限. 大きくすると似た食品の入れ替えだけの献立が除かれる
+        constraints_to_ignore (list, optional): 無視する制約名のリスト
+        solver_options (SolverOptions, optional): スレッド数, 制限時間, 相対ギャップ. 求解器はHiGHSを使う
+
+    Returns:
+        list[AlternativeMenu]: 費用の安い順の献立. 最適解が無い場合は空
+    """
+    start_time = time.perf_counter()
+    # 0-1変数を追加するため, 求解器の選択にかかわらずプロセス内のHiGHSで解く
+    options = replace(solver_options or SolverOptions(), backend="highs")
+    persistent_model = PersistentDietModel(build_diet_model(df_foods, df_constraints, constraints_to_ignore), options)
+    model = persistent_model.model
+    solution = persistent_model.solve()
+    if solution.status != pulp.LpStatusOptimal:
+        return []
+
+    menus = [AlternativeMenu(1, solution.status, solution.objective, solution.food_units, elapsed=time.perf_counter() - start_time)]
+    budget = solution.objective + abs(solution.objective) * cost_tolerance
+    n, highs = model.n_foods, persistent_model.highs
+    upper = _unit_bounds(persistent_model, budget, budget - solution.objective)
+
+    # y_j (列 n_cols + j) と, x_j - U_j y_j <= 0, 費用 <= budget の行を追加する.
+    # HiGHSの列 x_j はスケーリングした値 (x_j / col_scale_j) なので, x_j の係数には col_scale_j を掛ける
+    col_scale = persistent_model.scaling.col_scale
+    y = model.n_cols + np.arange(n, dtype=np.int32)
+    highs.addCols(n, np.zeros(n), np.zeros(n), np.ones(n), 0, np.array([], dtype=np.int32), np.array([], dtype=np.int32), np.array([]))
+    highs.changeColsIntegrality(n, y, np.full(n, highspy.HighsVarType.kInteger))
+    starts = np.arange(0, 2 * n, 2, dtype=np.int32)
+    indices = np.column_stack([np.arange(n, dtype=np.int32), y]).ravel()
+    values = np.column_stack([col_scale[:n], -upper]).ravel()
+    highs.addRows(n, np.full(n, -np.inf), np.zeros(n), 2 * n, starts, indices, values)
+    used_cost = np.flatnonzero(model.cost != 0).astype(np.int32)
+    highs.addRow(-np.inf, budget, len(used_cost), used_cost, (model.cost * col_scale)[used_cost])
+
+    tracer = get_tracer()
+    for rank in range(2, k + 1):
+        foods = np.flatnonzero(menus[-1].food_units > MIN_UNITS).astype(np.int32)
+        menus[-1].foods = [model.col_names[j] for j in foods.tolist()]
+        highs.addRow(-np.inf, len(foods) - min_difference, len(foods), y[foods], np.ones(len(foods)))
+
+        solve_start, solve_start_cpu = time.perf_counter(), time.process_time()
+        highs.run()
+        model_status = highs.getModelStatus()
+        status = to_pulp_status(model_status)
+        info = highs.getInfo()
+        if tracer.enabled:
+            tracer.record_solve(
+                "highs", model, status, time.perf_counter() - solve_start, time.process_time() - solve_start_cpu,
+                iterations=info.simplex_iteration_count, is_mip=True, rank=rank, n_cuts=rank - 1
+            )
+        # 制限時間で打ち切られても, 実行可能解があればそれを使う
+        has_solution = has_feasible_solution(info)
+        if status != pulp.LpStatusOptimal and not (model_status == highspy.HighsModelStatus.kTimeLimit and has_solution):
+            break
+        values = persistent_model.scaling.unscale_values(np.asarray(highs.getSolution().col_value, dtype=float)[:model.n_cols])
+        units = values[:n].copy()
+        units[units < MIN_UNITS] = 0.0
+        menus.append(AlternativeMenu(rank, status, float(model.cost @ values), units, elapsed=time.perf_counter() - start_time))
+    menus[-1].foods = [model.col_names[j] for j in np.flatnonzero(menus[-1].food_units > MIN_UNITS).tolist()]
+    # 整数計画は相対ギャップの範囲で打ち切られるため, 見つかった順と費用の順が前後することがある
+    menus.sort(key=lambda menu: menu.objective)
+    for rank, menu in enumerate(menus, 1):
+        menu.rank = rank
+    return menus
@@ -0,0 +1,189 @@
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Optional
+import polars as pl
+import pulp
+from core.optimizer import SearchBudget, SolverOptions, find_optimal_solution_iteratively
+
+DATA_DIR = "/app/data"
+SUMMARY_COLUMNS = ["setting_name", "setting_name_1", "setting_name_2", "status", "relaxed_constraints", "n_solves", "elapsed", "output_path", "error"]
+
+# ワーカープロセスで共有する食品データ (設定名2 -> DataFrame)
+_FOOD_TABLES: dict[str, pl.DataFrame] = {}
+
+@dataclass
+class BatchJob:
+    """1人分の最適化の設定 (出力の設定名, 制約の設定名, 食品の設定名)"""
+    setting_name: str
+    setting_name_1: str
+    setting_name_2: str
+
+@dataclass
+class BatchSummary:
+    """バッチ全体の処理結果の集計"""
+    n_jobs: int = 0
+    n_optimal: int = 0
+    n_relaxed: int = 0
+    n_failed: int = 0
+    wall_time: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        return self.n_jobs / self.wall_time if self.wall_time > 0 else 0.0
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+def constraints_path(setting_name_1: str) -> str:
+    return f"{DATA_DIR}/step1_constraints/{setting_name_1}/nutrient_constraints.csv"
+
+def foods_path(setting_name_2: str) -> str:
+    return f"{DATA_DIR}/step2_foods/{setting_name_2}/food_nutrient_data.csv"
+
+def results_path(setting_name: str) -> str:
+    return f"{DATA_DIR}/step3_optimize/{setting_name}/results.csv"
+
+def load_manifest(manifest_path: str) -> list[BatchJob]:
+    """
+    setting_name, setting_name_1, setting_name_2 の3列を持つCSVからジョブの一覧を読み込む
+    """
+    df_manifest = pl.read_csv(manifest_path, schema_overrides={
+        "setting_name": pl.Utf8, "setting_name_1": pl.Utf8, "setting_name_2": pl.Utf8
+    })
+    missing_columns = {"setting_name", "setting_name_1", "setting_name_2"} - set(df_manifest.columns)
+    if missing_columns:
+        raise ValueError(f"マニフェストに必要な列がありません: {sorted(missing_columns)}")
+    return [BatchJob(**row) for row in df_manifest.select(["setting_name", "setting_name_1", "setting_name_2"]).iter_rows(named=True)]
+
+def load_food_tables(jobs: list[BatchJob]) -> dict[str, pl.DataFrame]:
+    """ジョブが参照する食品データを, 設定名2ごとに一度だけ読み込む"""
+    food_tables = {}
+    for setting_name_2 in dict.fromkeys(job.setting_name_2 for job in jobs):
+        path = foods_path(setting_name_2)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"設定2の食品データファイルが見つかりません: {path}")
+        food_tables[setting_name_2] = pl.read_csv(path)
+    return food_tables
+
+def _init_worker(food_table_paths: dict[str, str]):
+    # メモリマップで読み込むため, 全ワーカーが同じページキャッシュを参照し食品データは複製されない
+    global _FOOD_TABLES
+    _FOOD_TABLES = {name: pl.read_ipc(path, memory_map=True) for name, path in food_table_paths.items()}
+
+def _solve_job(job: BatchJob, method: str, penalty_weights: Optional[dict], solver_options: Optional[SolverOptions] = None, result_formats=("csv",), search_budget: Optional[SearchBudget] = None) -> dict:
+    start_time = time.perf_counter()
+    result = {
+        "setting_name": job.setting_name,
+        "setting_name_1": job.setting_name_1,
+        "setting_name_2": job.setting_name_2,
+        "status": pulp.LpStatus[pulp.LpStatusNotSolved],
+        "relaxed_constraints": "",
+        "n_solves": 0,
+        "elapsed": 0.0,
+        "output_path": "",
+        "error": "",
+    }
+    try:
+        path = constraints_path(job.setting_name_1)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"設定1の制約条件ファイルが見つかりません: {path}")
+        df_constraints = pl.read_csv(path)
+        df_foods = _FOOD_TABLES[job.setting_name_2]
+
+        output_path = results_path(job.setting_name)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        with open(os.path.join(os.path.dirname(output_path), "user_profile.json"), "w") as f:
+            json.dump({"setting_name_1": job.setting_name_1, "setting_name_2": job.setting_name_2}, f, indent=4)
+
+        # 1人分の途中経過は表示せず, 集計用の結果だけを返す
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, status, report = find_optimal_solution_iteratively(
+                df_foods, df_constraints, output_path, method=method, penalty_weights=penalty_weights,
+                solver_options=solver_options, result_formats=result_formats, search_budget=search_budget
+            )
+        result.update({
+            "status": pulp.LpStatus[status],
+            "relaxed_constraints": " ".join(report.relaxed_constraints),
+            "n_solves": report.n_solves,
+            "output_path": report.output_path or "",
+        })
+    except Exception as e:
+        result["status"] = pulp.LpStatus[pulp.LpStatusUndefined]
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed"] = time.perf_counter() - start_time
+    return result
+
+def run_batch(jobs: list[BatchJob], summary_path: str, max_workers: Optional[int] = None, method: str = "elastic", penalty_weights: Optional[dict] = None, solver_options: Optional[SolverOptions] = None, result_formats=("csv",), search_budget: Optional[SearchBudget] = None) -> BatchSummary:
+    """
+    複数人分の最適化をプロセスプールで並列に実行する
+
+    食品データは設定名2ごとに親プロセスで一度だけ読み込んで非圧縮のArrow IPCファイルに書き出し,
+    各ワーカーはそれをメモリマップして共有する.
+    Polarsのスレッドプールはforkに対応していないため, ワーカーはspawnで起動する.
+    各ジョブの結果は完了した順に summary_path へ1行ずつ書き出す.
+
+    Args:
+        jobs (list[BatchJob]): 実行するジョブの一覧
+        summary_path (str): ジョブごとの結果を書き出すCSVファイルのパス
+        max_workers (int, optional): ワーカープロセス数. 指定がなければCPUコア数
+        method (str): 制約の緩和方法
+        penalty_weights (dict, optional): 制約違反に対する重み
+        solver_options (SolverOptions, optional): 求解器の選択と設定
+        result_formats (tuple): 各人の結果の出力形式 ("csv", "parquet", "json"). CSVは常に出力する
+        search_budget (SearchBudget, optional): method="anytime" の1人あたりの制限時間と求解回数の上限
+
+    Returns:
+        BatchSummary: バッチ全体の集計
+    """
+    summary = BatchSummary(n_jobs=len(jobs))
+    start_time = time.perf_counter()
+
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        food_table_paths = {}
+        for i, (setting_name_2, df_foods) in enumerate(load_food_tables(jobs).items()):
+            food_table_paths[setting_name_2] = os.path.join(tmp_dir, f"foods_{i}.arrow")
+            df_foods.write_ipc(food_table_paths[setting_name_2], compression="uncompressed")
+        _run_jobs(jobs, summary_path, summary, food_table_paths, max_workers, method, penalty_weights, solver_options, result_formats, search_budget)
+
+    summary.wall_time = time.perf_counter() - start_time
+    return summary
+
+def _run_jobs(jobs, summary_path, summary, food_table_paths, max_workers, method, penalty_weights, solver_options, result_formats, search_budget):
+    executor = ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(food_table_paths,)
+    )
+    with open(summary_path, "w", newline="") as f, executor:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        futures = [executor.submit(_solve_job, job, method, penalty_weights, solver_options, result_formats, search_budget) for job in jobs]
+        for i, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            writer.writerow(result)
+            f.flush()
+
+            summary.latencies.append(result["elapsed"])
+            if result["error"] or result["status"] != pulp.LpStatus[pulp.LpStatusOptimal]:
+                summary.n_failed += 1
+            elif result["relaxed_constraints"]:
+                summary.n_relaxed += 1
+            else:
+                summary.n_optimal += 1
+            relaxed = f" (無視した制約: {result['relaxed_constraints']})" if result["relaxed_constraints"] else ""
+            error = f" {result['error']}" if result["error"] else ""
+            print(f"[{i}/{len(jobs)}] {result['setting_name']}: {result['status']}{relaxed}{error} ({result['elapsed']:.3f}秒)")
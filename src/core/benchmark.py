@@ -0,0 +1,236 @@
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Callable, Optional
+import numpy as np
+import polars as pl
+from core.column_generation import ColumnGenerationModel
+from core.food_store import build_food_store, load_food_store
+from core.model_builder import build_diet_model
+from core.nutrients_calculator import NutrientsCalculator, UserProfile
+from core.optimizer import find_optimal_solution_iteratively, solve_model
+from core.options import SOLVER_BACKENDS, SolverOptions
+from core.persistent_model import PersistentDietModel
+from core.reference_data import clear_reference_data_cache
+from core.scaling import coefficient_range, compute_scaling
+
+LIFE_CODES = ["general", "pregnant_early", "pregnant_mid_late", "lactating"]
+DEFAULT_FOOD_COUNTS = [5, 20, 100, 500, None]  # Noneはテンプレート全体
+# python -m src のサブコマンドと, --help の表示までにかかる時間の上限 (秒)
+STARTUP_COMMANDS = ["constraints", "foods", "optimize", "sensitivity", "plan", "scenarios", "batch", "server", "benchmark"]
+STARTUP_BUDGET = 0.25
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    times: list[float]
+    params: dict = field(default_factory=dict)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.times)
+
+    def to_dict(self) -> dict:
+        return {
+            "median": self.median,
+            "min": min(self.times),
+            "mean": statistics.fmean(self.times),
+            "n": len(self.times),
+            "params": self.params,
+        }
+
+def measure(name: str, func: Callable[[], object], repeats: int, params: Optional[dict] = None, setup: Optional[Callable[[], object]] = None) -> BenchmarkResult:
+    """func を repeats 回実行して所要時間を記録する. setup は各回の前に実行され, 計測には含まれない"""
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+    return BenchmarkResult(name, times, params or {})
+
+def synthetic_profiles() -> list[UserProfile]:
+    """全ての年齢バンドとライフステージを網羅するプロファイル"""
+    df_age_bands = NutrientsCalculator.reference_data().df_age_bands
+    profiles = []
+    for min_age, max_age in df_age_bands.select("min_age", "max_age").iter_rows():
+        age = (min_age + min(max_age, 100)) / 2
+        weight = min(10 + age * 2.5, 65)
+        height = min(60 + age * 6, 170)
+        profiles.append(UserProfile("M", weight, height, age, 1.75, "general"))
+        for life_code in LIFE_CODES:
+            profiles.append(UserProfile("F", weight * 0.9, height * 0.95, age, 1.75, life_code))
+    return profiles
+
+def constraints_for(user: UserProfile) -> pl.DataFrame:
+    """step1 と同じ形式の制約条件"""
+    return NutrientsCalculator(user).constraints_frame()
+
+def infeasible_constraints(df_constraints: pl.DataFrame, n_conflicts: int = 3) -> pl.DataFrame:
+    """下限のある栄養素のうち n_conflicts 個に, 下限の半分の上限を加えて必ず実行不可能にする"""
+    conflicting = df_constraints.filter(pl.col("lower").is_not_null() & pl.col("upper").is_null())["nutrient_id"].head(n_conflicts)
+    return df_constraints.with_columns(
+        pl.when(pl.col("nutrient_id").is_in(conflicting.implode())).then(pl.col("lower") * 0.5).otherwise(pl.col("upper")).alias("upper")
+    )
+
+def synthetic_food_list(df_template: pl.DataFrame, n_foods: Optional[int], seed: int = 0) -> pl.DataFrame:
+    """テンプレートから食品を無作為に選び, 値段を付ける"""
+    rng = np.random.default_rng(seed)
+    if n_foods is not None and n_foods < df_template.height:
+        df_template = df_template[np.sort(rng.choice(df_template.height, n_foods, replace=False)).tolist()]
+    return df_template.with_columns(pl.Series("cost", rng.uniform(50, 500, df_template.height).round(0)))
+
+def solve_statistics(model, solver_options: SolverOptions) -> dict:
+    """1回解いたときのステータス, 目的関数値と単体法の反復回数 (HiGHSのみ)"""
+    persistent_model = PersistentDietModel(model, solver_options)
+    solution = persistent_model.solve()
+    iterations = None if solver_options.backend == "cbc" else persistent_model.highs.getInfo().simplex_iteration_count
+    return {"status": solution.status, "objective": solution.objective, "iterations": iterations}
+
+def measure_startup(repeats: int = 5, commands: list[str] = STARTUP_COMMANDS) -> list[BenchmarkResult]:
+    """
+    python -m src {サブコマンド} --help を別プロセスで実行し, インタプリタの起動から引数の定義までの所要時間を計測する
+
+    サブコマンドのモジュールが polars や pulp を先頭でimportすると, ここで計測する時間に含まれる.
+    """
+    src_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [src_dir, os.environ.get("PYTHONPATH")]))}
+    results = []
+    for command in commands:
+        def run():
+            subprocess.run(
+                [sys.executable, "-m", os.path.basename(src_dir), command, "--help"],
+                cwd=os.path.dirname(src_dir), env=env, stdout=subprocess.DEVNULL, check=True
+            )
+        results.append(measure(f"startup.{command}", run, repeats, {"command": command}))
+    return results
+
+def over_budget(results: list[BenchmarkResult], budget: float = STARTUP_BUDGET) -> list[BenchmarkResult]:
+    """起動時間の計測結果のうち, 中央値が budget 秒を超えたもの"""
+    return [result for result in results if result.name.startswith("startup.") and result.median > budget]
+
+def run_benchmarks(repeats: int = 5, food_counts: list[Optional[int]] = DEFAULT_FOOD_COUNTS, backends: list[str] = SOLVER_BACKENDS) -> list[BenchmarkResult]:
+    """
+    コマンドの起動, 制約条件の計算, 食品データの読み込み, モデルの構築と求解, 制約緩和を含む最適化を計測する
+
+    求解と最適化は求解器ごとに, スケーリングの有無それぞれで計測し, 項目名に求解器名 (スケーリングした場合は .scaled) を含める.
+    求解のステータスと反復回数, 係数の大きさの比はそれぞれの項目の params に記録する.
+
+    Args:
+        repeats (int): 各項目の繰り返し回数
+        food_counts (list): 最適化に使う食品数. Noneはテンプレート全体
+        backends (list): 計測する求解器
+
+    Returns:
+        list[BenchmarkResult]: 計測結果
+    """
+    results = measure_startup(repeats)
+    profiles = synthetic_profiles()
+
+    # --- Step 1: 制約条件の計算 ---
+    results.append(measure(
+        "step1.dict_nutrient_value.cold", lambda: NutrientsCalculator(profiles[0]).dict_nutrient_value, repeats,
+        setup=clear_reference_data_cache
+    ))
+    results.append(measure(
+        "step1.dict_nutrient_value", lambda: [NutrientsCalculator(user).dict_nutrient_value for user in profiles], repeats,
+        params={"n_profiles": len(profiles)}
+    ))
+    df_profiles = pl.DataFrame([asdict(user) for user in profiles])
+    results.append(measure(
+        "step1.calculate_cohort_constraints", lambda: NutrientsCalculator.calculate_cohort_constraints(df_profiles), repeats,
+        params={"n_profiles": len(profiles)}
+    ))
+
+    # --- Step 2: 食品データの読み込み ---
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_path = os.path.join(tmp_dir, "food_store.arrow")
+        results.append(measure("step2.build_food_store", lambda: build_food_store(store_path), repeats))
+        results.append(measure("step2.load_food_store", lambda: load_food_store(store_path), repeats))
+        df_template = load_food_store(store_path).clone()
+
+    # --- Step 3: 最適化 ---
+    df_constraints = constraints_for(UserProfile("M", 65, 170, 30, 1.75))
+    df_infeasible = infeasible_constraints(df_constraints)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_path = os.path.join(tmp_dir, "results.csv")
+        for n_foods in food_counts:
+            df_foods = synthetic_food_list(df_template, n_foods)
+            params = {"n_foods": df_foods.height}
+            model = build_diet_model(df_foods, df_constraints)
+            results.append(measure(f"step3.build.{df_foods.height}", lambda: build_diet_model(df_foods, df_constraints), repeats, params))
+            results.append(measure(f"step3.column_generation.{df_foods.height}", lambda: ColumnGenerationModel(df_foods, df_constraints).solve(), repeats, params))
+            scaling = compute_scaling(model)
+            results.append(measure(f"step3.scaling.{df_foods.height}", lambda: compute_scaling(model), repeats, {
+                **params, "coefficient_range": coefficient_range(model.matrix), "scaled_coefficient_range": coefficient_range(scaling.scale_model(model).matrix)
+            }))
+            for backend, scaled in itertools.product(backends, (False, True)):
+                solver_options = SolverOptions(backend, scaling=scaled)
+                suffix = f"{backend}.scaled" if scaled else backend
+                solve_params = {**params, "solver": backend, "scaling": scaled, **solve_statistics(model, solver_options)}
+                results.append(measure(
+                    f"step3.solve.{suffix}.{df_foods.height}", lambda: solve_model(model, solver_options), repeats, solve_params
+                ))
+                for label, df in [("feasible", df_constraints), ("infeasible", df_infeasible)]:
+                    def run():
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            return find_optimal_solution_iteratively(df_foods, df, output_path, solver_options=solver_options)
+                    _, status, report = run()
+                    iterative_params = {**params, "solver": backend, "scaling": scaled, "status": status, "relaxed_constraints": report.relaxed_constraints}
+                    results.append(measure(f"step3.iterative.{suffix}.{label}.{df_foods.height}", run, repeats, iterative_params))
+    return results
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def save_results(results: list[BenchmarkResult], output_path: str):
+    data = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "polars": pl.__version__,
+            "platform": platform.platform(),
+        },
+        "results": {result.name: result.to_dict() for result in results},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(data, f, ensure_ascii=False, indent=4)
+
+def compare_results(current_path: str, baseline_path: str) -> list[tuple[str, float, float, float]]:
+    """
+    2つの計測結果で, 両方に含まれる項目の中央値を比較する
+
+    Returns:
+        list[tuple]: (項目名, 基準の中央値, 今回の中央値, 比) の一覧
+    """
+    with open(current_path, "r") as f:
+        current = json.load(f)["results"]
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)["results"]
+
+    comparisons = []
+    for name in current:
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median"], current[name]["median"]
+        comparisons.append((name, before, after, after / before if before > 0 else float("inf")))
+    return comparisons
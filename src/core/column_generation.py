@@ -0,0 +1,191 @@
+import time
+from dataclasses import dataclass, field, replace
+from typing import Optional
+import highspy
+import numpy as np
+import polars as pl
+import pulp
+from core.model_builder import DietModel, build_diet_model
+from core.options import SolverOptions
+from core.persistent_model import apply_highs_options, pass_model_to_highs, to_pulp_status
+from core.tracing import get_tracer
+
+# 最初の作業集合に, 下限のある栄養素ごとに加える「その栄養素が最も安く取れる食品」の数
+INITIAL_FOODS_PER_ROW = 3
+# 1回の価格付けで追加する列の数の上限
+MAX_COLUMNS_PER_ROUND = 50
+# これより小さい (負の) 被約費用の列だけを追加する
+REDUCED_COST_TOLERANCE = 1e-7
+# 制約の相対違反量1あたりの費用. 食品の値段の最大値に対する倍率
+ARTIFICIAL_COST_FACTOR = 1e4
+
+@dataclass
+class ColumnGenerationSolution:
+    """
+    列生成で求めた解
+
+    food_units: 食品データの全ての行に対する購入単位数 (作業集合に無い食品は0)
+    violations: 人工変数が残った制約名 -> 相対違反量. 空でなければ元の問題は実行不可能
+    """
+    status: int
+    food_units: Optional[np.ndarray] = None
+    objective: Optional[float] = None
+    violations: dict[str, float] = field(default_factory=dict)
+    n_rounds: int = 0
+    n_active: int = 0
+
+class ColumnGenerationModel:
+    """
+    少数の食品 (作業集合) だけを列に持つLPを解き, 残りの食品を双対価格で価格付けして
+    被約費用が負の食品だけを列として追加することを繰り返す
+
+    HiGHSのモデルは作業集合の大きさに比例し, 列を追加しても直前の基底は実行可能なままなので主単体法で再開できる.
+    価格付けは全食品の栄養素の行列と双対価格の積を一度に計算する.
+    各制約には相対違反量を表す人工変数 (費用は大きな値 × 重み) を置くため, 作業集合が小さくても実行不可能にならず,
+    収束後に人工変数が残った制約は, 弾性LPと同様に違反が必要な制約とみなせる.
+    """
+
+    def __init__(self, df_foods: pl.DataFrame, df_constraints: pl.DataFrame, penalty_weights: Optional[dict] = None, solver_options: Optional[SolverOptions] = None, max_columns: int = MAX_COLUMNS_PER_ROUND):
+        # 双対価格を使うため, 求解器の選択にかかわらずプロセス内のHiGHSで解く
+        self.options = replace(solver_options or SolverOptions(), backend="highs")
+        self.max_columns = max_columns
+        self.n_solves = 0
+        # 価格付けに使う全食品の係数. HiGHSには作業集合の列だけを渡す
+        self.pricing = build_diet_model(df_foods, df_constraints)
+        self._row_lower = self.pricing.row_lower.copy()
+        self._row_upper = self.pricing.row_upper.copy()
+        self._row_index = {name: i for i, name in enumerate(self.pricing.row_names)}
+        self._inactive = set()
+
+        self.highs = highspy.Highs()
+        apply_highs_options(self.highs, self.options)
+        self._artificial_names, artificial_model = self._artificial_model(penalty_weights or {})
+        pass_model_to_highs(self.highs, artificial_model)
+        self.active = np.empty(0, dtype=np.int64)
+        self._is_active = np.zeros(self.pricing.n_cols, dtype=bool)
+        self._add_columns(self._initial_foods())
+
+    @property
+    def constraint_names(self) -> list[str]:
+        return self.pricing.constraint_names()
+
+    def _artificial_model(self, penalty_weights: dict) -> tuple[list[str], DietModel]:
+        """制約ごとの人工変数だけを列に持つモデル. 係数は制約値の大きさなので, 値は相対違反量になる"""
+        model = self.pricing
+        cost_scale = ARTIFICIAL_COST_FACTOR * max(1.0, float(np.abs(model.cost).max(initial=0.0)))
+        names, rows, coefficients, costs = [], [], [], []
+        for i, nutrient_id in enumerate(model.row_names):
+            for prefix, bound, sign in (("Min", model.row_lower[i], 1.0), ("Max", model.row_upper[i], -1.0)):
+                if not np.isfinite(bound):
+                    continue
+                constraint_name = f"{prefix}_{nutrient_id}"
+                weight = penalty_weights.get(constraint_name, penalty_weights.get(nutrient_id, 1.0))
+                names.append(constraint_name)
+                rows.append(i)
+                coefficients.append(sign * (abs(bound) if bound != 0 else 1.0))
+                costs.append(cost_scale * weight)
+        matrix = np.zeros((len(names), model.n_rows))
+        matrix[np.arange(len(names)), rows] = coefficients
+        artificial_model = DietModel(
+            col_names=[f"artificial_{name}" for name in names],
+            cost=np.array(costs, dtype=float),
+            col_lower=np.zeros(len(names)),
+            col_upper=np.full(len(names), np.inf),
+            row_names=model.row_names,
+            row_lower=model.row_lower,
+            row_upper=model.row_upper,
+            matrix=matrix,
+        )
+        return names, artificial_model
+
+    def _initial_foods(self) -> np.ndarray:
+        """下限のある食品と, 下限のある栄養素ごとにその栄養素を最も安く取れる食品"""
+        model = self.pricing
+        foods = [np.flatnonzero(model.col_lower > 0)]
+        available = model.col_upper > 0
+        for i in np.flatnonzero(np.isfinite(model.row_lower) & (model.row_lower > 0)).tolist():
+            column = model.matrix[:, i]
+            candidates = np.flatnonzero((column > 0) & available)
+            if len(candidates) == 0:
+                continue
+            ratio = model.cost[candidates] / column[candidates]
+            n = min(INITIAL_FOODS_PER_ROW, len(candidates))
+            foods.append(candidates[np.argpartition(ratio, n - 1)[:n]])
+        return np.unique(np.concatenate(foods))
+
+    def _add_columns(self, foods: np.ndarray):
+        foods = foods[~self._is_active[foods]]
+        if len(foods) == 0:
+            return
+        block = self.pricing.matrix[foods]
+        nonzero = block != 0
+        starts = np.zeros(len(foods), dtype=np.int32)
+        np.cumsum(nonzero.sum(axis=1)[:-1], out=starts[1:])
+        self.highs.addCols(
+            len(foods), self.pricing.cost[foods], self.pricing.col_lower[foods], self.pricing.col_upper[foods],
+            int(nonzero.sum()), starts, np.nonzero(nonzero)[1].astype(np.int32), block[nonzero]
+        )
+        self.active = np.concatenate([self.active, foods])
+        self._is_active[foods] = True
+
+    def _price(self) -> np.ndarray:
+        """作業集合に無い食品のうち, 被約費用が負のものを小さい順に最大 max_columns 個返す"""
+        duals = np.asarray(self.highs.getSolution().row_dual, dtype=float)
+        reduced_cost = self.pricing.cost - self.pricing.matrix @ duals
+        candidates = np.flatnonzero((reduced_cost < -REDUCED_COST_TOLERANCE) & ~self._is_active & (self.pricing.col_upper > 0))
+        if len(candidates) > self.max_columns:
+            candidates = candidates[np.argpartition(reduced_cost[candidates], self.max_columns - 1)[:self.max_columns]]
+        return candidates
+
+    def set_active_constraints(self, constraints_to_ignore):
+        """constraints_to_ignore に含まれる制約だけが無効な状態にする"""
+        self._inactive = set(constraints_to_ignore)
+        for name in self._inactive:
+            prefix, _, nutrient_id = name.partition("_")
+            if prefix not in ("Min", "Max") or nutrient_id not in self._row_index:
+                raise KeyError(f"制約が見つかりません: {name}")
+        for i, nutrient_id in enumerate(self.pricing.row_names):
+            lower = -np.inf if f"Min_{nutrient_id}" in self._inactive else self._row_lower[i]
+            upper = np.inf if f"Max_{nutrient_id}" in self._inactive else self._row_upper[i]
+            self.highs.changeRowBounds(i, lower, upper)
+
+    def solve(self) -> ColumnGenerationSolution:
+        """価格付けで追加する列が無くなるまで, 作業集合のLPを直前の基底から解き直す"""
+        tracer = get_tracer()
+        n_artificials = len(self._artificial_names)
+        n_rounds = 0
+        while True:
+            start_wall, start_cpu = time.perf_counter(), time.process_time()
+            self.highs.run()
+            self.n_solves += 1
+            n_rounds += 1
+            status = to_pulp_status(self.highs.getModelStatus())
+            if tracer.enabled:
+                tracer.record_solve(
+                    "highs", self.pricing, status, time.perf_counter() - start_wall, time.process_time() - start_cpu,
+                    iterations=self.highs.getInfo().simplex_iteration_count, column_generation_round=n_rounds, n_active=len(self.active)
+                )
+            if status != pulp.LpStatusOptimal:
+                return ColumnGenerationSolution(status, n_rounds=n_rounds, n_active=len(self.active))
+            new_columns = self._price()
+            if len(new_columns) == 0:
+                break
+            self._add_columns(new_columns)
+
+        values = np.asarray(self.highs.getSolution().col_value, dtype=float)
+        food_units = np.zeros(self.pricing.n_cols)
+        food_units[self.active] = values[n_artificials:]
+        food_units[food_units < 1e-9] = 0.0
+        violations = {
+            name: float(value)
+            for name, value in zip(self._artificial_names, values[:n_artificials].tolist())
+            if value > 1e-7 and name not in self._inactive
+        }
+        return ColumnGenerationSolution(
+            pulp.LpStatusInfeasible if violations else pulp.LpStatusOptimal,
+            food_units=food_units,
+            objective=float(self.pricing.cost @ food_units),
+            violations=violations,
+            n_rounds=n_rounds,
+            n_active=len(self.active),
+        )
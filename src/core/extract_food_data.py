@@ -1,70 +1,157 @@
+import argparse
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Optional
 import polars as pl
 
-if __name__ == "__main__":
-    FUNDAMENTAL_DATA_PATH = "/app/resources/step2/raw/20230428-mxt_kagsei-mext_00001_012.csv"
-    FAT_DATA_PATH = "/app/resources/step2/raw/20230428-mxt_kagsei-mext_00001_032.csv"
-    NUTRIENT_IDS_PATH = "/app/resources/nutrient_ids.csv"
-    FOOD_NUTRIENT_DATA_PATH = "/app/resources/step2/template/food_nutrient_data.csv"
-
-
-    df_fundamental = pl.read_csv(FUNDAMENTAL_DATA_PATH)
-    units_fundamental = df_fundamental[0]
-    labels_fundamental = df_fundamental.columns[1:]
-    df_fundamental = df_fundamental[1:]
-    df_fundamental = df_fundamental.with_columns(
-        pl.col(labels_fundamental).cast(pl.Utf8)
-        .str.replace_all(r"\(|\)", "")
-        .str.replace_all("Tr", "")
-        .str.replace_all(" ", "")
-        .str.replace_all("†", "")
-        .str.replace_all(r"\*", "")
-        .str.replace_all("-", "")
-        .cast(pl.Float64, strict=False)
-        .fill_null(0)
-    )
-    df_fat = pl.read_csv(FAT_DATA_PATH)
-    labels_fat = df_fat.columns[1:]
-    df_fat = df_fat[1:]
-    df_fat = df_fat.with_columns(
-        pl.col(labels_fat).cast(pl.Utf8)
-        .str.replace_all(r"\(|\)", "")
-        .str.replace_all("Tr", "")
-        .str.replace_all(" ", "")
-        .str.replace_all("†", "")
-        .str.replace_all(r"\*", "")
-        .str.replace_all("-", "")
+RAW_DATA_DIR = "/app/resources/step2/raw/"
+FUNDAMENTAL_DATA_PATH = f"{RAW_DATA_DIR}20230428-mxt_kagsei-mext_00001_012.csv"
+FAT_DATA_PATH = f"{RAW_DATA_DIR}20230428-mxt_kagsei-mext_00001_032.csv"
+NUTRIENT_IDS_PATH = "/app/resources/nutrient_ids.csv"
+FOOD_NUTRIENT_DATA_PATH = "/app/resources/step2/template/food_nutrient_data.csv"
+
+FOOD_NUMBER_COLUMN = "食品番号"
+FOOD_NAME_COLUMN = "食品名"
+
+# 推定値の括弧, 微量(Tr), 空白, 記号(† *), 未測定(-) を一度の置換で取り除く
+_CLEAN_PATTERN = r"[()\s†*-]|Tr"
+
+@dataclass
+class SourceTable:
+    """成分表のCSVファイル. how は主表 (最初のテーブル) との結合方法"""
+    path: str
+    how: str = "inner"
+
+@dataclass
+class StageReport:
+    stage: str
+    n_rows: int
+    n_columns: int
+    elapsed: float
+
+@dataclass
+class ExtractionReport:
+    stages: list[StageReport] = field(default_factory=list)
+    join_key: Optional[str] = None
+
+    def add(self, stage: str, df: pl.DataFrame, start_time: float):
+        self.stages.append(StageReport(stage, df.height, df.width, time.perf_counter() - start_time))
+
+    def print(self):
+        for s in self.stages:
+            print(f"  {s.stage}: {s.n_rows}行 x {s.n_columns}列 ({s.elapsed:.3f}秒)")
+        print(f"  合計: {sum(s.elapsed for s in self.stages):.3f}秒")
+
+def clean_value_expr(columns: list[str]) -> pl.Expr:
+    """成分値の文字列から記号を取り除いて数値にする. 数値にできない値は0とする"""
+    return (
+        pl.col(columns).str.replace_all(_CLEAN_PATTERN, "")
         .cast(pl.Float64, strict=False)
         .fill_null(0)
     )
 
-    df_nutrient_ids = pl.read_csv(NUTRIENT_IDS_PATH)
+def scan_source_table(path: str) -> pl.LazyFrame:
+    """成分表のCSVを遅延読み込みする. ヘッダーの次の行は単位なので読み飛ばす"""
+    return pl.scan_csv(path, infer_schema=False, skip_rows_after_header=1)
+
+def _join_key(schemas: list[pl.Schema]) -> str:
+    # 食品名は表によって表記が揺れることがあるため, 全ての表に食品番号があればそれで結合する
+    if all(FOOD_NUMBER_COLUMN in schema for schema in schemas):
+        return FOOD_NUMBER_COLUMN
+    return FOOD_NAME_COLUMN
+
+def extract_food_data(source_tables: list[SourceTable], nutrient_ids_path: str = NUTRIENT_IDS_PATH) -> tuple[pl.DataFrame, ExtractionReport]:
+    """
+    成分表のCSVから食品栄養データを作成する
+
+    各表は遅延読み込みし, nutrient_ids.csv にある栄養素のうちまだ取り出していない列だけを選んでから
+    記号の除去と数値への変換を1つの式で行う. 表を追加しても, 読み込むのは必要な列だけになる.
+
+    Args:
+        source_tables (list[SourceTable]): 成分表のCSVファイル. 最初の表を主表とする
+        nutrient_ids_path (str): 栄養素IDと成分表の項目名の対応表
+
+    Returns:
+        tuple[pl.DataFrame, ExtractionReport]: 食品栄養データと, 段階ごとの行数・所要時間
+    """
+    report = ExtractionReport()
 
+    start_time = time.perf_counter()
+    df_nutrient_ids = pl.read_csv(nutrient_ids_path)
     nutrient_ids = df_nutrient_ids["nutrient_id"].to_list()
     nutrient_names = df_nutrient_ids["nutrient_name"].to_list()
-    nutrient_units = df_nutrient_ids["unit"].to_list()
+    report.add("nutrient_ids", df_nutrient_ids, start_time)
 
-    rename_map = dict(zip(nutrient_names, nutrient_ids))
+    lazy_tables = [scan_source_table(table.path) for table in source_tables]
+    schemas = [lf.collect_schema() for lf in lazy_tables]
+    key = _join_key(schemas)
+    report.join_key = key
 
-    # 最小と最大をunitの単位で設定できるようにする
-    # ここではすべて空欄にする
-    min_col = pl.lit(None).cast(pl.Float64).alias("min")
-    max_col = pl.lit(None).cast(pl.Float64).alias("max")
+    # 各栄養素は, それを含む最初の表から取り出す
+    remaining = list(nutrient_names)
+    df_merged = None
+    for table, lf, schema in zip(source_tables, lazy_tables, schemas):
+        start_time = time.perf_counter()
+        columns = [name for name in remaining if name in schema]
+        remaining = [name for name in remaining if name not in columns]
+        keep_columns = [key] + ([FOOD_NAME_COLUMN] if df_merged is None and key != FOOD_NAME_COLUMN else [])
+        if df_merged is not None and not columns and table.how == "left":
+            continue
+        df_table = lf.select(
+            pl.col(keep_columns),
+            *([clean_value_expr(columns)] if columns else [])
+        ).filter(pl.col(key).is_not_null()).collect(engine="streaming")
+        report.add(f"scan {os.path.basename(table.path)}", df_table, start_time)
 
-    # このデータはすべて100gあたりの値なので、amountとunitの列を追加
-    amount_col = pl.lit(100).alias("amount")
-    unit_col = pl.lit("g").alias("unit")
+        start_time = time.perf_counter()
+        if df_merged is None:
+            df_merged = df_table
+        else:
+            df_merged = df_merged.join(df_table.unique(subset=key, keep="first", maintain_order=True), on=key, how=table.how, maintain_order="left")
+            if table.how == "left":
+                df_merged = df_merged.with_columns(pl.col(columns).fill_null(0))
+        report.add(f"join {os.path.basename(table.path)}", df_merged, start_time)
 
-    # 値段は空欄で追加
-    cost_col = pl.lit(None).cast(pl.Float64).alias("cost")
+    if remaining:
+        raise ValueError(f"成分表に見つからない栄養素があります: {remaining}")
 
-    # df_fundamentalとdf_fatを食品名で結合
-    df_merged = df_fundamental.join(df_fat, on="食品名", how="inner", suffix="_fat")
+    start_time = time.perf_counter()
+    # 値段と, 使用量の最小・最大はunitの単位で設定できるようにここではすべて空欄にする.
+    # このデータはすべて100gあたりの値なので, amountとunitの列を追加する
     df_final = df_merged.select(
-    [pl.col("食品名").alias("food_name")] +
-    [cost_col, amount_col, min_col, max_col, unit_col] +
-    [pl.col(name).alias(rename_map.get(name, name)) for name in nutrient_names]
+        pl.col(FOOD_NAME_COLUMN).alias("food_name"),
+        pl.lit(None).cast(pl.Float64).alias("cost"),
+        pl.lit(100).alias("amount"),
+        pl.lit(None).cast(pl.Float64).alias("min"),
+        pl.lit(None).cast(pl.Float64).alias("max"),
+        pl.lit("g").alias("unit"),
+        *[pl.col(name).alias(nutrient_id) for name, nutrient_id in zip(nutrient_names, nutrient_ids)]
     )
+    report.add("select", df_final, start_time)
+    return df_final, report
 
+def main(args: argparse.Namespace):
+    source_tables = [SourceTable(args.fundamental), SourceTable(args.fat)]
+    source_tables += [SourceTable(path, how="left") for path in args.supplement or []]
 
-    df_final.write_csv(FOOD_NUTRIENT_DATA_PATH)
+    df_final, report = extract_food_data(source_tables, args.nutrient_ids)
+
+    start_time = time.perf_counter()
+    df_final.write_csv(args.output)
+    report.add("write", df_final, start_time)
+
+    print(f"結合キー: {report.join_key}")
+    report.print()
     print("食品栄養データの抽出と保存が完了しました。")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fundamental", type=str, default=FUNDAMENTAL_DATA_PATH, help="成分表本表のCSVファイルのパス")
+    parser.add_argument("--fat", type=str, default=FAT_DATA_PATH, help="脂肪酸成分表のCSVファイルのパス")
+    parser.add_argument("--supplement", type=str, action="append", help="追加で読み込む成分表 (アミノ酸, 炭水化物など) のCSVファイルのパス. 複数指定可")
+    parser.add_argument("--nutrient_ids", type=str, default=NUTRIENT_IDS_PATH, help="栄養素IDと成分表の項目名の対応表")
+    parser.add_argument("-o", "--output", type=str, default=FOOD_NUTRIENT_DATA_PATH, help="出力先のCSVファイルのパス")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,92 @@
+from typing import Optional
+import polars as pl
+from core.food_search import FoodSearchIndex, normalize_food_name
+
+# 指定ファイルで上書きできる列
+SPEC_COLUMNS = ["cost", "amount", "min", "max"]
+
+def read_food_spec(spec_path: str) -> pl.DataFrame:
+    """
+    食品の指定ファイル (CSV) を読み込む
+
+    food_name列は必須で, 食品名または検索語を書く. cost, amount, min, max の列は任意.
+    """
+    df_spec = pl.read_csv(spec_path, infer_schema=False)
+    if "food_name" not in df_spec.columns:
+        raise ValueError(f"指定ファイルにfood_name列がありません: {spec_path}")
+    return df_spec.select(
+        pl.col("food_name").str.strip_chars().alias("query"),
+        *[
+            (pl.col(col_name) if col_name in df_spec.columns else pl.lit(None)).cast(pl.Float64, strict=False).alias(col_name)
+            for col_name in SPEC_COLUMNS
+        ]
+    ).filter(pl.col("query").is_not_null() & (pl.col("query") != ""))
+
+def resolve_food_names(queries: list[str], search_index: FoodSearchIndex) -> pl.Series:
+    """
+    食品名または検索語を食品データの食品名に解決する
+
+    正規化した食品名の完全一致は結合で一度にまとめて解決し, 残りだけを検索して最上位の候補を採用する.
+    解決できなかったものはnullになる.
+    """
+    df_names = pl.DataFrame({
+        "normalized_name": search_index.normalized_names,
+        "food_name": search_index.food_names,
+    }).unique(subset="normalized_name", keep="first")
+    df_resolved = pl.DataFrame({"normalized_name": [normalize_food_name(query) for query in queries]}).join(
+        df_names, on="normalized_name", how="left", maintain_order="left"
+    )
+    food_names = df_resolved["food_name"].to_list()
+    for i, food_name in enumerate(food_names):
+        if food_name is None:
+            hits = search_index.search(queries[i], k=1)
+            food_names[i] = hits[0].food_name if hits else None
+    return pl.Series("food_name", food_names, dtype=pl.Utf8)
+
+def build_food_list(df_foods: pl.DataFrame, df_spec: pl.DataFrame, search_index: Optional[FoodSearchIndex] = None, defaults: Optional[dict] = None) -> pl.DataFrame:
+    """
+    指定ファイルの内容から使用する食品のデータを一度に作成する
+
+    食品データとの結合で栄養素の値を取り出し, 指定ファイルの cost, amount, min, max で上書きする.
+    それでも欠けている値は defaults (列名 -> 値) で補う.
+
+    Args:
+        df_foods (pl.DataFrame): 食品データ
+        df_spec (pl.DataFrame): read_food_spec で読み込んだ指定内容
+        search_index (FoodSearchIndex, optional): 食品名の検索インデックス. 指定がなければ作成する
+        defaults (dict, optional): 欠けている値を補う列ごとの既定値
+
+    Returns:
+        pl.DataFrame: df_foods と同じ列を持つ使用する食品のデータ. 同じ食品が複数回指定された場合は後の指定を優先する
+    """
+    if search_index is None:
+        search_index = FoodSearchIndex.from_frame(df_foods)
+    defaults = defaults or {}
+
+    df_spec = df_spec.with_columns(resolve_food_names(df_spec["query"].to_list(), search_index))
+    unresolved = df_spec.filter(pl.col("food_name").is_null())["query"].to_list()
+    if unresolved:
+        raise ValueError(f"食品データに見つからない食品があります: {unresolved}")
+
+    df_spec = df_spec.unique(subset="food_name", keep="last", maintain_order=True)
+    df_food_list = df_spec.join(
+        df_foods.unique(subset="food_name", keep="first"), on="food_name", how="left", suffix="_food"
+    ).with_columns(
+        pl.coalesce(col_name, f"{col_name}_food").alias(col_name) for col_name in SPEC_COLUMNS
+    ).select(df_foods.columns)
+
+    df_food_list = df_food_list.with_columns(
+        pl.col(col_name).fill_null(pl.lit(value).cast(df_foods.schema[col_name]))
+        for col_name, value in defaults.items() if col_name in df_foods.columns
+    )
+
+    # 対話形式と同様, min と max 以外の値は全て埋まっている必要がある
+    required_columns = [col_name for col_name in df_foods.columns if col_name not in ("min", "max")]
+    df_missing = df_food_list.filter(pl.any_horizontal(pl.col(required_columns).is_null()))
+    if not df_missing.is_empty():
+        missing = {
+            row["food_name"]: [col_name for col_name in required_columns if row[col_name] is None]
+            for row in df_missing.iter_rows(named=True)
+        }
+        raise ValueError(f"値が設定されていない項目があります (既定値で補ってください): {missing}")
+    return df_food_list
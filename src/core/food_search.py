@@ -0,0 +1,117 @@
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import polars as pl
+
+# 検索時に無視する記号. NFKCで［］＜＞（）は半角に変換される
+_IGNORED_CHARS = re.compile(r"[\s\[\]<>()「」『』【】・,、。]+")
+# カタカナ (ァ-ヶ) をひらがなに変換する表
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord("ァ"), ord("ヶ") + 1)}
+
+def normalize_food_name(text: str) -> str:
+    """
+    検索用に食品名を正規化する
+
+    NFKCで全角英数字・記号を半角に揃え, 小文字化し, カタカナをひらがなに変換したうえで,
+    空白と括弧類を取り除く.
+    """
+    text = unicodedata.normalize("NFKC", text).lower().translate(_KATAKANA_TO_HIRAGANA)
+    return _IGNORED_CHARS.sub("", text)
+
+def _tokenize_query(query: str) -> list[str]:
+    tokens = [normalize_food_name(token) for token in unicodedata.normalize("NFKC", query).split()]
+    return [token for token in tokens if token]
+
+def _grams(text: str) -> set[str]:
+    """1文字なら文字そのもの, 2文字以上なら文字bigramの集合"""
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+@dataclass
+class SearchHit:
+    food_name: str
+    score: float
+
+class FoodSearchIndex:
+    """
+    食品名のn-gram転置インデックス
+
+    正規化した食品名の文字unigramとbigramから, それを含む食品の番号の配列を引けるようにしておく.
+    検索では各語のn-gramの一致数で候補を絞り込み, 部分一致した語は満点, それ以外は一致したn-gramの割合で採点する.
+    全語の平均点が高い順に, 同点なら完全一致, 前方一致, 名前の短い順に並べる.
+    """
+
+    def __init__(self, food_names: list[str], max_candidates: int = 200):
+        self.food_names = list(food_names)
+        self.normalized_names = [normalize_food_name(name) for name in self.food_names]
+        self.max_candidates = max_candidates
+
+        postings: dict[str, list[int]] = {}
+        for i, name in enumerate(self.normalized_names):
+            for gram in set(name) | _grams(name):
+                postings.setdefault(gram, []).append(i)
+        self._postings = {gram: np.asarray(ids, dtype=np.int64) for gram, ids in postings.items()}
+        self._exact = {}
+        for i, name in enumerate(self.normalized_names):
+            self._exact.setdefault(name, i)
+
+    @classmethod
+    def from_frame(cls, df_foods: pl.DataFrame, column: str = "food_name") -> "FoodSearchIndex":
+        return cls(df_foods[column].to_list())
+
+    def __len__(self) -> int:
+        return len(self.food_names)
+
+    def _token_scores(self, token: str) -> np.ndarray:
+        """各食品について, 語のn-gramのうち食品名に含まれるものの割合"""
+        grams = _grams(token)
+        counts = np.zeros(len(self.food_names), dtype=np.float64)
+        for gram in grams:
+            ids = self._postings.get(gram)
+            if ids is not None:
+                counts[ids] += 1.0
+        return counts / len(grams)
+
+    def search(self, query: str, k: int = 10, min_score: float = 0.5) -> list[SearchHit]:
+        """
+        食品名を検索し, 上位k件を返す
+
+        Args:
+            query (str): 検索語. 空白で区切ると複数の語として扱う
+            k (int): 返す件数の上限
+            min_score (float): この点数未満の候補は返さない (0〜1)
+
+        Returns:
+            list[SearchHit]: 点数の高い順の検索結果
+        """
+        tokens = _tokenize_query(query)
+        if not tokens or not self.food_names:
+            return []
+
+        whole = "".join(tokens)
+        token_scores = [self._token_scores(token) for token in tokens]
+        scores = np.mean(token_scores, axis=0)
+        candidates = np.flatnonzero(scores >= min_score)
+        if candidates.size > self.max_candidates:
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")[:self.max_candidates]]
+
+        ranked = []
+        for i in candidates.tolist():
+            name = self.normalized_names[i]
+            # n-gramが揃っていても並びが異なる場合があるため, 部分一致した語だけを満点にする
+            score = float(sum(
+                1.0 if token in name else min(token_score[i], 0.99) for token, token_score in zip(tokens, token_scores)
+            )) / len(tokens)
+            if score < min_score:
+                continue
+            ranked.append((-score, name != whole, not name.startswith(tokens[0]), len(name), i, score))
+        ranked.sort()
+        return [SearchHit(self.food_names[i], score) for *_, i, score in ranked[:k]]
+
+    def lookup(self, food_name: str) -> Optional[str]:
+        """正規化した食品名が完全一致する食品名を返す. 見つからなければNone"""
+        i = self._exact.get(normalize_food_name(food_name))
+        return None if i is None else self.food_names[i]
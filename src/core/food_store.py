@@ -0,0 +1,89 @@
+import json
+import os
+import polars as pl
+
+TEMPLATE_FOOD_NUTRIENT_DATA_PATH = "/app/resources/step2/template/food_nutrient_data.csv"
+CUSTOM_FOOD_NUTRIENT_DATA_DIR = "/app/resources/step2/custom/"
+FOOD_STORE_PATH = "/app/data/cache/food_store.arrow"
+
+# 文字列として扱う列. それ以外の列はすべてfloat64
+STRING_COLUMNS = ["food_name", "unit"]
+
+def _source_paths() -> list[str]:
+    paths = [TEMPLATE_FOOD_NUTRIENT_DATA_PATH]
+    if os.path.isdir(CUSTOM_FOOD_NUTRIENT_DATA_DIR):
+        paths += [
+            os.path.join(CUSTOM_FOOD_NUTRIENT_DATA_DIR, filename)
+            for filename in sorted(os.listdir(CUSTOM_FOOD_NUTRIENT_DATA_DIR))
+            if filename.endswith(".csv")
+        ]
+    return paths
+
+def _source_signature(paths: list[str]) -> list[list]:
+    """元のCSVファイルのパス, 更新時刻, サイズの一覧. これが変わったら再構築する"""
+    signature = []
+    for path in paths:
+        stat = os.stat(path)
+        signature.append([path, stat.st_mtime_ns, stat.st_size])
+    return signature
+
+def _manifest_path(store_path: str) -> str:
+    return f"{os.path.splitext(store_path)[0]}.json"
+
+def read_food_csv(path: str) -> pl.DataFrame:
+    """食品データのCSVを読み込み, 食品名とunitはstr, それ以外はfloat64に一度にキャストする"""
+    df = pl.read_csv(path, infer_schema=False)
+    return df.select(
+        pl.col(col_name) if col_name in STRING_COLUMNS else pl.col(col_name).cast(pl.Float64, strict=False)
+        for col_name in df.columns
+    )
+
+def build_food_store(store_path: str = FOOD_STORE_PATH) -> pl.DataFrame:
+    """
+    テンプレートとカスタムデータのCSVを結合し, 非圧縮のArrow IPCファイルとして保存する
+
+    食品名が重複する場合はカスタムデータを優先する.
+    """
+    paths = _source_paths()
+    signature = _source_signature(paths)
+    df_foods = read_food_csv(paths[0])
+    for custom_data_path in paths[1:]:
+        df_custom = read_food_csv(custom_data_path)
+        df_foods = df_foods.filter(~pl.col("food_name").is_in(df_custom["food_name"].implode()))
+        df_foods = pl.concat([df_foods, df_custom.select(df_foods.columns)])
+
+    # 書き込み途中のファイルを他のプロセスが読まないよう, 一時ファイルに書いてから置き換える
+    os.makedirs(os.path.dirname(store_path), exist_ok=True)
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    df_foods.write_ipc(tmp_path, compression="uncompressed")
+    os.replace(tmp_path, store_path)
+    tmp_manifest_path = f"{_manifest_path(store_path)}.{os.getpid()}.tmp"
+    with open(tmp_manifest_path, "w") as f:
+        json.dump({"sources": signature}, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_manifest_path, _manifest_path(store_path))
+    return df_foods
+
+def is_food_store_fresh(store_path: str = FOOD_STORE_PATH) -> bool:
+    """コンパイル済みの食品データが, 元のCSVファイルから作られた最新のものかどうか"""
+    if not os.path.exists(store_path) or not os.path.exists(_manifest_path(store_path)):
+        return False
+    try:
+        with open(_manifest_path(store_path), "r") as f:
+            manifest = json.load(f)
+        return manifest["sources"] == _source_signature(_source_paths())
+    except (OSError, ValueError, KeyError):
+        return False
+
+def load_food_store(store_path: str = FOOD_STORE_PATH) -> pl.DataFrame:
+    """
+    コンパイル済みの食品データを読み込む
+
+    元のCSVファイルが更新されている場合だけ再構築する.
+    ファイルはメモリマップで読み込むため, 複数のプロセスで同じページキャッシュを共有する.
+
+    Returns:
+        pl.DataFrame: テンプレートとカスタムデータを結合した食品データ
+    """
+    if not is_food_store_fresh(store_path):
+        build_food_store(store_path)
+    return pl.read_ipc(store_path, memory_map=True)
@@ -0,0 +1,265 @@
+import time
+from dataclasses import dataclass
+from typing import Optional
+import highspy
+import numpy as np
+import polars as pl
+import pulp
+from core.model_builder import DietModel, build_diet_model
+from core.persistent_model import has_feasible_solution, to_pulp_status
+from core.tracing import get_tracer
+
+@dataclass
+class PlanOptions:
+    """
+    複数日の献立計画の設定
+
+    n_days: 計画する日数
+    daily_tolerance: 1日ごとの栄養素の上下限の緩め幅 (0.2なら下限の80%〜上限の120%). 期間平均は元の上下限を満たす
+    max_days_per_food: 1つの食品を使ってよい日数の上限
+    min_foods_per_day: 1日に使う食品の種類数の下限
+    max_units_per_day: 食品ごとの1日の購入単位数の上限 (使用日の判定に使う). 食品データのmaxが優先される
+    integer_units: 期間全体で購入する量を amount 単位の整数にする
+    time_limit: 求解の制限時間 (秒)
+    mip_gap: 整数計画の相対ギャップの許容値
+    """
+    n_days: int = 7
+    daily_tolerance: float = 0.2
+    max_days_per_food: Optional[int] = None
+    min_foods_per_day: Optional[int] = None
+    max_units_per_day: float = 10.0
+    integer_units: bool = False
+    time_limit: Optional[float] = None
+    mip_gap: Optional[float] = None
+
+    @property
+    def uses_day_indicators(self) -> bool:
+        return self.max_days_per_food is not None or self.min_foods_per_day is not None
+
+@dataclass
+class MenuPlan:
+    status: int
+    objective: Optional[float] = None
+    df_plan: Optional[pl.DataFrame] = None
+    df_daily_totals: Optional[pl.DataFrame] = None
+    df_purchases: Optional[pl.DataFrame] = None
+    mip_gap: Optional[float] = None
+    n_rows: int = 0
+    n_cols: int = 0
+    n_nonzeros: int = 0
+    elapsed: float = 0.0
+    time_limit_reached: bool = False
+
+class _SparseBuilder:
+    """列・行・係数の三つ組を集めてから, まとめてCSC形式に変換する"""
+
+    def __init__(self):
+        self.rows: list[np.ndarray] = []
+        self.cols: list[np.ndarray] = []
+        self.values: list[np.ndarray] = []
+        self.row_lower: list[np.ndarray] = []
+        self.row_upper: list[np.ndarray] = []
+        self.n_rows = 0
+
+    def add_rows(self, lower: np.ndarray, upper: np.ndarray) -> int:
+        """行を追加し, 先頭の行番号を返す"""
+        first = self.n_rows
+        self.row_lower.append(np.asarray(lower, dtype=float))
+        self.row_upper.append(np.asarray(upper, dtype=float))
+        self.n_rows += len(self.row_lower[-1])
+        return first
+
+    def add_entries(self, rows: np.ndarray, cols: np.ndarray, values: np.ndarray):
+        rows, cols, values = np.broadcast_arrays(rows, cols, values)
+        self.rows.append(rows.ravel().astype(np.int64))
+        self.cols.append(cols.ravel().astype(np.int64))
+        self.values.append(values.ravel().astype(float))
+
+    def to_csc(self, n_cols: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        rows = np.concatenate(self.rows)
+        cols = np.concatenate(self.cols)
+        values = np.concatenate(self.values)
+        keep = values != 0
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+        order = np.lexsort((rows, cols))
+        start = np.zeros(n_cols + 1, dtype=np.int32)
+        np.cumsum(np.bincount(cols, minlength=n_cols), out=start[1:])
+        return start, rows[order].astype(np.int32), values[order]
+
+def _plan_model(model: DietModel, options: PlanOptions):
+    """
+    D日分の変数と制約を疎行列で組み立てる
+
+    列: x[d, f] (d日目の食品fの購入単位数), p[f] (期間全体の購入単位数, integer_units のとき),
+        y[d, f] (d日目に食品fを使うかどうか, 頻度・種類数の制約があるとき)
+    """
+    D, F, R = options.n_days, model.n_foods, model.n_rows
+    day_index = np.arange(D)[:, None]
+    food_index = np.arange(F)[None, :]
+    x = day_index * F + food_index  # (D, F)
+    n_cols = D * F
+    p = y = None
+    if options.integer_units:
+        p = n_cols + np.arange(F)
+        n_cols += F
+    if options.uses_day_indicators:
+        y = n_cols + x
+        n_cols += D * F
+
+    cost = np.zeros(n_cols)
+    col_lower = np.zeros(n_cols)
+    col_upper = np.full(n_cols, np.inf)
+    integrality = np.zeros(n_cols, dtype=np.int32)
+    food_cost = model.cost[:F]
+    if options.integer_units:
+        cost[p] = food_cost
+        integrality[p] = 1
+    else:
+        cost[x] = food_cost
+    food_upper = np.where(np.isfinite(model.col_upper[:F]), model.col_upper[:F], options.max_units_per_day)
+    col_upper[x] = model.col_upper[:F]
+    if y is not None:
+        col_upper[y] = 1.0
+        integrality[y] = 1
+    else:
+        col_lower[x] = model.col_lower[:F]
+
+    builder = _SparseBuilder()
+    start, index, value = model.to_csc()
+    entry_food = np.repeat(np.arange(F), np.diff(start)[:F])
+    entry_row = index[:start[F]]
+    entry_value = value[:start[F]]
+
+    # 1日ごとの栄養素: 上下限を daily_tolerance だけ緩める
+    lower = np.where(np.isfinite(model.row_lower), model.row_lower * (1 - options.daily_tolerance), -np.inf)
+    upper = np.where(np.isfinite(model.row_upper), model.row_upper * (1 + options.daily_tolerance), np.inf)
+    first = builder.add_rows(np.tile(lower, D), np.tile(upper, D))
+    builder.add_entries(first + day_index * R + entry_row[None, :], x[:, entry_food], entry_value[None, :])
+
+    # 期間全体の栄養素: 平均が元の上下限を満たす
+    first = builder.add_rows(model.row_lower * D, model.row_upper * D)
+    builder.add_entries(first + entry_row[None, :], x[:, entry_food], entry_value[None, :])
+
+    if p is not None:
+        # 期間全体で使う量 <= 購入する量
+        first = builder.add_rows(np.full(F, -np.inf), np.zeros(F))
+        builder.add_entries(first + food_index, x, 1.0)
+        builder.add_entries(first + np.arange(F), p, -1.0)
+
+    if y is not None:
+        # 使わない日は0, 使う日は食品データのmin以上・上限以下
+        first = builder.add_rows(np.full(D * F, -np.inf), np.zeros(D * F))
+        builder.add_entries(first + x, x, 1.0)
+        builder.add_entries(first + x, y, -np.broadcast_to(food_upper, (D, F)))
+        has_min = np.flatnonzero(model.col_lower[:F] > 0)
+        if len(has_min) > 0:
+            first = builder.add_rows(np.zeros(D * len(has_min)), np.full(D * len(has_min), np.inf))
+            rows = first + np.arange(D * len(has_min)).reshape(D, len(has_min))
+            builder.add_entries(rows, x[:, has_min], 1.0)
+            builder.add_entries(rows, y[:, has_min], -model.col_lower[has_min][None, :])
+        if options.max_days_per_food is not None:
+            first = builder.add_rows(np.full(F, -np.inf), np.full(F, float(options.max_days_per_food)))
+            builder.add_entries(first + food_index, y, 1.0)
+        if options.min_foods_per_day is not None:
+            first = builder.add_rows(np.full(D, float(options.min_foods_per_day)), np.full(D, np.inf))
+            builder.add_entries(first + day_index, y, 1.0)
+
+    return cost, col_lower, col_upper, integrality, builder, n_cols, x, p, y
+
+def plan_menu(df_foods: pl.DataFrame, df_constraints: pl.DataFrame, options: PlanOptions, constraints_to_ignore=None) -> MenuPlan:
+    """
+    複数日分の献立を1つの線形計画 (頻度・種類数の制約や整数単位がある場合は混合整数計画) として解く
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        df_constraints (pl.DataFrame): 1日あたりの栄養素制約のDataFrame
+        options (PlanOptions): 計画の設定
+        constraints_to_ignore (list, optional): 無視する制約名のリスト
+
+    Returns:
+        MenuPlan: 日ごとの献立, 日ごとの栄養素の合計, 期間全体の購入量
+    """
+    start_time = time.perf_counter()
+    model = build_diet_model(df_foods, df_constraints, constraints_to_ignore)
+    cost, col_lower, col_upper, integrality, builder, n_cols, x, p, y = _plan_model(model, options)
+    start, index, value = builder.to_csc(n_cols)
+
+    lp = highspy.HighsLp()
+    lp.num_col_ = n_cols
+    lp.num_row_ = builder.n_rows
+    lp.col_cost_ = cost
+    lp.col_lower_ = col_lower
+    lp.col_upper_ = col_upper
+    lp.row_lower_ = np.concatenate(builder.row_lower)
+    lp.row_upper_ = np.concatenate(builder.row_upper)
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = start
+    lp.a_matrix_.index_ = index
+    lp.a_matrix_.value_ = value
+    is_mip = bool(integrality.any())
+    if is_mip:
+        lp.integrality_ = [highspy.HighsVarType.kInteger if v else highspy.HighsVarType.kContinuous for v in integrality.tolist()]
+
+    highs = highspy.Highs()
+    highs.setOptionValue("output_flag", False)
+    if options.time_limit is not None:
+        highs.setOptionValue("time_limit", float(options.time_limit))
+    if options.mip_gap is not None:
+        highs.setOptionValue("mip_rel_gap", float(options.mip_gap))
+    highs.passModel(lp)
+
+    solve_start, solve_start_cpu = time.perf_counter(), time.process_time()
+    highs.run()
+    info = highs.getInfo()
+    model_status = highs.getModelStatus()
+    status = to_pulp_status(model_status)
+    plan = MenuPlan(status=status, n_rows=builder.n_rows, n_cols=n_cols, n_nonzeros=len(value))
+    plan.time_limit_reached = model_status == highspy.HighsModelStatus.kTimeLimit
+    if is_mip:
+        plan.mip_gap = info.mip_gap
+    get_tracer().record_solve(
+        "highs", plan, status, time.perf_counter() - solve_start, time.process_time() - solve_start_cpu,
+        iterations=info.simplex_iteration_count, n_days=options.n_days, is_mip=is_mip, mip_gap=plan.mip_gap
+    )
+
+    # 制限時間で打ち切られても, 実行可能解があればそれを返す
+    has_solution = has_feasible_solution(info)
+    if status != pulp.LpStatusOptimal and not (plan.time_limit_reached and has_solution):
+        plan.elapsed = time.perf_counter() - start_time
+        return plan
+
+    values = np.asarray(highs.getSolution().col_value, dtype=float)
+    plan.objective = float(cost @ values)
+    units = values[x]  # (D, F)
+    units[units < 1e-9] = 0.0
+    plan.df_plan, plan.df_daily_totals, plan.df_purchases = _plan_frames(df_foods, model, units, np.round(values[p]) if p is not None else None)
+    plan.elapsed = time.perf_counter() - start_time
+    return plan
+
+def _plan_frames(df_foods: pl.DataFrame, model: DietModel, units: np.ndarray, purchased: Optional[np.ndarray]):
+    D, F = units.shape
+    amount = df_foods["amount"].cast(pl.Float64, strict=False).fill_null(0.0).to_numpy()
+    day, food = np.nonzero(units)
+    df_plan = pl.DataFrame({
+        "day": day + 1,
+        "food_name": [model.col_names[j] for j in food.tolist()],
+        "units": units[day, food],
+        "amount": units[day, food] * amount[food],
+        "unit": df_foods["unit"][food.tolist()],
+        "cost": units[day, food] * model.cost[food],
+    })
+
+    totals = units @ model.matrix[:F]  # (D, R)
+    df_daily_totals = pl.DataFrame(
+        {"day": np.arange(1, D + 1), "cost": units @ model.cost[:F], **{name: totals[:, i] for i, name in enumerate(model.row_names)}}
+    )
+
+    used_units = units.sum(axis=0)
+    df_purchases = pl.DataFrame({
+        "food_name": model.col_names[:F],
+        "units_used": used_units,
+        "units_purchased": purchased if purchased is not None else used_units,
+        "days_used": (units > 0).sum(axis=0),
+        "cost": (purchased if purchased is not None else used_units) * model.cost[:F],
+    }).filter(pl.col("units_purchased") > 1e-9)
+    return df_plan, df_daily_totals, df_purchases
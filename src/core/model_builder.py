@@ -0,0 +1,385 @@
+import os
+import re
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass, field, replace
+from typing import Optional
+import numpy as np
+import polars as pl
+import pulp
+from core.options import SolverOptions
+from core.tracing import get_tracer
+
+@dataclass
+class DietModel:
+    """
+    行列形式で表した最適化問題
+
+        min  cost^T x
+        s.t. row_lower <= matrix^T x <= row_upper
+             col_lower <= x <= col_upper
+
+    列(変数)は食品の購入単位数, 行は栄養素の総摂取量に対応する.
+    matrixは (列数 × 行数) = (食品数 × 栄養素数) で, df_foodsの栄養素列をそのまま並べたものになる.
+    上下限が存在しない場合は ±np.inf で表す.
+    """
+    col_names: list[str]
+    cost: np.ndarray
+    col_lower: np.ndarray
+    col_upper: np.ndarray
+    row_names: list[str]
+    row_lower: np.ndarray
+    row_upper: np.ndarray
+    matrix: np.ndarray
+    n_foods: int = field(default=-1)
+
+    def __post_init__(self):
+        if self.n_foods < 0:
+            self.n_foods = len(self.col_names)
+
+    @property
+    def n_cols(self) -> int:
+        return len(self.col_names)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self.row_names)
+
+    @property
+    def n_nonzeros(self) -> int:
+        return int(np.count_nonzero(self.matrix))
+
+    def to_csc(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        制約行列 (行数 × 列数) を列方向圧縮形式 (CSC) で返す
+
+        Returns:
+            tuple: (start, index, value) 列jの非ゼロ要素は index[start[j]:start[j+1]] 行に value[start[j]:start[j+1]]
+        """
+        nonzero = self.matrix != 0
+        start = np.zeros(self.n_cols + 1, dtype=np.int32)
+        np.cumsum(nonzero.sum(axis=1), out=start[1:])
+        index = np.nonzero(nonzero)[1].astype(np.int32)
+        value = self.matrix[nonzero]
+        return start, index, value
+
+    def constraint_names(self) -> list[str]:
+        """有効な上下限から Min_/Max_ 形式の制約名を列挙する"""
+        names = []
+        for name, lower, upper in zip(self.row_names, self.row_lower, self.row_upper):
+            if np.isfinite(lower):
+                names.append(f"Min_{name}")
+            if np.isfinite(upper):
+                names.append(f"Max_{name}")
+        return names
+
+    def without_constraints(self, constraints_to_ignore) -> "DietModel":
+        """指定した Min_/Max_ 制約の上下限を外したコピーを返す"""
+        row_lower = self.row_lower.copy()
+        row_upper = self.row_upper.copy()
+        row_index = {name: i for i, name in enumerate(self.row_names)}
+        for constraint_name in constraints_to_ignore:
+            prefix, _, nutrient_id = constraint_name.partition("_")
+            if nutrient_id not in row_index:
+                continue
+            if prefix == "Min":
+                row_lower[row_index[nutrient_id]] = -np.inf
+            elif prefix == "Max":
+                row_upper[row_index[nutrient_id]] = np.inf
+        return replace(self, row_lower=row_lower, row_upper=row_upper)
+
+def missing_cost_error(food_names: list[str], max_names: int = 10) -> ValueError:
+    """値段が設定されていない食品を知らせる例外. 食品名は先頭の max_names 件だけ示す"""
+    shown = food_names[:max_names] + (["..."] if len(food_names) > max_names else [])
+    return ValueError(f"値段 (cost) が設定されていない食品が{len(food_names)}件あります。step2 で値段を設定してください: {shown}")
+
+def food_costs(df_foods: pl.DataFrame) -> np.ndarray:
+    """
+    食品ごとの値段の配列
+
+    値段が空欄 (または数値でない) の食品を0円として扱うと, 最適化がその食品を優先して選んでしまうため, 例外にする.
+
+    Raises:
+        ValueError: 値段が設定されていない食品がある場合
+    """
+    cost = df_foods["cost"].cast(pl.Float64, strict=False).fill_nan(None)
+    if cost.null_count() > 0:
+        raise missing_cost_error(df_foods.filter(cost.is_null())["food_name"].to_list())
+    return cost.to_numpy()
+
+def build_diet_model(df_foods: pl.DataFrame, df_constraints: pl.DataFrame, constraints_to_ignore=None) -> DietModel:
+    """
+    食品データと栄養素制約から行列形式の最適化問題を作成する
+
+    栄養素の係数はPolarsのDataFrameから一括でNumPy配列に変換するため, 食品数が多くてもPythonのループは発生しない.
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame
+        constraints_to_ignore (list, optional): 無視する制約名のリスト (例: ['Min_energy', 'Max_vitamin_a'])
+
+    Returns:
+        DietModel: 行列形式の最適化問題
+
+    Raises:
+        ValueError: 値段が設定されていない食品がある場合 (food_costs を参照)
+    """
+    # 食品データに存在し, 上下限のどちらかが設定されている栄養素のみを行にする
+    df_rows = df_constraints.filter(
+        pl.col("nutrient_id").is_in(df_foods.columns)
+        & (pl.col("lower").is_not_null() | pl.col("upper").is_not_null())
+    )
+    row_names = df_rows["nutrient_id"].to_list()
+    row_lower = df_rows["lower"].cast(pl.Float64).fill_null(-np.inf).to_numpy()
+    row_upper = df_rows["upper"].cast(pl.Float64).fill_null(np.inf).to_numpy()
+
+    # 食品ごとの最小・最大摂取量は購入単位数 (摂取量 / 単位あたりの量) の上下限になる
+    # 全て空欄の列は文字列として読み込まれるため, 先に数値へキャストする
+    amount, food_min, food_max = (pl.col(name).cast(pl.Float64, strict=False) for name in ("amount", "min", "max"))
+    has_amount = amount.is_not_null() & (amount > 0)
+    cost = food_costs(df_foods)
+    df_cols = df_foods.select(
+        pl.when(has_amount & food_min.is_not_null())
+        .then(food_min / amount)
+        .otherwise(0.0)
+        .alias("col_lower"),
+        pl.when(has_amount & food_max.is_not_null())
+        .then(food_max / amount)
+        .otherwise(np.inf)
+        .alias("col_upper"),
+    )
+
+    matrix = df_foods.select(pl.col(row_names).cast(pl.Float64, strict=False).fill_null(0.0)).to_numpy()
+    if matrix.shape != (df_foods.height, len(row_names)):
+        matrix = matrix.reshape(df_foods.height, len(row_names))
+
+    model = DietModel(
+        col_names=df_foods["food_name"].to_list(),
+        cost=cost,
+        col_lower=df_cols["col_lower"].to_numpy(),
+        col_upper=df_cols["col_upper"].to_numpy(),
+        row_names=row_names,
+        row_lower=row_lower,
+        row_upper=row_upper,
+        matrix=np.ascontiguousarray(matrix),
+    )
+    if constraints_to_ignore:
+        model = model.without_constraints(constraints_to_ignore)
+    return model
+
+def add_elastic_slacks(model: DietModel, penalty_weights=None) -> tuple[DietModel, list[str], np.ndarray]:
+    """
+    全ての Min_/Max_ 制約に非負のスラック列を追加し, 違反量の重み付き和を目的関数とした弾性問題を作成する
+
+    スラックの費用は 重み / |制約値| とし, 単位の異なる栄養素どうしを相対違反量で比較できるようにする.
+
+    Args:
+        model (DietModel): 元の最適化問題
+        penalty_weights (dict, optional): 制約違反に対する重み. キーは栄養素ID または制約名. 指定がなければ1.0
+
+    Returns:
+        tuple: (弾性問題, 各スラック列に対応する制約名, 各スラック列の制約値スケール)
+    """
+    if penalty_weights is None:
+        penalty_weights = {}
+
+    # 下限と上限が矛盾していても扱えるよう, Min_/Max_ を別々の行に分ける
+    slack_names, slack_rows, slack_signs, slack_scales, slack_costs = [], [], [], [], []
+    for i, nutrient_id in enumerate(model.row_names):
+        for prefix, bound, sign in (("Min", model.row_lower[i], 1.0), ("Max", model.row_upper[i], -1.0)):
+            if not np.isfinite(bound):
+                continue
+            constraint_name = f"{prefix}_{nutrient_id}"
+            weight = penalty_weights.get(constraint_name, penalty_weights.get(nutrient_id, 1.0))
+            scale = abs(bound) if bound != 0 else 1.0
+            slack_names.append(constraint_name)
+            slack_rows.append(i)
+            slack_signs.append(sign)
+            slack_scales.append(scale)
+            slack_costs.append(weight / scale)
+
+    n_slacks = len(slack_names)
+    signs = np.array(slack_signs, dtype=float)
+    bounds = np.where(signs > 0, model.row_lower[slack_rows], model.row_upper[slack_rows])
+    elastic = DietModel(
+        col_names=model.col_names + [f"slack_{name}" for name in slack_names],
+        cost=np.concatenate([np.zeros(model.n_cols), np.array(slack_costs, dtype=float)]),
+        col_lower=np.concatenate([model.col_lower, np.zeros(n_slacks)]),
+        col_upper=np.concatenate([model.col_upper, np.full(n_slacks, np.inf)]),
+        row_names=slack_names,
+        row_lower=np.where(signs > 0, bounds, -np.inf),
+        row_upper=np.where(signs > 0, np.inf, bounds),
+        matrix=np.vstack([model.matrix[:, slack_rows], np.diag(signs)]),
+        n_foods=model.n_foods,
+    )
+    return elastic, slack_names, np.array(slack_scales, dtype=float)
+
+def contradictory_bounds(model: DietModel) -> tuple[np.ndarray, np.ndarray]:
+    """下限が上限を超える行と列の番号. このような問題は解くまでもなく実行不可能"""
+    return np.flatnonzero(model.row_lower > model.row_upper), np.flatnonzero(model.col_lower > model.col_upper)
+
+def write_mps(model: DietModel, path: str):
+    """
+    最適化問題をMPS形式で書き出す
+
+    列名・行名は C{j}, R{i} の連番とし, 日本語や空白を含む食品名をそのまま使わない.
+    上下限の両方がある行はRANGESで表すため, 1つの栄養素につき1行になる.
+
+    Raises:
+        ValueError: 下限が上限を超える行・列がある場合.
+            RANGESは幅の絶対値しか表せず, そのまま書き出すと実行可能な範囲として読まれてしまうため書き出さない
+    """
+    contradictory_rows, contradictory_cols = contradictory_bounds(model)
+    if len(contradictory_rows) > 0 or len(contradictory_cols) > 0:
+        raise ValueError(
+            "下限が上限を超えているためMPSに書き出せません: "
+            f"行 {[model.row_names[i] for i in contradictory_rows.tolist()]}, 列 {[model.col_names[j] for j in contradictory_cols.tolist()]}"
+        )
+
+    finite_lower = np.isfinite(model.row_lower)
+    finite_upper = np.isfinite(model.row_upper)
+    active_rows = finite_lower | finite_upper
+
+    lines = ["NAME Diet_Optimization", "ROWS", " N COST"]
+    row_types = np.where(
+        finite_lower & finite_upper & (model.row_lower == model.row_upper), "E",
+        np.where(finite_lower, "G", "L")
+    )
+    lines.extend(f" {row_types[i]} R{i}" for i in np.flatnonzero(active_rows).tolist())
+
+    lines.append("COLUMNS")
+    # 全ての列が宣言されるよう, 目的関数の係数は0でも書き出す
+    start, index, value = model.to_csc()
+    keep = active_rows[index]
+    entry_cols = np.concatenate([np.arange(model.n_cols), np.repeat(np.arange(model.n_cols), np.diff(start))[keep]])
+    entry_rows = np.concatenate([np.full(model.n_cols, -1), index[keep]])
+    entry_values = np.concatenate([model.cost, value[keep]])
+    order = np.lexsort((entry_rows, entry_cols))
+    lines.extend(
+        f"    C{j} COST {v!r}" if i < 0 else f"    C{j} R{i} {v!r}"
+        for j, i, v in zip(entry_cols[order].tolist(), entry_rows[order].tolist(), entry_values[order].tolist())
+    )
+
+    lines.append("RHS")
+    rhs = np.where(finite_lower, model.row_lower, model.row_upper).tolist()
+    lines.extend(f"    RHS R{i} {rhs[i]!r}" for i in np.flatnonzero(active_rows).tolist() if rhs[i] != 0)
+
+    ranged_rows = np.flatnonzero(finite_lower & finite_upper & (model.row_lower != model.row_upper))
+    if len(ranged_rows) > 0:
+        ranges = (model.row_upper[ranged_rows] - model.row_lower[ranged_rows]).tolist()
+        lines.append("RANGES")
+        lines.extend(f"    RNG R{i} {r!r}" for i, r in zip(ranged_rows.tolist(), ranges))
+
+    lines.append("BOUNDS")
+    for j, (lower, upper) in enumerate(zip(model.col_lower.tolist(), model.col_upper.tolist())):
+        if lower == upper:
+            lines.append(f" FX BND C{j} {lower!r}")
+            continue
+        if lower != 0:
+            lines.append(f" LO BND C{j} {lower!r}")
+        if upper != np.inf:
+            lines.append(f" UP BND C{j} {upper!r}")
+    lines.append("ENDATA")
+
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+        f.write("\n")
+
+_CBC_STATUS = {
+    "Optimal": pulp.LpStatusOptimal,
+    "Infeasible": pulp.LpStatusInfeasible,
+    "Integer": pulp.LpStatusInfeasible,
+    "Unbounded": pulp.LpStatusUnbounded,
+    "Stopped": pulp.LpStatusNotSolved,
+}
+
+def _cpu_time_with_children() -> float:
+    # CBCはサブプロセスで動くため, 子プロセスのCPU時間も合計する
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+def solve_with_cbc(model: DietModel, msg: bool = False, options: Optional[SolverOptions] = None) -> tuple[int, Optional[np.ndarray]]:
+    """
+    MPSファイルを直接書き出してCBCで解く
+
+    Args:
+        model (DietModel): 最適化問題
+        msg (bool): CBCの出力を表示する
+        options (SolverOptions, optional): スレッド数, 制限時間, 相対ギャップ
+
+    Returns:
+        tuple: (pulp.LpStatus, 各列の値 or None)
+    """
+    # 上下限が矛盾する問題はMPSに書き出せないため, CBCを起動せずに実行不可能として返す
+    contradictory_rows, contradictory_cols = contradictory_bounds(model)
+    if len(contradictory_rows) > 0 or len(contradictory_cols) > 0:
+        return pulp.LpStatusInfeasible, None
+
+    tracer = get_tracer()
+    cbc_path = pulp.PULP_CBC_CMD().path
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        mps_path = os.path.join(tmp_dir, "model.mps")
+        sol_path = os.path.join(tmp_dir, "model.sol")
+        start_wall, start_cpu = time.perf_counter(), _cpu_time_with_children()
+        write_mps(model, mps_path)
+        write_time = time.perf_counter() - start_wall
+        args = [cbc_path, mps_path]
+        if options is not None:
+            msg = msg or options.msg
+            if options.threads is not None:
+                args += ["-threads", str(options.threads)]
+            if options.time_limit is not None:
+                args += ["-sec", str(options.time_limit)]
+            if options.mip_gap is not None:
+                args += ["-ratioGap", str(options.mip_gap)]
+        args += ["-initialSolve", "-printingOptions", "all", "-solution", sol_path]
+        # 記録する場合は反復回数を読み取るために出力を受け取る
+        pipe = subprocess.PIPE if tracer.enabled and not msg else (None if msg else subprocess.DEVNULL)
+        completed = subprocess.run(args, stdout=pipe, stderr=pipe, stdin=subprocess.DEVNULL, text=True)
+        if completed.returncode != 0 or not os.path.exists(sol_path):
+            raise pulp.PulpSolverError(f"CBCの実行に失敗しました: {cbc_path}")
+
+        with open(sol_path) as f:
+            status_line = f.readline().split()
+            values = np.zeros(model.n_cols)
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                if fields[0] == "**":
+                    fields = fields[1:]
+                name = fields[1]
+                if name.startswith("C"):
+                    values[int(name[1:])] = float(fields[2])
+
+    status = _CBC_STATUS.get(status_line[0], pulp.LpStatusUndefined) if status_line else pulp.LpStatusUndefined
+    if tracer.enabled:
+        iterations = re.findall(r"(\d+) iterations", completed.stdout or "")
+        tracer.record_solve(
+            "cbc", model, status, time.perf_counter() - start_wall, _cpu_time_with_children() - start_cpu,
+            iterations=int(iterations[-1]) if iterations else None, write_mps=write_time
+        )
+    if status != pulp.LpStatusOptimal:
+        return status, None
+    return status, values
+
+@dataclass
+class DietSolution:
+    """行列形式の最適化問題の解"""
+    model: DietModel
+    status: int
+    values: Optional[np.ndarray] = None
+
+    @property
+    def food_units(self) -> Optional[np.ndarray]:
+        """食品ごとの購入単位数 (スラック等の補助列を除く)"""
+        if self.values is None:
+            return None
+        return self.values[:self.model.n_foods]
+
+    @property
+    def objective(self) -> Optional[float]:
+        if self.values is None:
+            return None
+        return float(self.model.cost @ self.values)
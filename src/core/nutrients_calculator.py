@@ -3,6 +3,7 @@ from typing import Literal, Optional
 from dataclasses import dataclass
 import polars as pl
 import json
+from core.reference_data import ReferenceData, get_reference_data
 
 @dataclass
 class UserProfile:
@@ -37,64 +38,49 @@ class NutrientsCalculator:
         elif self.sex_code == "F":
             self.sex_id = 1
 
+    @classmethod
+    def reference_data(cls) -> ReferenceData:
+        """プロセス内で共有している参照テーブルを取得する"""
+        return get_reference_data(cls.AGE_BANDS_PATH, cls.REF_TYPES_PATH, cls.NUTRIENT_IDS_PATH, cls.VALUES_DIR, cls.LIST_FILE_NAME)
+
+    @cached_property
+    def _reference_data(self) -> ReferenceData:
+        return self.reference_data()
+
     @cached_property
     def age_band_id(self) -> Optional[int]:
         """ユーザーの年齢からage_band_idを取得する"""
-        df_age_bands = pl.read_csv(self.AGE_BANDS_PATH)
-        band = df_age_bands.filter((pl.col("min_age") <= self.age) & (self.age < pl.col("max_age")))
-        if not band.is_empty():
-            return band.select(pl.col("age_band_id")).to_series()[0]
+        age_band_id = self._reference_data.find_age_band_id(self.age)
+        if age_band_id is not None:
+            return age_band_id
         raise ValueError("対応する年齢バンドが見つかりません。")
 
     @cached_property
     def nutrient_ids(self) -> list[str]:
-        df_nutrient_ids = pl.read_csv(self.NUTRIENT_IDS_PATH)
-        return df_nutrient_ids["nutrient_id"].to_list()
+        return self._reference_data.nutrient_ids
 
     @cached_property
     def dict_nutrient_unit(self) -> dict[str, str]:
-        df_nutrient_ids = pl.read_csv(self.NUTRIENT_IDS_PATH)
-        dict_nutrient_unit = {nutrient_id: df_nutrient_ids.filter(pl.col("nutrient_id") == nutrient_id)["unit"].to_list()[0] for nutrient_id in self.nutrient_ids}
-        return dict_nutrient_unit
+        return dict(self._reference_data.nutrient_units)
 
     @cached_property
     def ref_codes(self) -> list[str]:
-        df_ref_types = pl.read_csv(self.REF_TYPES_PATH)
-        return df_ref_types.select(pl.col("ref_code")).to_series().to_list()
+        return self._reference_data.ref_codes
 
     @cached_property
     def df_values(self) -> pl.DataFrame:
         """
         UserProfileに基づいて必要なデータのみを抽出する
         """
-        
-        list_of_dfs = []
-        for file_name in self.LIST_FILE_NAME:
-            file_path = f"{self.VALUES_DIR}{file_name}.csv"
-            try:
-                # schema_overrides で 'factor' 列を浮動小数点型として指定
-                df_tmp = pl.read_csv(
-                    file_path, 
-                    schema_overrides={'value': pl.Float64},
-                )
-                # コメント行を削除
-                df_tmp = df_tmp.filter(~pl.col("nutrient_id").str.starts_with("#"))
-                # sex_codeによってフィルタリング
-                df_tmp = df_tmp.filter(pl.col("sex_code") == self.sex_code).drop("sex_code")
-                # age_band_idによってフィルタリング
-                df_tmp = df_tmp.filter(pl.col("age_band_id") == self.age_band_id).drop("age_band_id")
-                # life_codeによってフィルタリング
-                df_tmp = df_tmp.filter(pl.col("life_code").is_in([self.life_code, "general"]))
-                list_of_dfs.append(df_tmp)
-            except Exception as e:
-                print(f"Error reading {file_path}: {e}")
-                # 必要に応じてエラー処理を追加
-                
-        # DataFrameのリストを一度に連結する
-        if not list_of_dfs:
-            return pl.DataFrame() # 空のDataFrameを返すか、エラーを発生させる
-            
-        df_values = pl.concat(list_of_dfs, how="vertical")
+        df_values = self._reference_data.df_values
+        if df_values.is_empty():
+            return df_values
+        # sex_codeによってフィルタリング
+        df_values = df_values.filter(pl.col("sex_code") == self.sex_code).drop("sex_code")
+        # age_band_idによってフィルタリング
+        df_values = df_values.filter(pl.col("age_band_id") == self.age_band_id).drop("age_band_id")
+        # life_codeによってフィルタリング
+        df_values = df_values.filter(pl.col("life_code").is_in([self.life_code, "general"]))
         return df_values
 
     def _bmr_harris_benedict(self) -> float:
@@ -185,12 +171,13 @@ class NutrientsCalculator:
         elif nutrient_id == "carbohydrate":
             return self.get_carbohydrate(ref_code)
 
-        value = self.df_values.filter((pl.col("nutrient_id") == nutrient_id) & (pl.col("ref_code") == ref_code) & (pl.col("life_code") == self.life_code))["value"]
-        if value.is_empty():
-            value = self.df_values.filter((pl.col("nutrient_id") == nutrient_id) & (pl.col("ref_code") == ref_code) & (pl.col("life_code") == "general"))["value"]
-            if value.is_empty():
-                return None
-        return value[0]
+        # ライフステージ固有の値が無ければgeneralの値を使う
+        values = self._reference_data.values
+        for life_code in (self.life_code, "general"):
+            key = (self.sex_code, self.age_band_id, life_code, nutrient_id, ref_code)
+            if key in values:
+                return values[key]
+        return None
 
     def get_nutrient_value_by_settings(self, nutrient_id: str):
         for lower_method in self.lower_ref_codes:
@@ -208,6 +195,144 @@ class NutrientsCalculator:
         all_nutrient_ids = self.nutrient_ids
         return {nutrient_id: self.get_nutrient_value_by_settings(nutrient_id) for nutrient_id in all_nutrient_ids}
 
+    @classmethod
+    def _eer_expr(cls) -> pl.Expr:
+        """eerと同じ推定エネルギー必要量を列の式として返す"""
+        is_male = pl.col("sex_code") == "M"
+        if cls.EER_METHOD == "harris_benedict":
+            C = pl.when(is_male).then(66.4730).otherwise(655.0955)
+            C_W = pl.when(is_male).then(13.7516).otherwise(9.5634)
+            C_H = pl.when(is_male).then(5.0033).otherwise(1.8496)
+            C_A = pl.when(is_male).then(6.7550).otherwise(4.6756)
+            bmr = C + C_W * pl.col("weight") + C_H * pl.col("height") - C_A * pl.col("age")
+        else:  # デフォルトはganpule
+            C = pl.when(is_male).then(0.4235).otherwise(0.9708)
+            bmr = (0.0481 * pl.col("weight") + 0.0234 * pl.col("height") - 0.0138 * pl.col("age") - C) * 1000 / 4.186
+        return bmr * pl.col("activity_level")
+
+    @classmethod
+    def calculate_cohort_constraints(cls, df_profiles: pl.DataFrame, lower_ref_codes: list[str] = ["RDA", "AI", "DG_LOWER", "EAR"], upper_ref_codes: list[str] = ["UL", "DG_UPPER"]) -> pl.DataFrame:
+        """
+        複数のユーザープロファイルの栄養素制約を, 結合とベクトル演算でまとめて計算する
+
+        1人ずつNutrientsCalculatorを作成してdict_nutrient_valueを求めた場合と同じ値になる.
+
+        Args:
+            df_profiles (pl.DataFrame): sex_code, weight, height, age, activity_level, life_code の列を持つDataFrame.
+                life_code列が無い場合は "general", profile_id列が無い場合は行番号を使う
+            lower_ref_codes (list[str]): 下限として採用する基準の優先順
+            upper_ref_codes (list[str]): 上限として採用する基準の優先順
+
+        Returns:
+            pl.DataFrame: profile_id, nutrient_id, lower, upper, unit の縦持ちの制約テーブル
+        """
+        if "profile_id" not in df_profiles.columns:
+            df_profiles = df_profiles.with_row_index("profile_id")
+        if "life_code" not in df_profiles.columns:
+            df_profiles = df_profiles.with_columns(pl.lit("general").alias("life_code"))
+        df_profiles = df_profiles.select(
+            "profile_id", "sex_code", "life_code",
+            pl.col("weight", "height", "age", "activity_level").cast(pl.Float64)
+        ).with_row_index("profile_order")
+        n_profiles = df_profiles.height
+
+        # 年齢バンドは14行しかないため, 全員分と直積を取ってから範囲で絞り込む
+        reference_data = cls.reference_data()
+        df_age_bands = reference_data.df_age_bands.select("age_band_id", "min_age", "max_age")
+        df_profiles = df_profiles.join(df_age_bands, how="cross").filter(
+            (pl.col("min_age") <= pl.col("age")) & (pl.col("age") < pl.col("max_age"))
+        ).drop("min_age", "max_age").unique(subset="profile_order", keep="first").sort("profile_order")
+        if df_profiles.height != n_profiles:
+            raise ValueError("対応する年齢バンドが見つかりません。")
+        df_profiles = df_profiles.with_columns(cls._eer_expr().alias("eer"))
+
+        # 計算式で求める栄養素 (get_protein 等と同じ係数). 基準ごとの値を返す関数から, 優先順で最初の値を採用する
+        def protein(ref_code):
+            if ref_code in lower_ref_codes:
+                if ref_code == "RDA":
+                    return pl.col("weight") * 0.73 * 1.25
+                elif ref_code == "EAR":
+                    return pl.col("weight") * 0.73
+            return None
+
+        formulas = {
+            "energy": lambda ref_code: pl.col("eer") if ref_code in lower_ref_codes else None,
+            "protein": protein,
+            "saturated_fatty_acids": lambda ref_code: pl.col("eer") * 0.07 / 9 if ref_code in upper_ref_codes else None,
+            "n6_fatty_acids": lambda ref_code: pl.col("eer") * 0.04 / 9 if ref_code in lower_ref_codes else None,
+            "n3_fatty_acids": lambda ref_code: pl.col("eer") * 0.006 / 9 if ref_code in lower_ref_codes else None,
+            "carbohydrate": lambda ref_code: None,
+        }
+
+        def first_formula(value_by_ref_code, ref_codes):
+            for ref_code in ref_codes:
+                expr = value_by_ref_code(ref_code)
+                if expr is not None:
+                    return expr.cast(pl.Float64)
+            return pl.lit(None, dtype=pl.Float64)
+
+        df_formula_values = pl.concat([
+            df_profiles.select(
+                "profile_id",
+                pl.lit(nutrient_id).alias("nutrient_id"),
+                first_formula(value_by_ref_code, lower_ref_codes).alias("lower"),
+                first_formula(value_by_ref_code, upper_ref_codes).alias("upper"),
+            )
+            for nutrient_id, value_by_ref_code in formulas.items()
+        ])
+
+        # 基準値ファイルの栄養素は (sex_code, age_band_id, life_code) の組ごとに一度だけ求める.
+        # ライフステージ固有の値があればそれを, 無ければgeneralの値を使う
+        df_keys = df_profiles.select("sex_code", "age_band_id", "life_code").unique()
+        df_table_values = df_keys.join(
+            reference_data.df_values
+            .with_row_index("value_order")
+            .filter(~pl.col("nutrient_id").is_in(list(formulas)))
+            .rename({"life_code": "value_life_code"}),
+            on=["sex_code", "age_band_id"],
+            how="inner",
+        ).filter(
+            (pl.col("value_life_code") == pl.col("life_code")) | (pl.col("value_life_code") == "general")
+        ).sort(
+            pl.col("value_life_code") == "general", pl.col("value_order")
+        ).unique(
+            subset=["sex_code", "age_band_id", "life_code", "nutrient_id", "ref_code"], keep="first", maintain_order=True
+        ).filter(pl.col("value").is_not_null())
+
+        def pick_by_priority(ref_codes: list[str], alias: str) -> pl.DataFrame:
+            df_priority = pl.DataFrame({"ref_code": ref_codes, "priority": list(range(len(ref_codes)))})
+            return df_table_values.join(df_priority, on="ref_code", how="inner").sort("priority", maintain_order=True).unique(
+                subset=["sex_code", "age_band_id", "life_code", "nutrient_id"], keep="first"
+            ).select("sex_code", "age_band_id", "life_code", "nutrient_id", pl.col("value").alias(alias))
+
+        df_nutrient_ids = reference_data.df_nutrient_ids.select("nutrient_id", "unit").with_row_index("nutrient_order")
+        key_columns = ["sex_code", "age_band_id", "life_code", "nutrient_id"]
+        df_table_bounds = df_keys.join(df_nutrient_ids.select("nutrient_id"), how="cross").filter(
+            ~pl.col("nutrient_id").is_in(list(formulas))
+        ).join(
+            pick_by_priority(lower_ref_codes, "lower"), on=key_columns, how="left"
+        ).join(
+            pick_by_priority(upper_ref_codes, "upper"), on=key_columns, how="left"
+        )
+        df_table_values = df_profiles.select("profile_id", "sex_code", "age_band_id", "life_code").join(
+            df_table_bounds, on=["sex_code", "age_band_id", "life_code"], how="inner"
+        ).select("profile_id", "nutrient_id", "lower", "upper")
+
+        return (
+            pl.concat([df_formula_values, df_table_values])
+            .join(df_profiles.select("profile_id", "profile_order"), on="profile_id", how="left")
+            .join(df_nutrient_ids, on="nutrient_id", how="inner")
+            .sort("profile_order", "nutrient_order")
+            .select("profile_id", "nutrient_id", "lower", "upper", "unit")
+        )
+
+    def constraints_frame(self) -> pl.DataFrame:
+        """step1 で出力するものと同じ形式 (nutrient_id, lower, upper, unit) の制約条件"""
+        return pl.DataFrame([
+            {"nutrient_id": nutrient_id, "lower": lower, "upper": upper, "unit": self.dict_nutrient_unit.get(nutrient_id, "")}
+            for nutrient_id, (lower, upper) in self.dict_nutrient_value.items()
+        ], schema={"nutrient_id": pl.Utf8, "lower": pl.Float64, "upper": pl.Float64, "unit": pl.Utf8})
+
     def save_nutrient_values_to_csv(self, output_path: str, dict_nutrient_value: dict[str, tuple[Optional[float], Optional[float]]] = None, dict_nutrient_unit: dict[str, str] = None):
         if dict_nutrient_value is None:
             dict_nutrient_value = self.dict_nutrient_value
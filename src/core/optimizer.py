@@ -1,70 +1,401 @@
+import io
+import numpy as np
 import pulp
 from itertools import combinations
+from dataclasses import asdict, dataclass, field
+from typing import Optional
 import polars as pl
 import os
+import time
+from core.column_generation import ColumnGenerationModel
+from core.model_builder import DietModel, DietSolution, add_elastic_slacks, build_diet_model, solve_with_cbc
+from core.options import SearchBudget, SolverOptions, add_solver_arguments, solver_options_from_args
+from core.persistent_model import PersistentDietModel
+from core.presolve import PresolveReport, presolve_problem
+from core.relaxation_search import STOP_COMPLETE, search_relaxation
+from core.results_writer import RESULT_FORMATS, build_results_frame, write_results
+from core.scaling import ModelScaling, compute_scaling
+from core.solution_cache import CachedSolution, SolutionCache, solution_key
+from core.tracing import trace_stage
 
-def find_optimal_solution_iteratively(df_foods, df_constraints, base_output_path):
+@dataclass
+class RelaxationReport:
+    """制約緩和の結果と、そこに至るまでの計算コストの記録"""
+    relaxed_constraints: list[str] = field(default_factory=list)
+    n_solves: int = 0
+    elapsed: float = 0.0
+    output_path: Optional[str] = None
+    cache_hit: bool = False
+    presolve: Optional[PresolveReport] = None
+    # method="anytime" で探索を打ち切った理由 ("complete", "time_limit", "max_solves", "cancelled")
+    stop_reason: Optional[str] = None
+    # 求解器の制限時間 (--time_limit) で打ち切られた求解の回数
+    n_not_solved: int = 0
+
+def solve_model(model: DietModel, solver_options: Optional[SolverOptions] = None) -> DietSolution:
+    """
+    選択された求解器で最適化問題を1回解く
+
+    Args:
+        model (DietModel): 最適化問題
+        solver_options (SolverOptions, optional): 求解器の選択と設定. 指定がなければHiGHS
+
+    Returns:
+        DietSolution: 最適化問題の解
+    """
+    solver_options = solver_options or SolverOptions()
+    if solver_options.backend == "cbc":
+        scaling = compute_scaling(model) if solver_options.scaling else ModelScaling.identity(model)
+        status, values = solve_with_cbc(scaling.scale_model(model), options=solver_options)
+        return DietSolution(model, status, scaling.unscale_values(values))
+    return PersistentDietModel(model, solver_options).solve()
+
+def _presolve(df_foods, df_constraints):
+    with trace_stage("presolve") as stage:
+        df_foods, df_constraints, presolve_report = presolve_problem(df_foods, df_constraints)
+        stage.update(n_foods_before=presolve_report.n_foods_before, n_foods_after=presolve_report.n_foods_after,
+                     n_nutrients_before=presolve_report.n_nutrients_before, n_nutrients_after=presolve_report.n_nutrients_after)
+    return df_foods, df_constraints, presolve_report
+
+def find_optimal_solution_iteratively(df_foods, df_constraints, base_output_path, method="elastic", penalty_weights=None, solver_options=None, presolve=False, result_formats=("csv",), search_budget=None, progress_callback=None, cancel_event=None):
     """
-    最適化問題を解き、失敗した場合は制約を1つずつ緩和して再試行するラッパー関数
+    最適化問題を解き、失敗した場合は制約を緩和して再試行するラッパー関数
 
     Args:
         df_foods (pl.DataFrame): 食品データのDataFrame
         df_constraints (pl.DataFrame): 栄養素制約のDataFrame
-        base_output_path (str): 成功した場合の基本的な出力ファイルパス
+        base_output_path (str or None): 成功した場合の基本的な出力ファイルパス. Noneの場合は結果を書き出さない
+        method (str): 緩和方法. "elastic" は弾性LPで緩和する制約を求める. "exhaustive" は制約の組み合わせを総当たりする.
+            "anytime" は search_budget の範囲で緩和を探し, 上限に達した時点で最も少ない緩和を使う (search_relaxation を参照)
+        penalty_weights (dict, optional): 制約違反に対する重み. キーは栄養素ID (例: 'folate') または制約名 (例: 'Max_folate')
+        solver_options (SolverOptions, optional): 求解器の選択と設定. 指定がなければHiGHS
+        presolve (bool): 最適解に影響しない食品と栄養素を, モデルを作成する前に取り除く
+        result_formats (tuple): 結果の出力形式 ("csv", "parquet", "json"). CSVは常に出力する
+        search_budget (SearchBudget, optional): "anytime" の制限時間と求解回数の上限
+        progress_callback (callable, optional): "anytime" で各求解のあとに SearchProgress を受け取る関数
+        cancel_event (threading.Event, optional): "anytime" でセットされると探索をやめ, それまでの最良の緩和を使う
 
     Returns:
-        tuple: (pulp.LpProblem, pulp.LpStatus) or (None, pulp.LpStatus)
+        tuple: (DietSolution, pulp.LpStatus, RelaxationReport) or (None, pulp.LpStatus, RelaxationReport)
     """
+    if method == "anytime":
+        return _find_within_budget(df_foods, df_constraints, base_output_path, penalty_weights, solver_options, presolve, result_formats, search_budget, progress_callback, cancel_event)
+    report = RelaxationReport()
+    start_time = time.perf_counter()
+
+    # 結果の出力には取り除く前のデータを使う
+    df_model_foods, df_model_constraints = df_foods, df_constraints
+    if presolve:
+        df_model_foods, df_model_constraints, report.presolve = _presolve(df_foods, df_constraints)
+        print(f"--- 前処理: {report.presolve.summary()} ---")
+
+    # 変数と制約は一度だけ作成し, 以降の試行では制約の上下限だけを切り替えて再求解する
+    with trace_stage("build_model") as stage:
+        persistent_model = PersistentDietModel.from_frames(df_model_foods, df_model_constraints, solver_options)
+        stage.update(rows=persistent_model.model.n_rows, cols=persistent_model.model.n_cols, solver=persistent_model.options.backend, scaling=persistent_model.options.scaling)
+
     # --- Step 1: まずは全ての制約を使って試行 ---
     print("--- Step 1: 全ての制約を適用して最適化を試みます ---")
-    prob, status = solve_optimization_problem(df_foods, df_constraints)
+    with trace_stage("initial_solve"):
+        solution = persistent_model.solve()
+    status = solution.status
 
-    # 修正点: pulp.LpStatus['Optimal'] -> pulp.LpStatusOptimal
     if status == pulp.LpStatusOptimal:
         print(">>> 成功: 全ての制約を満たす最適解が見つかりました。")
-        save_results_to_csv(prob.variables(), df_foods, base_output_path, df_constraints)
-        return prob, status
+        report.n_solves = persistent_model.n_solves
+        report.elapsed = time.perf_counter() - start_time
+        if base_output_path is not None:
+            report.output_path = base_output_path
+            save_results(df_foods, _food_units(solution, df_foods, report.presolve), base_output_path, df_constraints, result_formats)
+        return solution, status, report
 
     print(">>> 失敗: 最適解が見つかりませんでした。制約の緩和を開始します。")
 
-    # --- Step 2: 緩和する制約のリストを作成 ---
-    all_possible_constraints = []
-    for row in df_constraints.iter_rows(named=True):
-        nutrient_id = row['nutrient_id']
-        if row['lower'] is not None:
-            all_possible_constraints.append(f"Min_{nutrient_id}")
-        if row['upper'] is not None:
-            all_possible_constraints.append(f"Max_{nutrient_id}")
+    with trace_stage("relaxation", method=method) as stage:
+        if method == "elastic":
+            solution, constraints_to_ignore = _relax_by_elastic_problem(persistent_model, penalty_weights, report)
+        elif method == "exhaustive":
+            solution, constraints_to_ignore = _relax_by_combinations(persistent_model)
+        else:
+            raise ValueError(f"未対応の緩和方法です: {method}")
+        stage.update(relaxed_constraints=constraints_to_ignore, n_solves=persistent_model.n_solves)
+    report.n_solves += persistent_model.n_solves
+    report.n_not_solved += persistent_model.n_not_solved
+    report.elapsed = time.perf_counter() - start_time
+
+    if solution is not None and solution.status == pulp.LpStatusOptimal:
+        print(f">>> 成功: {len(constraints_to_ignore)}個の制約を無視して最適解が見つかりました。")
+        print(f"    無視した制約: {constraints_to_ignore}")
+        status = solution.status
+        report.relaxed_constraints = constraints_to_ignore
+        if base_output_path is not None:
+            report.output_path = _relaxed_output_path(base_output_path, constraints_to_ignore)
+            save_results(df_foods, _food_units(solution, df_foods, report.presolve), report.output_path, df_constraints, result_formats)
+    else:
+        print("\n--- 全ての緩和策を試みましたが、最適解を見つけることができませんでした。 ---")
+        solution, status = None, pulp.LpStatusInfeasible
+    print(f"    求解回数: {report.n_solves}回, 所要時間: {report.elapsed:.3f}秒")
+    return solution, status, report
+
+def _find_within_budget(df_foods, df_constraints, base_output_path, penalty_weights, solver_options, presolve, result_formats, search_budget, progress_callback, cancel_event):
+    """find_optimal_solution_iteratively の method="anytime". 試行ごとの表示はせず, 途中経過は progress_callback に渡す"""
+    report = RelaxationReport()
+    start_time = time.perf_counter()
+    df_model_foods, df_model_constraints = df_foods, df_constraints
+    if presolve:
+        df_model_foods, df_model_constraints, report.presolve = _presolve(df_foods, df_constraints)
+        print(f"--- 前処理: {report.presolve.summary()} ---")
+
+    with trace_stage("build_model") as stage:
+        persistent_model = PersistentDietModel.from_frames(df_model_foods, df_model_constraints, solver_options)
+        stage.update(rows=persistent_model.model.n_rows, cols=persistent_model.model.n_cols, solver=persistent_model.options.backend, scaling=persistent_model.options.scaling)
+
+    search_budget = search_budget or SearchBudget()
+    print(f"--- 制約の緩和を探します (制限時間: {f'{search_budget.time_limit}秒' if search_budget.time_limit is not None else 'なし'}, 求解回数の上限: {f'{search_budget.max_solves}回' if search_budget.max_solves is not None else 'なし'}) ---")
+    with trace_stage("relaxation", method="anytime", time_limit=search_budget.time_limit, max_solves=search_budget.max_solves) as stage:
+        result = search_relaxation(persistent_model, search_budget, penalty_weights, progress_callback, cancel_event)
+        stage.update(relaxed_constraints=result.relaxed_constraints, n_solves=result.n_solves, stop_reason=result.stop_reason)
+    report.n_solves = result.n_solves
+    report.n_not_solved = result.n_not_solved
+    report.stop_reason = result.stop_reason
+    report.relaxed_constraints = result.relaxed_constraints
+    report.elapsed = time.perf_counter() - start_time
+
+    if result.stop_reason != STOP_COMPLETE:
+        print(f">>> 上限に達したため探索を打ち切りました ({result.stop_reason})。")
+    if result.status != pulp.LpStatusOptimal:
+        if result.relaxed_constraints:
+            print(f"    解を確かめる前に打ち切りました。外せば解がある制約: {result.relaxed_constraints}")
+        print("\n--- 最適解を見つけることができませんでした。 ---")
+        print(f"    求解回数: {report.n_solves}回, 所要時間: {report.elapsed:.3f}秒")
+        return None, result.status, report
+
+    if result.relaxed_constraints:
+        print(f">>> 成功: {len(result.relaxed_constraints)}個の制約を無視して最適解が見つかりました。")
+        print(f"    無視した制約: {result.relaxed_constraints}")
+    else:
+        print(">>> 成功: 全ての制約を満たす最適解が見つかりました。")
+    if base_output_path is not None:
+        report.output_path = _relaxed_output_path(base_output_path, result.relaxed_constraints) if result.relaxed_constraints else base_output_path
+        save_results(df_foods, _food_units(result.solution, df_foods, report.presolve), report.output_path, df_constraints, result_formats)
+    print(f"    求解回数: {report.n_solves}回, 所要時間: {report.elapsed:.3f}秒")
+    return result.solution, result.status, report
+
+def find_optimal_solution_cached(df_foods, df_constraints, base_output_path, method="elastic", penalty_weights=None, cache=None, solver_options=None, presolve=False, result_formats=("csv",), search_budget=None, progress_callback=None, cancel_event=None):
+    """
+    find_optimal_solution_iteratively の結果をキャッシュし, 同じ問題は解かずに保存済みの結果を出力する
+
+    キーは制約条件, 食品データ, 緩和方法と重みのハッシュ値で, 緩和した制約も合わせて保存する.
+    method="anytime" で上限に達したり cancel_event で打ち切ったりした結果は, 予算が変われば変わりうるため保存しない.
+    求解器の制限時間 (solver_options.time_limit) で打ち切られた求解があった結果も, 実行不可能と確定していないため保存しない.
+    presolve=True の場合は取り除いた食品と栄養素も保存し, キャッシュから返すときも report.presolve に入れる.
+
+    Args:
+        cache (SolutionCache, optional): 使用するキャッシュ. 指定がなければ既定の場所を使う
+        その他の引数は find_optimal_solution_iteratively と同じ
+
+    Returns:
+        tuple: (DietSolution or None, pulp.LpStatus, RelaxationReport). キャッシュから返した場合, DietSolution は None
+    """
+    if cache is None:
+        cache = SolutionCache()
+    start_time = time.perf_counter()
+    # 求解器によって最適解が複数ある場合の選ばれ方が異なるため, 求解器の設定もキーに含める
+    solver_options = solver_options or SolverOptions()
+    solver_key = {name: value for name, value in asdict(solver_options).items() if name != "msg"}
+    key = solution_key(df_foods, df_constraints, {"method": method, "penalty_weights": penalty_weights, "solver": solver_key, "presolve": presolve})
+
+    cached = cache.get(key)
+    if cached is not None:
+        report = RelaxationReport(relaxed_constraints=cached.relaxed_constraints, cache_hit=True)
+        if cached.presolve is not None:
+            report.presolve = PresolveReport.from_dict(cached.presolve)
+        if cached.content is not None:
+            report.output_path = os.path.join(os.path.dirname(base_output_path), cached.file_name)
+            os.makedirs(os.path.dirname(report.output_path), exist_ok=True)
+            with open(report.output_path, "w", encoding="utf-8") as f:
+                f.write(cached.content)
+            # キャッシュにはCSVだけを保存しているため, 他の形式はCSVから作り直す
+            other_formats = [fmt for fmt in result_formats if fmt != "csv"]
+            if other_formats:
+                df_results = pl.read_csv(io.StringIO(cached.content), schema_overrides={"amount": pl.Utf8, "unit": pl.Utf8})
+                write_results(df_results, report.output_path, other_formats)
+        report.elapsed = time.perf_counter() - start_time
+        print(f">>> 保存済みの結果を使用します (ステータス: {pulp.LpStatus[cached.status]})")
+        if cached.relaxed_constraints:
+            print(f"    無視した制約: {cached.relaxed_constraints}")
+        if report.output_path is not None:
+            print(f"\n結果がCSVファイルに出力されました: {report.output_path}")
+        return None, cached.status, report
+
+    solution, status, report = find_optimal_solution_iteratively(
+        df_foods, df_constraints, base_output_path, method, penalty_weights, solver_options, presolve, result_formats,
+        search_budget=search_budget, progress_callback=progress_callback, cancel_event=cancel_event
+    )
+    # 打ち切った探索 (STOP_CANCELLED を含む) の途中の最良の結果と, 制限時間で打ち切られた求解を含む結果は保存しない
+    if report.stop_reason not in (None, STOP_COMPLETE) or report.n_not_solved > 0:
+        return solution, status, report
+    content = None
+    if report.output_path is not None:
+        with open(report.output_path, "r", encoding="utf-8") as f:
+            content = f.read()
+    cache.put(key, CachedSolution(
+        status=status,
+        relaxed_constraints=report.relaxed_constraints,
+        file_name=os.path.basename(report.output_path) if report.output_path else None,
+        content=content,
+        n_solves=report.n_solves,
+        presolve=asdict(report.presolve) if report.presolve is not None else None,
+    ))
+    return solution, status, report
+
+def find_optimal_solution_by_column_generation(df_foods, df_constraints, base_output_path, penalty_weights=None, solver_options=None, result_formats=("csv",)):
+    """
+    食品数の多いデータを列生成で解き, 全ての制約を満たせない場合は弾性LPと同様に外す制約を求める
+
+    少数の食品から始めて, 双対価格で被約費用が負になる食品だけをモデルに追加していくため,
+    求解にかかる時間とメモリは食品データ全体ではなく, 実際に使われうる食品の数に比例する.
+    人工変数が残った制約を外したあと, 違反量の小さい制約から1つずつ戻して極小な緩和集合を得る.
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame
+        base_output_path (str or None): 成功した場合の基本的な出力ファイルパス. Noneの場合は結果を書き出さない
+        penalty_weights (dict, optional): 制約違反に対する重み. キーは栄養素ID または制約名
+        solver_options (SolverOptions, optional): スレッド数, 制限時間. 求解器はHiGHSを使う
+        result_formats (tuple): 結果の出力形式 ("csv", "parquet", "json"). CSVは常に出力する
+
+    Returns:
+        tuple: (ColumnGenerationSolution or None, pulp.LpStatus, RelaxationReport)
+    """
+    report = RelaxationReport()
+    start_time = time.perf_counter()
+    with trace_stage("build_model", column_generation=True) as stage:
+        model = ColumnGenerationModel(df_foods, df_constraints, penalty_weights, solver_options)
+        stage.update(rows=model.pricing.n_rows, cols=model.pricing.n_cols, initial_cols=len(model.active))
+
+    print(f"--- Step 1: {model.pricing.n_cols}件の食品のうち{len(model.active)}件から列生成で最適化を試みます ---")
+    with trace_stage("initial_solve"):
+        solution = model.solve()
+    print(f"    価格付け: {solution.n_rounds}回, 使用した列: {solution.n_active}件")
+    constraints_to_ignore = []
+    if solution.violations:
+        print(">>> 失敗: 全ての制約を満たす解が見つかりませんでした。制約の緩和を開始します。")
+        with trace_stage("relaxation", method="column_generation") as stage:
+            # 違反量の小さい制約ほど外さずに済む可能性が高いので先に戻してみる
+            constraints_to_ignore = sorted(solution.violations, key=solution.violations.get)
+            print(f"  - 違反が生じた制約: {constraints_to_ignore}")
+            model.set_active_constraints(constraints_to_ignore)
+            solution = model.solve()
+            for constraint_name in list(constraints_to_ignore):
+                model.set_active_constraints([name for name in constraints_to_ignore if name != constraint_name])
+                candidate_solution = model.solve()
+                if candidate_solution.status == pulp.LpStatusOptimal:
+                    print(f"  - {constraint_name} は戻しても解が存在します")
+                    constraints_to_ignore.remove(constraint_name)
+                    solution = candidate_solution
+            model.set_active_constraints(constraints_to_ignore)
+            stage.update(relaxed_constraints=constraints_to_ignore, n_solves=model.n_solves)
+    report.n_solves = model.n_solves
+    report.elapsed = time.perf_counter() - start_time
 
-    # --- Step 3: 制約を1つ、2つ、...と外しながら試行 ---
+    if solution.status != pulp.LpStatusOptimal:
+        print("\n--- 最適解を見つけることができませんでした。 ---")
+        return None, solution.status, report
+    if constraints_to_ignore:
+        print(f">>> 成功: {len(constraints_to_ignore)}個の制約を無視して最適解が見つかりました。")
+        print(f"    無視した制約: {constraints_to_ignore}")
+    else:
+        print(">>> 成功: 全ての制約を満たす最適解が見つかりました。")
+    report.relaxed_constraints = constraints_to_ignore
+    if base_output_path is not None:
+        report.output_path = _relaxed_output_path(base_output_path, constraints_to_ignore) if constraints_to_ignore else base_output_path
+        save_results(df_foods, solution.food_units, report.output_path, df_constraints, result_formats)
+    print(f"    求解回数: {report.n_solves}回, 使用した列: {solution.n_active}件, 所要時間: {report.elapsed:.3f}秒")
+    return solution, solution.status, report
+
+def _relaxed_output_path(base_output_path, constraints_to_ignore):
+    removed_str = "_".join(constraints_to_ignore)
+    output_dir = os.path.dirname(base_output_path)
+    return os.path.join(output_dir, f"results_without_{removed_str}.csv")
+
+def _relax_by_combinations(persistent_model):
+    """制約を1つ、2つ、...と外しながら総当たりで試行する"""
+    all_possible_constraints = persistent_model.constraint_names
     for k in range(1, len(all_possible_constraints) + 1):
         print(f"\n--- Step {k+1}: {k}個の制約を無視して試行します ---")
-        
         for constraints_to_ignore in combinations(all_possible_constraints, k):
-            
             constraints_to_ignore = list(constraints_to_ignore)
             print(f"  - 無視する制約: {constraints_to_ignore}")
-            
-            prob, status = solve_optimization_problem(df_foods, df_constraints, constraints_to_ignore=constraints_to_ignore)
-
-            # 修正点: pulp.LpStatus['Optimal'] -> pulp.LpStatusOptimal
-            if status == pulp.LpStatusOptimal:
-                print(f">>> 成功: {k}個の制約を無視して最適解が見つかりました。")
-                
-                removed_str = "_".join(constraints_to_ignore)
-                output_dir = os.path.dirname(base_output_path)
-                output_filename = f"results_without_{removed_str}.csv"
-                output_path = os.path.join(output_dir, output_filename)
-                
-                save_results_to_csv(prob.variables(), df_foods, output_path, df_constraints)
-                return prob, status
-
-    # --- Step 4: 全ての試行が失敗 ---
-    print("\n--- 全ての緩和策を試みましたが、最適解を見つけることができませんでした。 ---")
-    # 修正点: pulp.LpStatus['Infeasible'] -> pulp.LpStatusInfeasible
-    return None, pulp.LpStatusInfeasible
-
-def solve_optimization_problem(df_foods, df_constraints, constraints_to_ignore=None):
+            persistent_model.set_active_constraints(constraints_to_ignore)
+            solution = persistent_model.solve()
+            if solution.status == pulp.LpStatusOptimal:
+                return solution, constraints_to_ignore
+    return None, []
+
+def _relax_by_elastic_problem(persistent_model, penalty_weights, report):
+    """
+    弾性LPで違反が必要な制約を求め、そこから外さなくてもよい制約を1つずつ戻して極小な緩和集合を得る
+    """
+    print("\n--- Step 2: 弾性LPで違反が必要な制約を求めます ---")
+    status, violations = _solve_elastic_model(persistent_model.model, penalty_weights, persistent_model.options)
+    report.n_solves += 1
+    report.n_not_solved += status == pulp.LpStatusNotSolved
+    if violations is None:
+        return None, []
+
+    # 違反量の小さい制約ほど外さずに済む可能性が高いので先に戻してみる
+    constraints_to_ignore = sorted(violations, key=violations.get)
+    print(f"  - 違反が生じた制約: {constraints_to_ignore}")
+    persistent_model.set_active_constraints(constraints_to_ignore)
+    solution = persistent_model.solve()
+    if solution.status != pulp.LpStatusOptimal:
+        return None, []
+
+    print("\n--- Step 3: 外さなくてもよい制約を戻します ---")
+    for constraint_name in list(constraints_to_ignore):
+        persistent_model.activate(constraint_name)
+        candidate_solution = persistent_model.solve()
+        if candidate_solution.status == pulp.LpStatusOptimal:
+            print(f"  - {constraint_name} は戻しても解が存在します")
+            constraints_to_ignore.remove(constraint_name)
+            solution = candidate_solution
+        else:
+            persistent_model.deactivate(constraint_name)
+    return solution, constraints_to_ignore
+
+def solve_elastic_problem(df_foods, df_constraints, penalty_weights=None, solver_options=None):
+    """
+    全ての栄養素制約に非負のスラック変数を加えた弾性LPを解き、違反が必要な制約を求める
+
+    違反量は制約値で割った相対値で評価するため、単位の異なる栄養素どうしでも重みだけで優先度を調整できる.
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame
+        penalty_weights (dict, optional): 制約違反に対する重み. キーは栄養素ID または制約名. 指定がなければ1.0
+        solver_options (SolverOptions, optional): 求解器の選択と設定. 指定がなければHiGHS
+
+    Returns:
+        dict or None: 違反が生じた制約名 -> 相対違反量. 食品の摂取量制約だけで実行不可能な場合はNone
+    """
+    return _solve_elastic_model(build_diet_model(df_foods, df_constraints), penalty_weights, solver_options)[1]
+
+def _solve_elastic_model(model, penalty_weights, solver_options=None):
+    """弾性LPを解き, (ステータス, 違反が生じた制約名 -> 相対違反量 or None) を返す"""
+    elastic_model, slack_names, slack_scales = add_elastic_slacks(model, penalty_weights)
+    solution = solve_model(elastic_model, solver_options)
+    if solution.status != pulp.LpStatusOptimal:
+        return solution.status, None
+
+    relative_violations = solution.values[model.n_cols:] / slack_scales
+    return solution.status, {
+        constraint_name: float(relative_violation)
+        for constraint_name, relative_violation in zip(slack_names, relative_violations)
+        if relative_violation > 1e-7
+    }
+
+def solve_optimization_problem(df_foods, df_constraints, constraints_to_ignore=None, solver_options=None, presolve=False):
     """
     与えられたデータと制約で最適化問題を解く汎用関数
 
@@ -72,103 +403,38 @@ def solve_optimization_problem(df_foods, df_constraints, constraints_to_ignore=N
         df_foods (pl.DataFrame): 食品データのDataFrame
         df_constraints (pl.DataFrame): 栄養素制約のDataFrame
         constraints_to_ignore (list, optional): 無視する制約名のリスト (例: ['Min_energy', 'Max_vitamin_a'])
+        solver_options (SolverOptions, optional): 求解器の選択と設定. 指定がなければHiGHS
+        presolve (bool): 最適解に影響しない食品と栄養素を, モデルを作成する前に取り除く
 
     Returns:
-        tuple: (pulp.LpProblem, pulp.LpStatus) 最適化問題のオブジェクトとその結果ステータス
-    """
-    food_items = df_foods.to_dicts()
-
-    if constraints_to_ignore is None:
-        constraints_to_ignore = []
-
-    prob = pulp.LpProblem("Diet_Optimization", pulp.LpMinimize)
-    food_vars = pulp.LpVariable.dicts("food", [f["food_name"] for f in food_items], lowBound=0, cat='Continuous')
-    prob += pulp.lpSum([food["cost"] * food_vars[food["food_name"]] for food in food_items]), "Total Cost"
-
-    # 各食品の最小・最大摂取量の制約を追加
-    for food in food_items:
-        food_name = food["food_name"]
-        
-        # 'min' 列に有効な値があり、'amount'が0より大きい場合、下限制約を追加
-        if food.get("min") is not None and food.get("amount") is not None and food["amount"] > 0:
-            # 制約は「購入単位数」に対して設定する
-            # (最小摂取量 / 単位あたりの量) で、必要な最小購入単位数を計算
-            min_units = food["min"] / food["amount"]
-            prob += food_vars[food_name] >= min_units, f"Min_amount_{food_name}"
-
-        # 'max' 列に有効な値があり、'amount'が0より大きい場合、上限制約を追加
-        if food.get("max") is not None and food.get("amount") is not None and food["amount"] > 0:
-            # (最大摂取量 / 単位あたりの量) で、許容される最大購入単位数を計算
-            max_units = food["max"] / food["amount"]
-            prob += food_vars[food_name] <= max_units, f"Max_amount_{food_name}"
-
-    for row in df_constraints.iter_rows(named=True):
-        nutrient_id = row['nutrient_id']
-        if nutrient_id not in food_items[0]:
-            continue
-
-        total_nutrient = pulp.lpSum([food[nutrient_id] * food_vars[food["food_name"]] for food in food_items])
-        
-        min_constraint_name = f"Min_{nutrient_id}"
-        if row['lower'] is not None and min_constraint_name not in constraints_to_ignore:
-            prob += total_nutrient >= row['lower'], min_constraint_name
-        
-        max_constraint_name = f"Max_{nutrient_id}"
-        if row['upper'] is not None and max_constraint_name not in constraints_to_ignore:
-            prob += total_nutrient <= row['upper'], max_constraint_name
-    prob.solve(pulp.PULP_CBC_CMD(msg=0))
-    return prob, prob.status
-
-def save_results_to_csv(prob_variables, df_foods: pl.DataFrame, output_path: str, df_constraints: pl.DataFrame):
-    food_data_map = {f["food_name"]: f for f in df_foods.to_dicts()}
-    results_data = []
-    nutrient_columns = [col for col in df_foods.columns if col not in ["food_name", "amount", "min", "max", "unit", "cost"]]
-    totals = {col: 0.0 for col in nutrient_columns}
-    totals["cost"] = 0.0
-    for var in prob_variables:
-        if var.varValue > 0:
-            food_name = var.name.replace("food_", "").replace("_", " ")
-            num_units = var.varValue
-            food_info = food_data_map[food_name]
-            row_data = {
-                "food_name": food_name,
-                "cost": food_info["cost"] * num_units,
-                "amount": f"{num_units * food_info['amount']:.2f}",
-                "unit": food_info["unit"]
-            }
-            for nutrient in nutrient_columns:
-                value = food_info[nutrient] * num_units
-                row_data[nutrient] = value
-                totals[nutrient] += value
-            totals["cost"] += row_data["cost"]
-            results_data.append(row_data)
-    total_row = {"food_name": "total", "cost": totals["cost"], "amount": "", "unit": ""}
-    for nutrient in nutrient_columns:
-        total_row[nutrient] = totals[nutrient]
-    results_data.append(total_row)
-    df_results = pl.DataFrame(results_data)
-    final_columns = ["food_name", "cost", "amount", "unit"] + nutrient_columns
-    df_results = df_results.select(final_columns)
-
-    list_lower = df_constraints.select(["nutrient_id", "lower"]).rows() # [(nutrient_id, lower)]
-    add_data = {
-        "food_name": "achievement_rate (%)",
-        "cost": None,
-        "amount": None,
-        "unit": None
-    }
-    for nutrient_id, lower in list_lower:
-        if lower is not None:
-            achievement_rate = (totals[nutrient_id] / lower) * 100 if lower != 0 else None
-            add_data[nutrient_id] = achievement_rate if achievement_rate is not None else None
-            add_data[nutrient_id]
-        else:
-            add_data[nutrient_id] = None
+        tuple: (DietSolution, pulp.LpStatus) 最適化問題の解とその結果ステータス
+    """
+    if presolve:
+        df_foods, df_constraints, _ = _presolve(df_foods, df_constraints)
+    solution = solve_model(build_diet_model(df_foods, df_constraints, constraints_to_ignore), solver_options)
+    return solution, solution.status
 
-    
-    df_results = df_results.vstack(pl.DataFrame([add_data]))
+def save_results(df_foods: pl.DataFrame, food_units, output_path: str, df_constraints: pl.DataFrame, formats=("csv",)):
+    """
+    食品ごとの購入単位数から結果を作成し, 指定された形式で書き出す
 
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        food_units (np.ndarray): df_foods の行と同じ順序の購入単位数
+        output_path (str): CSVファイルの出力パス. 他の形式は拡張子だけを置き換える
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame
+        formats (tuple): 出力形式 ("csv", "parquet", "json"). CSVは常に出力する
+    """
+    formats = ("csv", *[fmt for fmt in formats if fmt != "csv"])
+    with trace_stage("save_results", output_path=output_path, formats=list(formats)):
+        for path in write_results(build_results_frame(df_foods, food_units, df_constraints), output_path, formats):
+            label = "CSVファイル" if path.endswith(".csv") else "ファイル"
+            print(f"\n結果が{label}に出力されました: {path}")
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df_results.write_csv(output_path)
-    print(f"\n結果がCSVファイルに出力されました: {output_path}")
\ No newline at end of file
+def _food_units(solution, df_foods, presolve_report):
+    # 前処理で食品を取り除いた場合は, 元の食品データの行番号に戻す
+    if presolve_report is None:
+        return solution.food_units
+    food_units = np.zeros(df_foods.height)
+    food_units[presolve_report.kept_rows] = solution.food_units
+    return food_units
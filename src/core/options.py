@@ -0,0 +1,76 @@
+import argparse
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+# コマンドライン引数の定義に使う設定値. 引数の解析や --help の表示で polars や pulp を読み込まないよう,
+# このモジュールは標準ライブラリだけをimportする
+
+# 求解器の既定値を変更する環境変数. コマンドライン引数 (--solver) でも指定できる
+SOLVER_ENV = "NUTRITION_OPTIMIZER_SOLVER"
+SOLVER_BACKENDS = ("highs", "cbc")
+RESULT_FORMATS = ("csv", "parquet", "json")
+# 最適解が見つからない場合の制約の緩和方法
+RELAXATION_METHODS = ("elastic", "exhaustive", "anytime")
+
+@dataclass
+class SolverOptions:
+    """
+    求解器の選択と設定
+
+    backend: "highs" はプロセス内で解き, 直前の基底から再求解できる. "cbc" は毎回サブプロセスで解く
+    threads: 使用するスレッド数
+    time_limit: 1回の求解の制限時間 (秒)
+    mip_gap: 整数変数を含む場合の相対ギャップの許容値
+    msg: 求解器のログを表示する
+    scaling: 行 (栄養素) と列 (食品) の幾何平均スケーリングをしてから解く (解と双対価格はスケーリング前の値に戻す)
+    """
+    backend: str = "highs"
+    threads: Optional[int] = None
+    time_limit: Optional[float] = None
+    mip_gap: Optional[float] = None
+    msg: bool = False
+    scaling: bool = False
+
+    def __post_init__(self):
+        if self.backend not in SOLVER_BACKENDS:
+            raise ValueError(f"未対応の求解器です: {self.backend} (使用可能: {', '.join(SOLVER_BACKENDS)})")
+
+    @classmethod
+    def from_env(cls, **kwargs) -> "SolverOptions":
+        """環境変数で指定された求解器を既定値として設定を作成する"""
+        kwargs.setdefault("backend", os.environ.get(SOLVER_ENV) or "highs")
+        return cls(**kwargs)
+
+@dataclass
+class SearchBudget:
+    """
+    制約の緩和の探索 (method="anytime") に使える資源の上限. 指定しない項目は上限なし
+
+    time_limit: 探索全体の制限時間 (秒). 各求解の制限時間も残り時間に合わせる
+    max_solves: 求解回数の上限
+    """
+    time_limit: Optional[float] = None
+    max_solves: Optional[int] = None
+
+def add_solver_arguments(parser: argparse.ArgumentParser):
+    """求解器の選択と設定のコマンドライン引数を追加する"""
+    parser.add_argument("--solver", type=str, choices=SOLVER_BACKENDS, default=None, help=f"求解器 (省略時は環境変数 {SOLVER_ENV}, それも無ければ highs)")
+    parser.add_argument("--threads", type=int, required=False, help="求解器のスレッド数")
+    parser.add_argument("--time_limit", type=float, required=False, help="1回の求解の制限時間 (秒)")
+    parser.add_argument("--mip_gap", type=float, required=False, help="整数変数を含む場合の相対ギャップの許容値")
+    parser.add_argument("--scaling", action="store_true", help="行 (栄養素) と列 (食品) の係数の大きさを幾何平均で均してから解く")
+
+def solver_options_from_args(args: argparse.Namespace) -> SolverOptions:
+    kwargs = {"threads": args.threads, "time_limit": args.time_limit, "mip_gap": args.mip_gap, "scaling": args.scaling}
+    if args.solver is not None:
+        kwargs["backend"] = args.solver
+    return SolverOptions.from_env(**kwargs)
+
+def add_search_arguments(parser: argparse.ArgumentParser):
+    """-r anytime の探索の上限のコマンドライン引数を追加する"""
+    parser.add_argument("--search_time", type=float, required=False, help="-r anytime で制約の緩和を探す制限時間 (秒). 超えた時点で最良の緩和を使う")
+    parser.add_argument("--max_solves", type=int, required=False, help="-r anytime で制約の緩和を探す求解回数の上限")
+
+def search_budget_from_args(args: argparse.Namespace) -> SearchBudget:
+    return SearchBudget(time_limit=args.search_time, max_solves=args.max_solves)
@@ -0,0 +1,216 @@
+import time
+from dataclasses import replace
+import highspy
+import numpy as np
+import polars as pl
+import pulp
+from typing import Optional
+from core.model_builder import DietModel, DietSolution, SolverOptions, build_diet_model, solve_with_cbc
+from core.scaling import ModelScaling, compute_scaling
+from core.tracing import get_tracer
+
+_HIGHS_STATUS = {
+    highspy.HighsModelStatus.kOptimal: pulp.LpStatusOptimal,
+    highspy.HighsModelStatus.kInfeasible: pulp.LpStatusInfeasible,
+    highspy.HighsModelStatus.kUnboundedOrInfeasible: pulp.LpStatusInfeasible,
+    highspy.HighsModelStatus.kUnbounded: pulp.LpStatusUnbounded,
+    highspy.HighsModelStatus.kTimeLimit: pulp.LpStatusNotSolved,
+    highspy.HighsModelStatus.kIterationLimit: pulp.LpStatusNotSolved,
+    highspy.HighsModelStatus.kInterrupt: pulp.LpStatusNotSolved,
+}
+
+def to_pulp_status(model_status) -> int:
+    """HiGHSのモデルステータスをPuLPのステータスに変換する"""
+    return _HIGHS_STATUS.get(model_status, pulp.LpStatusUndefined)
+
+def has_feasible_solution(info) -> bool:
+    """HiGHSの求解結果 (getInfo()) に実行可能解があるか. 制限時間で打ち切られた場合の暫定解の確認に使う"""
+    return info.primal_solution_status == highspy.SolutionStatus.kSolutionStatusFeasible
+
+def pass_model_to_highs(highs: highspy.Highs, model: DietModel):
+    """DietModelを一括でHiGHSに渡す"""
+    start, index, value = model.to_csc()
+    lp = highspy.HighsLp()
+    lp.num_col_ = model.n_cols
+    lp.num_row_ = model.n_rows
+    lp.col_cost_ = model.cost
+    lp.col_lower_ = model.col_lower
+    lp.col_upper_ = model.col_upper
+    lp.row_lower_ = model.row_lower
+    lp.row_upper_ = model.row_upper
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = start
+    lp.a_matrix_.index_ = index
+    lp.a_matrix_.value_ = value
+    highs.passModel(lp)
+
+def apply_highs_options(highs: highspy.Highs, options: SolverOptions):
+    """SolverOptions のスレッド数, 制限時間, 相対ギャップをHiGHSに設定する"""
+    highs.setOptionValue("output_flag", options.msg)
+    if options.threads is not None:
+        highs.setOptionValue("threads", int(options.threads))
+    if options.time_limit is not None:
+        highs.setOptionValue("time_limit", float(options.time_limit))
+    if options.mip_gap is not None:
+        highs.setOptionValue("mip_rel_gap", float(options.mip_gap))
+
+class PersistentDietModel:
+    """
+    HiGHSのモデルをプロセス内に保持し, Min_/Max_ 制約を切り替えながら再求解する
+
+    変数と制約は最初に一度だけ渡し, 以降は行の上下限だけを変更する.
+    HiGHSは直前の基底を保持しているため, 再求解はそこからの双対単体法で行われ,
+    サブプロセスの起動や一時ファイルの読み書きは発生しない.
+    options.backend が "cbc" の場合は, 同じ切り替え操作のまま毎回現在の上下限でCBCを起動して解く.
+    このときHiGHSのモデルは作成せず (highs は None), 上下限と値段の変更は model と保持している上下限にだけ反映する.
+    options.scaling を指定すると求解器にはスケーリングした問題を渡し, 上下限や値段の変更もスケーリングしてから反映する.
+    model, 解, 双対価格 (row_duals, reduced_costs) は常に元の単位で扱う.
+    """
+
+    def __init__(self, model: DietModel, options: Optional[SolverOptions] = None):
+        self.model = model
+        self.options = options or SolverOptions()
+        self.n_solves = 0
+        # 求解器の制限時間で打ち切られた求解の回数
+        self.n_not_solved = 0
+        self.scaling = compute_scaling(model) if self.options.scaling else ModelScaling.identity(model)
+        self.highs: Optional[highspy.Highs] = None
+        if self.options.backend != "cbc":
+            self.highs = highspy.Highs()
+            apply_highs_options(self.highs, self.options)
+            pass_model_to_highs(self.highs, self.scaling.scale_model(model))
+
+        self._row_index = {name: i for i, name in enumerate(model.row_names)}
+        self._row_lower = model.row_lower.copy()
+        self._row_upper = model.row_upper.copy()
+        self._inactive = set()
+
+    @classmethod
+    def from_frames(cls, df_foods: pl.DataFrame, df_constraints: pl.DataFrame, options: Optional[SolverOptions] = None) -> "PersistentDietModel":
+        return cls(build_diet_model(df_foods, df_constraints), options)
+
+    @property
+    def constraint_names(self) -> list[str]:
+        """切り替え可能な Min_/Max_ 制約名の一覧"""
+        return self.model.constraint_names()
+
+    @property
+    def inactive_constraints(self) -> list[str]:
+        return [name for name in self.constraint_names if name in self._inactive]
+
+    def _locate(self, constraint_name: str) -> tuple[str, int]:
+        prefix, _, nutrient_id = constraint_name.partition("_")
+        if prefix not in ("Min", "Max") or nutrient_id not in self._row_index:
+            raise KeyError(f"制約が見つかりません: {constraint_name}")
+        return prefix, self._row_index[nutrient_id]
+
+    def _apply_row_bounds(self, i: int):
+        lower = -np.inf if f"Min_{self.model.row_names[i]}" in self._inactive else self._row_lower[i]
+        upper = np.inf if f"Max_{self.model.row_names[i]}" in self._inactive else self._row_upper[i]
+        if self.highs is not None:
+            self.highs.changeRowBounds(i, lower * self.scaling.row_scale[i], upper * self.scaling.row_scale[i])
+
+    def deactivate(self, constraint_name: str):
+        """制約を無効にする (上下限を外す)"""
+        _, i = self._locate(constraint_name)
+        self._inactive.add(constraint_name)
+        self._apply_row_bounds(i)
+
+    def activate(self, constraint_name: str):
+        """無効にした制約を元に戻す"""
+        _, i = self._locate(constraint_name)
+        self._inactive.discard(constraint_name)
+        self._apply_row_bounds(i)
+
+    def set_active_constraints(self, constraints_to_ignore):
+        """constraints_to_ignore に含まれる制約だけが無効な状態にする"""
+        constraints_to_ignore = set(constraints_to_ignore)
+        changed = self._inactive ^ constraints_to_ignore
+        for constraint_name in changed:
+            if constraint_name in constraints_to_ignore:
+                self.deactivate(constraint_name)
+            else:
+                self.activate(constraint_name)
+
+    def set_bound(self, constraint_name: str, value: float):
+        """Min_/Max_ 制約の値を変更する. Noneを渡すと上下限なしになる"""
+        prefix, i = self._locate(constraint_name)
+        if prefix == "Min":
+            self._row_lower[i] = -np.inf if value is None else value
+        else:
+            self._row_upper[i] = np.inf if value is None else value
+        self._apply_row_bounds(i)
+
+    def set_cost(self, col: int, value: float):
+        """列 (食品) の目的関数の係数を変更する"""
+        # 元のDietModelは他でも使われている可能性があるため, 係数の配列は複製してから変更する
+        cost = self.model.cost.copy()
+        cost[col] = value
+        self.model = replace(self.model, cost=cost)
+        if self.highs is not None:
+            self.highs.changeColCost(col, value * self.scaling.col_scale[col])
+
+    def set_costs(self, cost: np.ndarray):
+        """全ての列の目的関数の係数をまとめて変更する. 基底は保持されるため, 次の求解は直前の解から始まる"""
+        cost = np.asarray(cost, dtype=float)
+        if cost.shape != (self.model.n_cols,):
+            raise ValueError(f"係数の数が列数と一致しません: {cost.shape[0] if cost.ndim else 0} != {self.model.n_cols}")
+        self.model = replace(self.model, cost=cost.copy())
+        if self.highs is not None:
+            self.highs.changeColsCost(self.model.n_cols, np.arange(self.model.n_cols, dtype=np.int32), cost * self.scaling.col_scale)
+
+    def set_time_limit(self, time_limit: Optional[float]):
+        """以降の求解の制限時間 (秒) を変更する. Noneで制限なし"""
+        self.options = replace(self.options, time_limit=time_limit)
+        if self.highs is not None:
+            self.highs.setOptionValue("time_limit", float("inf") if time_limit is None else float(time_limit))
+
+    def current_model(self) -> DietModel:
+        """無効にした制約の上下限を外した, 現在の状態のDietModelを返す"""
+        row_lower = np.array([-np.inf if f"Min_{name}" in self._inactive else v for name, v in zip(self.model.row_names, self._row_lower)])
+        row_upper = np.array([np.inf if f"Max_{name}" in self._inactive else v for name, v in zip(self.model.row_names, self._row_upper)])
+        return replace(self.model, row_lower=row_lower, row_upper=row_upper)
+
+    def solve(self) -> DietSolution:
+        """現在の制約で再求解する. HiGHSでは直前の基底から開始する"""
+        if self.options.backend == "cbc":
+            self.n_solves += 1
+            status, values = solve_with_cbc(self.scaling.scale_model(self.current_model()), options=self.options)
+            self.n_not_solved += status == pulp.LpStatusNotSolved
+            return DietSolution(self.model, status, self.scaling.unscale_values(values))
+
+        tracer = get_tracer()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        self.highs.run()
+        self.n_solves += 1
+        status = to_pulp_status(self.highs.getModelStatus())
+        self.n_not_solved += status == pulp.LpStatusNotSolved
+        if tracer.enabled:
+            tracer.record_solve(
+                "highs", self.model, status, time.perf_counter() - start_wall, time.process_time() - start_cpu,
+                iterations=self.highs.getInfo().simplex_iteration_count,
+                solve_index=self.n_solves, inactive_constraints=self.inactive_constraints
+            )
+        if status != pulp.LpStatusOptimal:
+            return DietSolution(self.model, status)
+        values = self.scaling.unscale_values(self.highs.getSolution().col_value)
+        return DietSolution(self.model, status, values)
+
+    def _require_highs(self):
+        if self.highs is None:
+            raise ValueError("行の値と双対価格は, HiGHSで解いた場合のみ求められます。")
+
+    def row_values(self) -> np.ndarray:
+        """直前の解での各行 (栄養素) の総摂取量. HiGHSで解いた場合のみ"""
+        self._require_highs()
+        return self.scaling.unscale_row_values(self.highs.getSolution().row_value)
+
+    def row_duals(self) -> np.ndarray:
+        """直前の解での各行の双対価格 (制約値を1増やしたときの費用の変化量). HiGHSで解いた場合のみ"""
+        self._require_highs()
+        return self.scaling.unscale_row_duals(self.highs.getSolution().row_dual)
+
+    def reduced_costs(self) -> np.ndarray:
+        """直前の解での各列の被約費用. HiGHSで解いた場合のみ"""
+        self._require_highs()
+        return self.scaling.unscale_col_duals(self.highs.getSolution().col_dual)
@@ -0,0 +1,154 @@
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+import polars as pl
+from core.model_builder import build_diet_model
+
+# 支配関係を調べるときに一度に比較する食品数. 最初の数列は (CHUNK_SIZE × 食品数) の配列で比較し,
+# 残った組だけを残りの列で比較する
+CHUNK_SIZE = 256
+DENSE_COLUMNS = 8
+
+@dataclass
+class PresolveReport:
+    """
+    前処理で取り除いた食品と栄養素の記録
+
+    removed_foods: (食品名, 理由, 代わりに残した食品名) の一覧
+    removed_nutrients: (栄養素ID, 理由) の一覧
+    kept_rows: 残した食品の, 元の食品データでの行番号
+    """
+    n_foods_before: int = 0
+    n_foods_after: int = 0
+    n_nutrients_before: int = 0
+    n_nutrients_after: int = 0
+    removed_foods: list[tuple[str, str, Optional[str]]] = field(default_factory=list)
+    removed_nutrients: list[tuple[str, str]] = field(default_factory=list)
+    kept_rows: list[int] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "PresolveReport":
+        """asdict で辞書にしたもの (JSONで保存すると組はリストになる) から作り直す"""
+        return cls(**{
+            **data,
+            "removed_foods": [tuple(item) for item in data.get("removed_foods", [])],
+            "removed_nutrients": [tuple(item) for item in data.get("removed_nutrients", [])],
+        })
+
+    def to_frame(self) -> pl.DataFrame:
+        rows = [{"kind": "food", "name": name, "reason": reason, "kept_instead": kept} for name, reason, kept in self.removed_foods]
+        rows += [{"kind": "nutrient", "name": name, "reason": reason, "kept_instead": None} for name, reason in self.removed_nutrients]
+        return pl.DataFrame(rows, schema={"kind": pl.Utf8, "name": pl.Utf8, "reason": pl.Utf8, "kept_instead": pl.Utf8})
+
+    def summary(self) -> str:
+        reasons = {}
+        for _, reason, _ in self.removed_foods:
+            reasons[reason] = reasons.get(reason, 0) + 1
+        detail = ", ".join(f"{reason}: {count}" for reason, count in reasons.items())
+        return (
+            f"食品: {self.n_foods_before} -> {self.n_foods_after}" + (f" ({detail})" if detail else "")
+            + f", 栄養素: {self.n_nutrients_before} -> {self.n_nutrients_after}"
+        )
+
+def _find_dominated(values: np.ndarray, equal_values: np.ndarray, can_replace: np.ndarray, can_be_replaced: np.ndarray) -> np.ndarray:
+    """
+    各食品について, それを支配する食品の番号を返す. 支配されていなければ -1
+
+    食品kが食品jを支配する条件は, values の全ての列で k >= j, equal_values の全ての列で k == j,
+    kの上限が無く (can_replace), jの下限が0 (can_be_replaced) であること.
+    全ての値が等しい場合は番号の小さい方を残す.
+    """
+    n_foods = values.shape[0]
+    dominators = [np.empty(0, dtype=np.int64)] * n_foods
+    is_dominated = np.zeros(n_foods, dtype=bool)
+    candidates = np.flatnonzero(can_replace)
+    removable = np.flatnonzero(can_be_replaced)
+    if len(candidates) == 0:
+        return np.full(n_foods, -1, dtype=np.int64)
+    # 列ごとに取り出すため, 列方向に連続した配列にしておく
+    columns, equal_columns = np.ascontiguousarray(values.T), np.ascontiguousarray(equal_values.T)
+    for begin in range(0, len(removable), CHUNK_SIZE):
+        chunk = removable[begin:begin + CHUNK_SIZE]
+        mask = candidates[None, :] != chunk[:, None]
+        for col in range(min(DENSE_COLUMNS, values.shape[1])):
+            mask &= columns[col][candidates][None, :] >= columns[col][chunk][:, None]
+        pair_chunk, pair_candidate = np.nonzero(mask)
+        j, k = chunk[pair_chunk], candidates[pair_candidate]
+        for col in range(DENSE_COLUMNS, len(columns)):
+            keep = columns[col][k] >= columns[col][j]
+            j, k = j[keep], k[keep]
+        for col in range(len(equal_columns)):
+            keep = equal_columns[col][k] == equal_columns[col][j]
+            j, k = j[keep], k[keep]
+        strictly_better = (values[k] > values[j]).any(axis=1) | (k < j)
+        j, k = j[strictly_better], k[strictly_better]
+        for food in np.unique(j).tolist():
+            dominators[food] = k[j == food]
+            is_dominated[food] = True
+
+    # 支配関係は推移的なので, 支配されていない食品の中に必ず代わりになる食品がある
+    dominated_by = np.full(n_foods, -1, dtype=np.int64)
+    for j in np.flatnonzero(is_dominated).tolist():
+        remaining = dominators[j][~is_dominated[dominators[j]]]
+        dominated_by[j] = remaining[0]
+    return dominated_by
+
+def presolve_problem(df_foods: pl.DataFrame, df_constraints: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataFrame, PresolveReport]:
+    """
+    最適解を変えずに取り除ける食品と栄養素を, モデルを作成する前に取り除く
+
+    - 制約のある全ての栄養素が0で, 値段が負でない食品
+    - 他の食品に支配される食品: 下限だけの栄養素を同じ以上, 上限だけの栄養素を同じ以下,
+      上下限のある栄養素を同じだけ含み, 値段が同じ以下で, 使用量に上限の無い食品がある場合
+    - 全ての食品で0になる栄養素 (0で制約を満たす場合のみ)
+
+    制約を外すと支配の条件は弱くなるだけなので, 取り除いた食品は制約を緩和した問題でも最適解に現れない.
+    値段が設定されていない食品は取り除かず, build_diet_model と同じく ValueError にする.
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame
+
+    Returns:
+        tuple: (食品データ, 栄養素制約, PresolveReport)
+
+    Raises:
+        ValueError: 値段が設定されていない食品がある場合
+    """
+    report = PresolveReport(n_foods_before=df_foods.height)
+    model = build_diet_model(df_foods, df_constraints)
+    report.n_nutrients_before = model.n_rows
+
+    # 全ての食品で0の栄養素は, 0が上下限の範囲内なら制約にならない
+    zero_rows = ~(model.matrix != 0).any(axis=0) & (model.row_lower <= 0) & (model.row_upper >= 0)
+    report.removed_nutrients += [(name, "全ての食品で0") for name in np.array(model.row_names, dtype=object)[zero_rows].tolist()]
+    matrix = model.matrix[:, ~zero_rows]
+    row_lower, row_upper = model.row_lower[~zero_rows], model.row_upper[~zero_rows]
+
+    removed = np.zeros(model.n_cols, dtype=bool)
+    zero_foods = ~(matrix != 0).any(axis=1) & (model.col_lower == 0) & (model.cost >= 0)
+    for j in np.flatnonzero(zero_foods).tolist():
+        report.removed_foods.append((model.col_names[j], "栄養素を含まない", None))
+    removed |= zero_foods
+
+    # 上限だけの栄養素は符号を反転し, 「多いほど良い」列にそろえる. 値段も同様
+    has_lower, has_upper = np.isfinite(row_lower), np.isfinite(row_upper)
+    values = np.hstack([matrix[:, has_lower & ~has_upper], -matrix[:, has_upper & ~has_lower], -model.cost[:, None]])
+    equal_values = matrix[:, has_lower & has_upper]
+    kept = np.flatnonzero(~removed)
+    dominated_by = _find_dominated(
+        values[kept], equal_values[kept], np.isinf(model.col_upper[kept]), model.col_lower[kept] == 0
+    )
+    for i in np.flatnonzero(dominated_by >= 0).tolist():
+        j, k = kept[i], kept[dominated_by[i]]
+        is_duplicate = np.array_equal(values[j], values[k]) and np.array_equal(equal_values[j], equal_values[k])
+        report.removed_foods.append((model.col_names[j], "重複" if is_duplicate else "他の食品に支配される", model.col_names[k]))
+        removed[j] = True
+
+    df_foods = df_foods.filter(pl.Series(~removed))
+    removed_nutrients = [name for name, _ in report.removed_nutrients]
+    df_constraints = df_constraints.filter(~pl.col("nutrient_id").is_in(removed_nutrients))
+    report.kept_rows = np.flatnonzero(~removed).tolist()
+    report.n_foods_after = df_foods.height
+    report.n_nutrients_after = report.n_nutrients_before - len(removed_nutrients)
+    return df_foods, df_constraints, report
@@ -0,0 +1,109 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import numpy as np
+import polars as pl
+import pulp
+from core.model_builder import DietModel, build_diet_model, missing_cost_error
+from core.options import SolverOptions
+from core.persistent_model import PersistentDietModel
+
+def read_price_table(path: str) -> pl.DataFrame:
+    """food_name の列と, シナリオごとの値段の列を持つCSVを読み込む"""
+    df_prices = pl.read_csv(path, schema_overrides={"food_name": pl.Utf8})
+    if "food_name" not in df_prices.columns:
+        raise ValueError(f"値段の表に food_name の列がありません: {path}")
+    if df_prices.width < 2:
+        raise ValueError(f"値段の表にシナリオの列がありません: {path}")
+    return df_prices
+
+def scenario_costs(df_foods: pl.DataFrame, df_prices: pl.DataFrame) -> tuple[list[str], np.ndarray]:
+    """
+    値段の表を, 食品データの行の順に並べたシナリオごとの値段の配列にする
+
+    値段の表に無い食品や値段が空欄の食品は, 食品データの cost を使う. どちらにも値段が無い食品があれば ValueError にする.
+
+    Returns:
+        tuple: (シナリオ名の一覧, (シナリオ数 × 食品数) の値段の配列)
+    """
+    unknown = sorted(set(df_prices["food_name"].to_list()) - set(df_foods["food_name"].to_list()))
+    if unknown:
+        raise ValueError(f"食品データに無い食品が値段の表にあります: {unknown}")
+    if df_prices["food_name"].is_duplicated().any():
+        raise ValueError("値段の表で同じ食品が複数回指定されています。")
+
+    scenario_names = [col for col in df_prices.columns if col != "food_name"]
+    base_cost = pl.col("cost").cast(pl.Float64, strict=False).fill_nan(None)
+    df_costs = df_foods.select("food_name", base_cost).join(
+        df_prices.select("food_name", *[pl.col(name).cast(pl.Float64, strict=False).fill_nan(None) for name in scenario_names]),
+        on="food_name", how="left", maintain_order="left"
+    ).select(pl.col(name).fill_null(base_cost) for name in scenario_names)
+    missing = df_costs.select(pl.any_horizontal(pl.all().is_null())).to_series()
+    if missing.any():
+        raise missing_cost_error(df_foods.filter(missing)["food_name"].to_list())
+    return scenario_names, df_costs.to_numpy().T.reshape(len(scenario_names), df_foods.height)
+
+def _solve_scenarios(model: DietModel, costs: np.ndarray, solver_options: Optional[SolverOptions] = None) -> list[dict]:
+    """
+    目的関数の係数だけを costs の各行に変えながら, 同じモデルを直前の最適基底から解き直す
+
+    値段を変えても直前の解は実行可能なままなので, HiGHSは主単体法で数回の反復から再開できる.
+    """
+    persistent_model = PersistentDietModel(model, solver_options)
+    rows = []
+    for cost in costs:
+        persistent_model.set_costs(cost)
+        solution = persistent_model.solve()
+        iterations = None if persistent_model.options.backend == "cbc" else persistent_model.highs.getInfo().simplex_iteration_count
+        rows.append({
+            "status": solution.status,
+            "cost": solution.objective,
+            "iterations": iterations,
+            "units": solution.food_units,
+        })
+    return rows
+
+def solve_price_scenarios(df_foods: pl.DataFrame, df_constraints: pl.DataFrame, df_prices: pl.DataFrame, max_workers: Optional[int] = None, solver_options: Optional[SolverOptions] = None, constraints_to_ignore=None) -> pl.DataFrame:
+    """
+    1つの制約条件と食品データについて, 値段のシナリオごとの最適な組み合わせと費用を求める
+
+    モデルは一度だけ作成し, シナリオを連続した区間に分けてワーカーに割り当てる.
+    各ワーカーは区間の中で値段だけを変えて直前の基底から解き直すため, 似たシナリオは隣に並べておくと速い.
+    max_workers が1の場合はプロセスを起動せずに解く.
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame
+        df_prices (pl.DataFrame): food_name の列とシナリオごとの値段の列を持つ表
+        max_workers (int, optional): ワーカープロセス数. 指定がなければCPUコア数
+        solver_options (SolverOptions, optional): 求解器の選択と設定
+        constraints_to_ignore (list, optional): 無視する制約名のリスト
+
+    Returns:
+        pl.DataFrame: scenario, status, cost, iterations と, いずれかのシナリオで使う食品ごとの購入単位数の列を持つ, シナリオごとに1行の表
+    """
+    scenario_names, costs = scenario_costs(df_foods, df_prices)
+    # 値段はシナリオごとに置き換えるため, 食品データの cost が空欄でも最初のシナリオの値段でモデルを作成できる
+    model = build_diet_model(df_foods.with_columns(pl.Series("cost", costs[0])), df_constraints, constraints_to_ignore)
+    n_workers = min(max_workers or multiprocessing.cpu_count(), len(scenario_names))
+
+    if n_workers <= 1:
+        rows = _solve_scenarios(model, costs, solver_options)
+    else:
+        # Polarsのスレッドプールはforkに対応していないため, ワーカーはspawnで起動する
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = [executor.submit(_solve_scenarios, model, chunk, solver_options) for chunk in np.array_split(costs, n_workers)]
+            rows = [row for future in futures for row in future.result()]
+
+    units = np.vstack([row["units"] if row["units"] is not None else np.full(model.n_foods, np.nan) for row in rows])
+    used = np.flatnonzero((np.nan_to_num(units) > 0).any(axis=0))
+    df_summary = pl.DataFrame({
+        "scenario": scenario_names,
+        "status": [pulp.LpStatus[row["status"]] for row in rows],
+        "cost": [row["cost"] for row in rows],
+        "iterations": [row["iterations"] for row in rows],
+    }, schema={"scenario": pl.Utf8, "status": pl.Utf8, "cost": pl.Float64, "iterations": pl.Int64})
+    if len(used) == 0:
+        return df_summary
+    df_units = pl.DataFrame(units[:, used], schema=[model.col_names[j] for j in used.tolist()], orient="row")
+    return pl.concat([df_summary, df_units], how="horizontal")
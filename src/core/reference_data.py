@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+import polars as pl
+
+# ファイルの更新時刻を確認する最短間隔 (秒). この間隔内の呼び出しではstatも行わない
+CHECK_INTERVAL = 1.0
+
+@dataclass
+class ReferenceData:
+    """
+    食事摂取基準の参照テーブルを解析し, 検索用の辞書に展開したもの
+
+    values は (sex_code, age_band_id, life_code, nutrient_id, ref_code) をキーに,
+    基準値ファイルで最初に現れた行の値 (欠損はNone) を持つ.
+    """
+    df_age_bands: pl.DataFrame
+    df_nutrient_ids: pl.DataFrame
+    df_values: pl.DataFrame
+    age_bands: list[tuple[int, float, float]]
+    nutrient_ids: list[str]
+    nutrient_units: dict[str, str]
+    ref_codes: list[str]
+    values: dict[tuple[str, int, str, str, str], Optional[float]]
+
+    def find_age_band_id(self, age: float) -> Optional[int]:
+        for age_band_id, min_age, max_age in self.age_bands:
+            if min_age <= age < max_age:
+                return age_band_id
+        return None
+
+def read_values_table(values_dir: str, file_names: list[str]) -> pl.DataFrame:
+    """
+    values_dir以下の全ての基準値ファイルを読み込み, 1つのDataFrameにまとめる
+    """
+    list_of_dfs = []
+    for file_name in file_names:
+        file_path = f"{values_dir}{file_name}.csv"
+        try:
+            # schema_overrides で 'value' 列を浮動小数点型として指定
+            df_tmp = pl.read_csv(
+                file_path,
+                schema_overrides={'value': pl.Float64},
+            )
+            # コメント行を削除
+            df_tmp = df_tmp.filter(~pl.col("nutrient_id").str.starts_with("#"))
+            list_of_dfs.append(df_tmp)
+        except Exception as e:
+            print(f"Error reading {file_path}: {e}")
+
+    if not list_of_dfs:
+        return pl.DataFrame()
+    return pl.concat(list_of_dfs, how="vertical")
+
+def _load(age_bands_path: str, ref_types_path: str, nutrient_ids_path: str, values_dir: str, file_names: tuple[str, ...]) -> ReferenceData:
+    df_age_bands = pl.read_csv(age_bands_path)
+    df_nutrient_ids = pl.read_csv(nutrient_ids_path)
+    df_values = read_values_table(values_dir, list(file_names))
+
+    values = {}
+    if not df_values.is_empty():
+        for row in df_values.select("sex_code", "age_band_id", "life_code", "nutrient_id", "ref_code", "value").iter_rows():
+            values.setdefault(row[:5], row[5])
+
+    return ReferenceData(
+        df_age_bands=df_age_bands,
+        df_nutrient_ids=df_nutrient_ids,
+        df_values=df_values,
+        age_bands=list(df_age_bands.select("age_band_id", "min_age", "max_age").iter_rows()),
+        nutrient_ids=df_nutrient_ids["nutrient_id"].to_list(),
+        nutrient_units=dict(zip(df_nutrient_ids["nutrient_id"].to_list(), df_nutrient_ids["unit"].to_list())),
+        ref_codes=pl.read_csv(ref_types_path)["ref_code"].to_list(),
+        values=values,
+    )
+
+def _mtimes(paths: list[str]) -> tuple[Optional[float], ...]:
+    mtimes = []
+    for path in paths:
+        try:
+            mtimes.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
+# (読み込み設定) -> (ファイルの更新時刻, 最後に確認した時刻, ReferenceData)
+_CACHE: dict[tuple, tuple[tuple, float, ReferenceData]] = {}
+_LOCK = threading.Lock()
+
+def get_reference_data(age_bands_path: str, ref_types_path: str, nutrient_ids_path: str, values_dir: str, file_names: list[str]) -> ReferenceData:
+    """
+    参照テーブルをプロセス内で共有して返す
+
+    初回だけファイルを読み込み, 以降はキャッシュを返す.
+    CHECK_INTERVAL秒ごとに各ファイルの更新時刻を確認し, 変わっていれば読み直す.
+
+    Returns:
+        ReferenceData: 解析済みの参照テーブル
+    """
+    key = (age_bands_path, ref_types_path, nutrient_ids_path, values_dir, tuple(file_names))
+    now = time.monotonic()
+    with _LOCK:
+        cached = _CACHE.get(key)
+        if cached is not None and now - cached[1] < CHECK_INTERVAL:
+            return cached[2]
+
+        paths = [age_bands_path, ref_types_path, nutrient_ids_path] + [f"{values_dir}{file_name}.csv" for file_name in file_names]
+        mtimes = _mtimes(paths)
+        if cached is not None and cached[0] == mtimes:
+            _CACHE[key] = (mtimes, now, cached[2])
+            return cached[2]
+
+        reference_data = _load(*key)
+        _CACHE[key] = (mtimes, now, reference_data)
+        return reference_data
+
+def clear_reference_data_cache():
+    """キャッシュを破棄し, 次回の呼び出しでファイルを読み直す"""
+    with _LOCK:
+        _CACHE.clear()
@@ -0,0 +1,241 @@
+import time
+from dataclasses import dataclass, field, replace
+from itertools import combinations
+from typing import Callable, Optional
+import numpy as np
+import pulp
+from core.model_builder import DietModel, DietSolution, add_elastic_slacks
+from core.options import SearchBudget
+from core.persistent_model import PersistentDietModel
+
+# 探索を打ち切った理由
+STOP_COMPLETE = "complete"
+STOP_TIME_LIMIT = "time_limit"
+STOP_MAX_SOLVES = "max_solves"
+STOP_CANCELLED = "cancelled"
+
+@dataclass
+class SearchProgress:
+    """
+    1回の求解ごとに progress_callback へ渡す途中経過
+
+    phase: "initial" (全ての制約), "elastic" (弾性LP), "restore" (外した制約を1つずつ戻す), "smaller" (より少ない組み合わせ)
+    relaxed_constraints: この求解で外した制約
+    best_relaxed_constraints: これまでに解が見つかった中で最も少ない緩和. まだ無ければNone
+    """
+    phase: str
+    n_solves: int
+    elapsed: float
+    status: int
+    relaxed_constraints: list[str]
+    best_relaxed_constraints: Optional[list[str]]
+    improved: bool = False
+
+@dataclass
+class RelaxationSearchResult:
+    """
+    制約の緩和の探索結果
+
+    solution: 最良の緩和での最適解. 見つからなければNone
+    relaxed_constraints: 外した制約. 解が見つかる前に打ち切った場合は, 弾性LPで違反が生じた制約 (外せば解がある集合)
+    n_not_solved: 求解器の制限時間で打ち切られた求解の回数. 0より大きければ, 解が無いとした組み合わせにも解がありうる
+    stop_reason: "complete" は探索を終えたこと, それ以外は上限に達して途中の最良の結果を返したことを表す
+    """
+    solution: Optional[DietSolution]
+    status: int
+    relaxed_constraints: list[str] = field(default_factory=list)
+    scores: dict[str, float] = field(default_factory=dict)
+    n_solves: int = 0
+    n_not_solved: int = 0
+    elapsed: float = 0.0
+    stop_reason: str = STOP_COMPLETE
+
+class _BudgetExhausted(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+def bound_distances(model: DietModel) -> dict[str, float]:
+    """
+    各制約について, 他の制約を全て外しても届かない量を制約値に対する相対値で求める
+
+    食品ごとの購入単位数の上下限だけから, 各栄養素の総摂取量がとりうる最大値と最小値を求め,
+    Min_ の制約値が最大値を超える量, Max_ の制約値が最小値を下回る量を返す.
+    0より大きい制約は単独でも満たせないため, どの緩和にも含める必要がある. 求解は行わない.
+    """
+    positive, negative = np.maximum(model.matrix, 0.0), np.minimum(model.matrix, 0.0)
+    with np.errstate(invalid="ignore"):
+        # 0 * inf は nan になるため, 係数が0の項は0として扱う
+        upper_terms = np.where(model.matrix != 0, positive * model.col_upper[:, None] + negative * model.col_lower[:, None], 0.0)
+        lower_terms = np.where(model.matrix != 0, positive * model.col_lower[:, None] + negative * model.col_upper[:, None], 0.0)
+    achievable_max = upper_terms.sum(axis=0)
+    achievable_min = lower_terms.sum(axis=0)
+
+    distances = {}
+    for i, nutrient_id in enumerate(model.row_names):
+        lower, upper = model.row_lower[i], model.row_upper[i]
+        if np.isfinite(lower):
+            distances[f"Min_{nutrient_id}"] = max(0.0, lower - achievable_max[i]) / (abs(lower) or 1.0)
+        if np.isfinite(upper):
+            distances[f"Max_{nutrient_id}"] = max(0.0, achievable_min[i] - upper) / (abs(upper) or 1.0)
+    return distances
+
+class _RelaxationSearch:
+    def __init__(self, persistent_model: PersistentDietModel, budget: SearchBudget, penalty_weights, progress_callback, cancel_event):
+        self.persistent_model = persistent_model
+        self.budget = budget
+        self.penalty_weights = penalty_weights
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        self.start_time = time.perf_counter()
+        # 元の制限時間は探索のあとで戻す
+        self.solver_time_limit = persistent_model.options.time_limit
+        self.n_solves = 0
+        self.n_not_solved = 0
+        self.best: Optional[tuple[DietSolution, list[str]]] = None
+        self.fallback: list[str] = []
+        self.tried: set[frozenset] = set()
+        self.scores: dict[str, float] = {}
+
+    def _remaining_time(self) -> Optional[float]:
+        """残り時間. 探索の制限時間と求解器の制限時間のうち短い方"""
+        limits = [limit for limit in (self.solver_time_limit,) if limit is not None]
+        if self.budget.time_limit is not None:
+            limits.append(self.budget.time_limit - (time.perf_counter() - self.start_time))
+        return min(limits) if limits else None
+
+    def _check_budget(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise _BudgetExhausted(STOP_CANCELLED)
+        if self.budget.max_solves is not None and self.n_solves >= self.budget.max_solves:
+            raise _BudgetExhausted(STOP_MAX_SOLVES)
+        if self.budget.time_limit is not None and time.perf_counter() - self.start_time >= self.budget.time_limit:
+            raise _BudgetExhausted(STOP_TIME_LIMIT)
+
+    def _finish_solve(self, phase: str, solution: DietSolution, relaxed_constraints: list[str], improved: bool = False):
+        self.n_solves += 1
+        self.n_not_solved += solution.status == pulp.LpStatusNotSolved
+        if self.progress_callback is not None:
+            self.progress_callback(SearchProgress(
+                phase=phase,
+                n_solves=self.n_solves,
+                elapsed=time.perf_counter() - self.start_time,
+                status=solution.status,
+                relaxed_constraints=relaxed_constraints,
+                best_relaxed_constraints=None if self.best is None else self.best[1],
+                improved=improved,
+            ))
+        # 制限時間で打ち切られた求解は, 実行不可能とは区別して探索を終える
+        if solution.status == pulp.LpStatusNotSolved and self.budget.time_limit is not None:
+            raise _BudgetExhausted(STOP_TIME_LIMIT)
+
+    def _try(self, phase: str, relaxed_constraints: list[str]) -> Optional[DietSolution]:
+        """relaxed_constraints を外して解き, 最良の緩和より少なければ更新する. 試したことのある組み合わせは解かない"""
+        key = frozenset(relaxed_constraints)
+        if key in self.tried:
+            return None
+        self.tried.add(key)
+        self._check_budget()
+        self.persistent_model.set_time_limit(self._remaining_time())
+        self.persistent_model.set_active_constraints(relaxed_constraints)
+        solution = self.persistent_model.solve()
+        improved = solution.status == pulp.LpStatusOptimal and (self.best is None or len(relaxed_constraints) < len(self.best[1]))
+        if improved:
+            self.best = (solution, list(relaxed_constraints))
+        self._finish_solve(phase, solution, relaxed_constraints, improved)
+        return solution if solution.status == pulp.LpStatusOptimal else None
+
+    def _elastic_violations(self) -> Optional[dict[str, float]]:
+        """全ての制約に相対違反量のスラックを加えた弾性LPを解き, 違反が生じた制約を返す"""
+        self._check_budget()
+        model = self.persistent_model.model
+        elastic_model, slack_names, slack_scales = add_elastic_slacks(model, self.penalty_weights)
+        options = replace(self.persistent_model.options, time_limit=self._remaining_time())
+        solution = PersistentDietModel(elastic_model, options).solve()
+        self._finish_solve("elastic", solution, [])
+        if solution.status != pulp.LpStatusOptimal:
+            return None
+        relative_violations = solution.values[model.n_cols:] / slack_scales
+        return {name: float(v) for name, v in zip(slack_names, relative_violations) if v > 1e-7}
+
+    def run(self) -> str:
+        # --- 全ての制約 ---
+        if self._try("initial", []) is not None:
+            return STOP_COMPLETE
+
+        # --- 弾性LPで違反が必要な制約と, 単独でも満たせない制約を外す ---
+        distances = bound_distances(self.persistent_model.model)
+        forced = [name for name, distance in distances.items() if distance > 0]
+        violations = self._elastic_violations()
+        if violations is None:
+            # 食品の摂取量の上下限だけで実行不可能な場合は, どの制約を外しても解は無い
+            return STOP_COMPLETE
+        # 安く求めた違反量の目安. 大きいほど外す必要がある可能性が高い
+        self.scores = {name: distances[name] + violations.get(name, 0.0) for name in distances}
+        candidate = sorted(set(violations) | set(forced), key=self.scores.get, reverse=True)
+        self.fallback = candidate
+        self._try("restore", candidate)
+
+        # --- 違反量の小さい制約から1つずつ戻す ---
+        if self.best is not None:
+            for constraint_name in sorted(self.best[1], key=self.scores.get):
+                if constraint_name in forced:
+                    continue
+                self._try("restore", [name for name in self.best[1] if name != constraint_name])
+
+        # --- より少ない個数の組み合わせを, 目安の大きい制約を含むものから試す ---
+        pool = sorted((name for name in self.scores if name not in forced), key=self.scores.get, reverse=True)
+        upper = len(self.best[1]) if self.best is not None else len(forced) + len(pool) + 1
+        for k in range(len(forced), upper):
+            for combination in combinations(pool, k - len(forced)):
+                if self._try("smaller", forced + list(combination)) is not None:
+                    return STOP_COMPLETE
+        return STOP_COMPLETE
+
+def search_relaxation(persistent_model: PersistentDietModel, budget: Optional[SearchBudget] = None, penalty_weights: Optional[dict] = None, progress_callback: Optional[Callable[[SearchProgress], None]] = None, cancel_event=None) -> RelaxationSearchResult:
+    """
+    制約を外す組み合わせを, 時間と求解回数の上限の範囲で探し, その時点で最も少ない緩和を返す (anytime探索)
+
+    1. 全ての制約で解く.
+    2. 求解を伴わない目安として, 食品の上下限だけから各制約の届かない量 (bound_distances) を求める. 0より大きい制約は常に外す.
+       弾性LPで違反が生じた制約とあわせて外して解き, 最初の解とする. 目安の値は, この2つの相対違反量の和とする.
+    3. 目安の小さい制約から1つずつ戻し, 解が残る限り緩和を減らす.
+    4. より少ない個数の組み合わせを目安の大きい制約を含むものから順に試し, 見つかればそれが最も少ない緩和になる.
+
+    上限に達するか cancel_event がセットされた時点で探索をやめ, それまでの最良の緩和を返す.
+    予算を指定しなければ最も少ない個数の緩和が確定するまで探す. 外す制約の個数は -r exhaustive と同じになるが,
+    同じ個数の組み合わせが複数ある場合は, 外す制約そのものは異なることがある.
+
+    Args:
+        persistent_model (PersistentDietModel): 全ての制約を持つモデル. 探索後は最良の緩和の状態になる
+        budget (SearchBudget, optional): 制限時間と求解回数の上限
+        penalty_weights (dict, optional): 弾性LPの制約違反に対する重み
+        progress_callback (callable, optional): 各求解のあとに SearchProgress を受け取る関数
+        cancel_event (threading.Event, optional): セットされると次の求解の前に探索をやめる. is_set() を持つオブジェクトであればよい
+
+    Returns:
+        RelaxationSearchResult: 最良の緩和とその解, 打ち切った理由
+    """
+    search = _RelaxationSearch(persistent_model, budget or SearchBudget(), penalty_weights, progress_callback, cancel_event)
+    try:
+        stop_reason = search.run()
+    except _BudgetExhausted as e:
+        stop_reason = e.reason
+    finally:
+        persistent_model.set_time_limit(search.solver_time_limit)
+
+    result = RelaxationSearchResult(
+        solution=None,
+        status=pulp.LpStatusInfeasible if stop_reason == STOP_COMPLETE else pulp.LpStatusNotSolved,
+        relaxed_constraints=search.fallback,
+        scores=search.scores,
+        n_solves=search.n_solves,
+        n_not_solved=search.n_not_solved,
+        elapsed=time.perf_counter() - search.start_time,
+        stop_reason=stop_reason,
+    )
+    if search.best is not None:
+        result.solution, result.relaxed_constraints = search.best
+        result.status = result.solution.status
+        persistent_model.set_active_constraints(result.relaxed_constraints)
+    return result
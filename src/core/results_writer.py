@@ -0,0 +1,90 @@
+import os
+import numpy as np
+import polars as pl
+from core.model_builder import food_costs
+from core.options import RESULT_FORMATS
+
+# 食品データのうち栄養素ではない列
+FOOD_INFO_COLUMNS = ["food_name", "amount", "min", "max", "unit", "cost"]
+TOTAL_LABEL = "total"
+ACHIEVEMENT_LABEL = "achievement_rate (%)"
+
+def build_results_frame(df_foods: pl.DataFrame, food_units: np.ndarray, df_constraints: pl.DataFrame) -> pl.DataFrame:
+    """
+    食品ごとの購入単位数から, 使用する食品ごとの費用・量・栄養素の行と, 合計の行, 達成率の行を持つ結果を作成する
+
+    food_units は df_foods の行と同じ順序の配列で, 食品名を介さずに行番号で対応させる.
+    栄養素の合計は, 使用する食品の栄養素の行列と購入単位数の積として一度に求める.
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        food_units (np.ndarray): 食品ごとの購入単位数
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame. 下限に対する達成率の計算に使う
+
+    Returns:
+        pl.DataFrame: food_name, cost, amount, unit と栄養素の列を持つ結果
+    """
+    nutrient_columns = [col for col in df_foods.columns if col not in FOOD_INFO_COLUMNS]
+    schema = {"food_name": pl.Utf8, "cost": pl.Float64, "amount": pl.Utf8, "unit": pl.Utf8, **{col: pl.Float64 for col in nutrient_columns}}
+
+    units = np.asarray(food_units, dtype=float)
+    used = np.flatnonzero(units > 0)
+    used_units = units[used]
+    df_used = df_foods[used.tolist()]
+    matrix = df_used.select(pl.col(nutrient_columns).cast(pl.Float64, strict=False).fill_null(0.0)).to_numpy()
+    matrix = matrix.reshape(len(used), len(nutrient_columns))
+    cost = food_costs(df_used) * used_units
+    amount = used_units * df_used["amount"].cast(pl.Float64, strict=False).fill_null(0.0).to_numpy()
+    totals = used_units @ matrix
+
+    df_lines = pl.DataFrame({
+        "food_name": df_used["food_name"],
+        "cost": cost,
+        "amount": np.char.mod("%.2f", amount).tolist() if len(used) > 0 else [],
+        "unit": df_used["unit"].cast(pl.Utf8),
+        **{col: matrix[:, i] * used_units for i, col in enumerate(nutrient_columns)},
+    }, schema=schema)
+    df_total = pl.DataFrame(
+        [{"food_name": TOTAL_LABEL, "cost": float(cost.sum()), "amount": "", "unit": "", **dict(zip(nutrient_columns, totals.tolist()))}],
+        schema=schema
+    )
+
+    # 下限のある栄養素について, 合計の下限に対する割合を求める
+    lower = pl.DataFrame({"nutrient_id": nutrient_columns}, schema={"nutrient_id": pl.Utf8}).join(
+        df_constraints.select(pl.col("nutrient_id").cast(pl.Utf8), pl.col("lower").cast(pl.Float64, strict=False)),
+        on="nutrient_id", how="left", maintain_order="left"
+    )["lower"].fill_null(np.nan).to_numpy()
+    has_lower = np.isfinite(lower) & (lower != 0)
+    rates = np.divide(totals, lower, out=np.full(len(nutrient_columns), np.nan), where=has_lower) * 100
+    df_rate = pl.DataFrame(
+        [{"food_name": ACHIEVEMENT_LABEL, "cost": None, "amount": None, "unit": None,
+          **{col: rate if ok else None for col, rate, ok in zip(nutrient_columns, rates.tolist(), has_lower.tolist())}}],
+        schema=schema
+    )
+    return pl.concat([df_lines, df_total, df_rate])
+
+def result_paths(output_path: str, formats=("csv",)) -> dict[str, str]:
+    """出力形式ごとのファイルパス. 拡張子だけを置き換える"""
+    stem = os.path.splitext(output_path)[0]
+    return {fmt: f"{stem}.{fmt}" for fmt in formats}
+
+def write_results(df_results: pl.DataFrame, output_path: str, formats=("csv",)) -> list[str]:
+    """
+    結果をCSV, Parquet, JSONの指定された形式で書き出す
+
+    Returns:
+        list[str]: 書き出したファイルのパス
+    """
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    paths = []
+    for fmt, path in result_paths(output_path, formats).items():
+        if fmt == "csv":
+            df_results.write_csv(path)
+        elif fmt == "parquet":
+            df_results.write_parquet(path)
+        elif fmt == "json":
+            df_results.write_json(path)
+        else:
+            raise ValueError(f"未対応の出力形式です: {fmt} (使用可能: {', '.join(RESULT_FORMATS)})")
+        paths.append(path)
+    return paths
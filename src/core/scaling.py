@@ -0,0 +1,96 @@
+from dataclasses import dataclass, replace
+from typing import Optional
+import numpy as np
+from core.model_builder import DietModel
+
+# 行と列の幾何平均スケーリングを交互に行う回数
+SCALING_PASSES = 4
+
+@dataclass
+class ModelScaling:
+    """
+    行 (栄養素) と列 (食品) のスケーリング係数
+
+    スケーリングした問題は x = col_scale * x' と置き換え, 各行に row_scale を掛けたものになる.
+
+        min  (cost * col_scale)^T x'
+        s.t. row_scale * row_lower <= diag(row_scale) matrix^T diag(col_scale) x' <= row_scale * row_upper
+
+    係数は2のべき乗に丸めるため, 掛けても割っても仮数部は変わらず, 元の単位に戻すときに誤差が生じない.
+    """
+    row_scale: np.ndarray
+    col_scale: np.ndarray
+
+    @classmethod
+    def identity(cls, model: DietModel) -> "ModelScaling":
+        return cls(np.ones(model.n_rows), np.ones(model.n_cols))
+
+    @property
+    def is_identity(self) -> bool:
+        return bool(np.all(self.row_scale == 1.0) and np.all(self.col_scale == 1.0))
+
+    def scale_model(self, model: DietModel) -> DietModel:
+        """スケーリングした問題を返す. 列名・行名と食品数は元の問題と同じ"""
+        if self.is_identity:
+            return model
+        return replace(
+            model,
+            cost=model.cost * self.col_scale,
+            col_lower=model.col_lower / self.col_scale,
+            col_upper=model.col_upper / self.col_scale,
+            row_lower=model.row_lower * self.row_scale,
+            row_upper=model.row_upper * self.row_scale,
+            matrix=model.matrix * self.col_scale[:, None] * self.row_scale[None, :],
+        )
+
+    def unscale_values(self, values: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        """スケーリングした問題の列の値を, 元の購入単位数に戻す"""
+        return None if values is None else np.asarray(values, dtype=float) * self.col_scale
+
+    def unscale_row_values(self, row_values: np.ndarray) -> np.ndarray:
+        """行の値 (栄養素の総摂取量) を元の単位に戻す"""
+        return np.asarray(row_values, dtype=float) / self.row_scale
+
+    def unscale_row_duals(self, row_duals: np.ndarray) -> np.ndarray:
+        """行の双対価格を, 元の単位の制約値1あたりの費用に戻す"""
+        return np.asarray(row_duals, dtype=float) * self.row_scale
+
+    def unscale_col_duals(self, col_duals: np.ndarray) -> np.ndarray:
+        """被約費用を, 元の購入単位数1あたりの費用に戻す"""
+        return np.asarray(col_duals, dtype=float) / self.col_scale
+
+def coefficient_range(matrix: np.ndarray) -> float:
+    """非ゼロ係数の絶対値の最大と最小の比. 大きいほど数値的に扱いにくい"""
+    nonzero = np.abs(matrix[matrix != 0])
+    return float(nonzero.max() / nonzero.min()) if len(nonzero) else 1.0
+
+def _geometric_mean_exponents(log_matrix: np.ndarray, nonzero: np.ndarray, axis: int) -> np.ndarray:
+    # 非ゼロ係数の最大と最小の幾何平均が1になる (log2で0になる) ような指数. 非ゼロ係数の無い行・列は0
+    largest = np.where(nonzero, log_matrix, -np.inf).max(axis=axis)
+    smallest = np.where(nonzero, log_matrix, np.inf).min(axis=axis)
+    return np.where(np.isfinite(largest), -(largest + smallest) / 2, 0.0)
+
+def compute_scaling(model: DietModel, passes: int = SCALING_PASSES) -> ModelScaling:
+    """
+    行と列の幾何平均スケーリングの係数を求める
+
+    各列・各行の非ゼロ係数の最大と最小の幾何平均が1になるように, 列と行を交互に passes 回スケーリングする.
+    µg と kcal のような単位の違いも行のスケーリングでそろうため, nutrient_ids.csv の単位は使わない
+    (行の幾何平均スケーリングは事前に行に掛けた倍率を打ち消すため, 単位の換算を加えても結果は変わらない).
+    スラック列のように係数が1つしかない列は, その係数が1になる.
+
+    Args:
+        model (DietModel): 最適化問題
+        passes (int): 行と列のスケーリングを交互に行う回数
+
+    Returns:
+        ModelScaling: 2のべき乗に丸めたスケーリング係数
+    """
+    nonzero = model.matrix != 0
+    log_matrix = np.log2(np.abs(np.where(nonzero, model.matrix, 1.0)))
+    row_exponents = np.zeros(model.n_rows)
+    col_exponents = np.zeros(model.n_cols)
+    for _ in range(passes):
+        col_exponents = _geometric_mean_exponents(log_matrix + row_exponents[None, :], nonzero, axis=1)
+        row_exponents = _geometric_mean_exponents(log_matrix + col_exponents[:, None], nonzero, axis=0)
+    return ModelScaling(np.exp2(np.round(row_exponents)), np.exp2(np.round(col_exponents)))
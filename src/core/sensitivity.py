@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+import polars as pl
+import pulp
+from core.persistent_model import PersistentDietModel
+
+# 制約が効いている (上下限に張り付いている) とみなす双対価格の大きさ
+DUAL_TOLERANCE = 1e-9
+
+@dataclass
+class SensitivityReport:
+    """
+    1回の求解から得られる感度分析の結果
+
+    df_constraints: 制約ごとの双対価格 (制約値を1増やしたときの最小費用の変化量) と, その値が変わらない制約値の範囲
+    df_foods: 食品ごとの購入単位数, 被約費用, 最適な組み合わせが変わらない値段の範囲
+    """
+    status: int
+    objective: Optional[float]
+    df_constraints: Optional[pl.DataFrame] = None
+    df_foods: Optional[pl.DataFrame] = None
+
+def _finite_or_none(values) -> list[Optional[float]]:
+    return [float(v) if np.isfinite(v) else None for v in values]
+
+def analyze_sensitivity(df_foods: pl.DataFrame, df_constraints: pl.DataFrame, constraints_to_ignore=None, persistent_model: Optional[PersistentDietModel] = None) -> SensitivityReport:
+    """
+    最適化問題を1回解き, 双対価格・被約費用・値段の範囲 (コストレンジング) を求める
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame
+        constraints_to_ignore (list, optional): 無視する制約名のリスト
+        persistent_model (PersistentDietModel, optional): 既に作成したモデル. 指定すると現在の基底から再求解する
+
+    Returns:
+        SensitivityReport: 感度分析の結果. 最適解が無い場合は status と objective=None だけを持つ
+    """
+    if persistent_model is None:
+        persistent_model = PersistentDietModel.from_frames(df_foods, df_constraints)
+    persistent_model.set_active_constraints(constraints_to_ignore or [])
+    solution = persistent_model.solve()
+    if solution.status != pulp.LpStatusOptimal:
+        return SensitivityReport(solution.status, None)
+
+    model = persistent_model.model
+    highs = persistent_model.highs
+    row_dual = persistent_model.row_duals()
+    row_value = persistent_model.row_values()
+    col_dual = persistent_model.reduced_costs()
+    _, ranging = highs.getRanging()
+    # 範囲はHiGHSに渡した問題の単位なので, スケーリングした場合は元の単位に戻す
+    row_scale, col_scale = persistent_model.scaling.row_scale, persistent_model.scaling.col_scale
+
+    # 下限に張り付いた行の双対価格は正, 上限に張り付いた行は負になる
+    constraint_rows = []
+    inactive = set(persistent_model.inactive_constraints)
+    for i, nutrient_id in enumerate(model.row_names):
+        for prefix, bound, sign in (("Min", model.row_lower[i], 1.0), ("Max", model.row_upper[i], -1.0)):
+            if not np.isfinite(bound):
+                continue
+            constraint_name = f"{prefix}_{nutrient_id}"
+            is_active = constraint_name not in inactive
+            shadow_price = float(row_dual[i]) if is_active and sign * row_dual[i] > DUAL_TOLERANCE else 0.0
+            is_binding = shadow_price != 0.0
+            constraint_rows.append({
+                "constraint": constraint_name,
+                "nutrient_id": nutrient_id,
+                "bound": float(bound),
+                "value": float(row_value[i]),
+                "shadow_price": shadow_price,
+                "is_binding": is_binding,
+                "is_ignored": not is_active,
+                "range_lower": _finite_or_none([ranging.row_bound_dn.value_[i] / row_scale[i]])[0] if is_binding else None,
+                "range_upper": _finite_or_none([ranging.row_bound_up.value_[i] / row_scale[i]])[0] if is_binding else None,
+            })
+
+    n_foods = model.n_foods
+    df_food_sensitivity = pl.DataFrame({
+        "food_name": model.col_names[:n_foods],
+        "units": solution.food_units,
+        "cost": model.cost[:n_foods],
+        "reduced_cost": col_dual[:n_foods],
+        "cost_lower": _finite_or_none(np.asarray(ranging.col_cost_dn.value_)[:n_foods] / col_scale[:n_foods]),
+        "cost_upper": _finite_or_none(np.asarray(ranging.col_cost_up.value_)[:n_foods] / col_scale[:n_foods]),
+    }, schema_overrides={"cost_lower": pl.Float64, "cost_upper": pl.Float64})
+
+    return SensitivityReport(
+        status=solution.status,
+        objective=solution.objective,
+        df_constraints=pl.DataFrame(constraint_rows, schema_overrides={"range_lower": pl.Float64, "range_upper": pl.Float64}),
+        df_foods=df_food_sensitivity,
+    )
+
+def parametric_sweep(df_foods: pl.DataFrame, df_constraints: pl.DataFrame, parameter: str, values, constraints_to_ignore=None, persistent_model: Optional[PersistentDietModel] = None) -> pl.DataFrame:
+    """
+    制約値または食品の値段を values の順に変えながら再求解する
+
+    モデルは一度だけ作成し, 各点では上下限または目的関数の係数だけを変更して直前の基底から解き直す.
+
+    Args:
+        df_foods (pl.DataFrame): 食品データのDataFrame
+        df_constraints (pl.DataFrame): 栄養素制約のDataFrame
+        parameter (str): 変化させる制約名 (例: 'Min_energy') または 'cost:食品名'
+        values (list[float]): 制約値または値段の列
+        constraints_to_ignore (list, optional): 無視する制約名のリスト
+
+    Returns:
+        pl.DataFrame: value, status, objective, shadow_price (制約の場合), iterations の列を持つ結果
+    """
+    if persistent_model is None:
+        persistent_model = PersistentDietModel.from_frames(df_foods, df_constraints)
+    persistent_model.set_active_constraints(constraints_to_ignore or [])
+
+    is_cost = parameter.startswith("cost:")
+    if is_cost:
+        food_name = parameter.removeprefix("cost:")
+        col = persistent_model.model.col_names.index(food_name) if food_name in persistent_model.model.col_names else None
+        if col is None:
+            raise KeyError(f"食品が見つかりません: {food_name}")
+        original = float(persistent_model.model.cost[col])
+    else:
+        row = persistent_model.model.row_names.index(parameter.partition("_")[2]) if parameter in persistent_model.constraint_names else None
+        if row is None:
+            raise KeyError(f"制約が見つかりません: {parameter}")
+        original = float(persistent_model.model.row_lower[row] if parameter.startswith("Min_") else persistent_model.model.row_upper[row])
+
+    rows = []
+    try:
+        for value in values:
+            if is_cost:
+                persistent_model.set_cost(col, value)
+            else:
+                persistent_model.set_bound(parameter, value)
+            solution = persistent_model.solve()
+            shadow_price = None
+            if not is_cost and solution.status == pulp.LpStatusOptimal:
+                shadow_price = float(persistent_model.row_duals()[row])
+            rows.append({
+                "value": float(value),
+                "status": pulp.LpStatus[solution.status],
+                "objective": solution.objective,
+                "shadow_price": shadow_price,
+                "iterations": persistent_model.highs.getInfo().simplex_iteration_count,
+            })
+    finally:
+        # 他の解析で同じモデルを使えるよう元の値に戻す
+        if is_cost:
+            persistent_model.set_cost(col, original)
+        else:
+            persistent_model.set_bound(parameter, original)
+    return pl.DataFrame(rows, schema_overrides={"objective": pl.Float64, "shadow_price": pl.Float64})
@@ -0,0 +1,432 @@
+import asyncio
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import re
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field, replace
+from typing import Optional, get_args
+import polars as pl
+import pulp
+from core.batch_optimizer import foods_path
+from core.nutrients_calculator import NutrientsCalculator, UserProfile
+from core.optimizer import find_optimal_solution_iteratively
+from core.options import RELAXATION_METHODS, SearchBudget, SolverOptions
+from core.results_writer import build_results_frame
+
+MAX_BODY_BYTES = 1024 * 1024
+# 直近の処理時間をいくつまで保持して百分位数を求めるか
+LATENCY_WINDOW = 1000
+# 制限時間の指定が無い anytime の探索に使う, request_timeout に対する割合. 残りは結果の作成と応答に使う
+SEARCH_TIME_FRACTION = 0.8
+# profile で受け付ける区分の値と, 数値で指定する項目 (項目名 -> 0を許すか)
+_PROFILE_CODES = {name: get_args(UserProfile.__annotations__[name]) for name in ("sex_code", "life_code")}
+_PROFILE_NUMBERS = {"weight": False, "height": False, "age": True, "activity_level": False}
+_FOOD_SET_PATTERN = re.compile(r"^[\w\-]+$")
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+# ワーカープロセスで保持する食品データ (設定名2 -> DataFrame)
+_FOOD_SETS: dict[str, pl.DataFrame] = {}
+
+@dataclass
+class ServiceConfig:
+    """
+    最適化サービスの設定
+
+    workers: 最適化を実行するワーカープロセス数. 指定がなければCPUコア数
+    max_concurrency: 同時にワーカーへ渡すリクエスト数の上限. 指定がなければ workers と同じ
+    max_queue: 空きを待つリクエスト数の上限. 超えた場合は503を返す
+    request_timeout: 1件の最適化の制限時間 (秒). 超えた場合は504を返す
+    preload_food_sets: 起動時に各ワーカーへ読み込んでおく食品データの設定名2
+    search_budget: method="anytime" の制限時間と求解回数の上限. 制限時間が無ければ request_timeout の SEARCH_TIME_FRACTION 倍を使い,
+        制限時間内に見つかった最良の緩和で応答する
+    """
+    host: str = "127.0.0.1"
+    port: int = 8080
+    workers: Optional[int] = None
+    max_concurrency: Optional[int] = None
+    max_queue: int = 100
+    request_timeout: Optional[float] = 60.0
+    preload_food_sets: list[str] = field(default_factory=list)
+    method: str = "elastic"
+    solver_options: SolverOptions = field(default_factory=SolverOptions)
+    search_budget: SearchBudget = field(default_factory=SearchBudget)
+
+    def effective_search_budget(self) -> SearchBudget:
+        if self.search_budget.time_limit is None and self.request_timeout is not None:
+            return replace(self.search_budget, time_limit=self.request_timeout * SEARCH_TIME_FRACTION)
+        return self.search_budget
+
+class LatencyStats:
+    """直近 LATENCY_WINDOW 件の処理時間から百分位数を求める"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self._recent = deque(maxlen=LATENCY_WINDOW)
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self._recent.append(value)
+
+    def snapshot(self) -> dict:
+        if not self._recent:
+            return {"count": self.count}
+        recent = sorted(self._recent)
+        percentile = lambda q: recent[min(len(recent) - 1, int(q * len(recent)))]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count,
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": recent[-1],
+        }
+
+@dataclass
+class ServiceMetrics:
+    """リクエスト数, 待ち行列の長さ, 処理時間の集計"""
+    started_at: float = field(default_factory=time.time)
+    n_requests: int = 0
+    n_rejected: int = 0
+    n_timeouts: int = 0
+    n_errors: int = 0
+    queued: int = 0
+    in_flight: int = 0
+    statuses: Counter = field(default_factory=Counter)
+    queue_wait: LatencyStats = field(default_factory=LatencyStats)
+    solve: LatencyStats = field(default_factory=LatencyStats)
+    total: LatencyStats = field(default_factory=LatencyStats)
+
+    def snapshot(self) -> dict:
+        return {
+            "uptime": time.time() - self.started_at,
+            "requests": self.n_requests,
+            "rejected": self.n_rejected,
+            "timeouts": self.n_timeouts,
+            "errors": self.n_errors,
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "statuses": dict(self.statuses),
+            "latency": {"queue_wait": self.queue_wait.snapshot(), "solve": self.solve.snapshot(), "total": self.total.snapshot()},
+        }
+
+def _load_food_set(food_set: str) -> pl.DataFrame:
+    if not isinstance(food_set, str) or not _FOOD_SET_PATTERN.match(food_set):
+        raise ValueError(f"食品データの設定名が不正です: {food_set}")
+    if food_set not in _FOOD_SETS:
+        path = foods_path(food_set)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"食品データが見つかりません: {food_set}")
+        _FOOD_SETS[food_set] = pl.read_csv(path)
+    return _FOOD_SETS[food_set]
+
+def _init_worker(food_sets: list[str]):
+    # 基準値の表と食品データを読み込んでおき, 最初のリクエストから読み込み時間がかからないようにする
+    NutrientsCalculator.reference_data()
+    for food_set in food_sets:
+        _load_food_set(food_set)
+
+def _ready() -> int:
+    return os.getpid()
+
+def _request_profile(profile) -> UserProfile:
+    """
+    リクエストの profile を検証して UserProfile にする
+
+    NutrientsCalculator は区分の値を検証しないため, 不正な値はここで ValueError にして400を返す
+    (そのまま渡すとワーカー内で AttributeError などになり, 500として数えられてしまう).
+    """
+    if not isinstance(profile, dict):
+        raise ValueError("profile はオブジェクトで指定してください。")
+    user = UserProfile(**profile)
+    for name, codes in _PROFILE_CODES.items():
+        if getattr(user, name) not in codes:
+            raise ValueError(f"{name} には {list(codes)} のいずれかを指定してください: {getattr(user, name)!r}")
+    for name, allow_zero in _PROFILE_NUMBERS.items():
+        value = getattr(user, name)
+        if not _is_number(value) or value < 0 or (value == 0 and not allow_zero):
+            raise ValueError(f"{name} には{'0以上' if allow_zero else '正'}の数を指定してください: {value!r}")
+    return user
+
+def _request_constraint_rows(constraints) -> list[dict]:
+    """
+    リクエストの constraints を検証して nutrient_id, lower, upper の行にする
+
+    lower, upper は省略または null で制約なしとする. unit など他の項目は使わない.
+    Polarsに渡す前に型を確かめ, 不正な値は ValueError にして400を返す.
+    """
+    if not isinstance(constraints, list) or not all(isinstance(row, dict) for row in constraints):
+        raise ValueError("constraints は {nutrient_id, lower, upper} のオブジェクトのリストで指定してください。")
+    rows = []
+    for row in constraints:
+        if not isinstance(row.get("nutrient_id"), str):
+            raise ValueError(f"constraints の nutrient_id は文字列で指定してください: {row!r}")
+        for name in ("lower", "upper"):
+            if row.get(name) is not None and not _is_number(row[name]):
+                raise ValueError(f"constraints の {name} には数または null を指定してください: {row!r}")
+        rows.append({"nutrient_id": row["nutrient_id"], "lower": row.get("lower"), "upper": row.get("upper")})
+    return rows
+
+def _is_number(value) -> bool:
+    # JSONの true/false は数として扱わない
+    return not isinstance(value, bool) and isinstance(value, (int, float)) and math.isfinite(value)
+
+def _request_search(payload: dict, method: str, search_budget: SearchBudget) -> tuple[str, SearchBudget]:
+    """
+    リクエストの method, search_time, max_solves を検証し, サービスの上限を超えない緩和方法と探索の上限を返す
+
+    リクエストで上限を広げたり外したりすると, 504のあとも探索を続けるワーカーで同時実行数の枠が埋まるため,
+    search_time と max_solves はサービスの上限以下に抑え, 上限の無い "exhaustive" はサービスがその方法で起動した場合だけ受け付ける.
+    """
+    request_method = payload.get("method", method)
+    if request_method not in RELAXATION_METHODS:
+        raise ValueError(f"method には {list(RELAXATION_METHODS)} のいずれかを指定してください: {request_method!r}")
+    if request_method == "exhaustive" and method != "exhaustive":
+        raise ValueError("method=\"exhaustive\" は探索時間の上限が無いため, このサービスでは使用できません。")
+
+    limits = {}
+    for name, field_name, server_limit in (("search_time", "time_limit", search_budget.time_limit), ("max_solves", "max_solves", search_budget.max_solves)):
+        value = payload.get(name)
+        if value is None:
+            continue
+        if not _is_number(value) or value <= 0 or (name == "max_solves" and not isinstance(value, int)):
+            raise ValueError(f"{name} には正の{'整数' if name == 'max_solves' else '数'}を指定してください: {value!r}")
+        limits[field_name] = value if server_limit is None else min(value, server_limit)
+    return request_method, replace(search_budget, **limits)
+
+def _request_constraints(payload: dict) -> pl.DataFrame:
+    if "profile" in payload:
+        return NutrientsCalculator(_request_profile(payload["profile"])).constraints_frame()
+    if "constraints" in payload:
+        rows = _request_constraint_rows(payload["constraints"])
+        try:
+            return pl.DataFrame(rows, schema={"nutrient_id": pl.Utf8, "lower": pl.Float64, "upper": pl.Float64})
+        except pl.exceptions.PolarsError as e:
+            raise ValueError(f"constraints を読み込めません: {e}") from e
+    raise ValueError("profile または constraints を指定してください。")
+
+def run_optimization(payload: dict, method: str, solver_options: SolverOptions, search_budget: Optional[SearchBudget] = None) -> dict:
+    """
+    1件のリクエストの制約条件を求めて最適化する. ワーカープロセスで実行される
+
+    Args:
+        payload (dict): food_set と, profile (UserProfileの引数) または constraints (nutrient_id, lower, upper の一覧).
+            method, penalty_weights, search_time, max_solves を指定するとサービスの設定より優先する.
+            ただし search_time と max_solves は search_budget を超えられず, "exhaustive" は method が "exhaustive" の場合だけ指定できる
+        method (str): 既定の制約の緩和方法
+        solver_options (SolverOptions): 求解器の選択と設定
+        search_budget (SearchBudget, optional): method="anytime" の既定の上限
+
+    Returns:
+        dict: status, relaxed_constraints, n_solves, stop_reason, objective, results (結果の各行)
+    """
+    if "food_set" not in payload:
+        raise ValueError("food_set を指定してください。")
+    df_foods = _load_food_set(payload["food_set"])
+    df_constraints = _request_constraints(payload)
+    method, search_budget = _request_search(payload, method, search_budget or SearchBudget())
+    with contextlib.redirect_stdout(io.StringIO()):
+        solution, status, report = find_optimal_solution_iteratively(
+            df_foods, df_constraints, None,
+            method=method, penalty_weights=payload.get("penalty_weights"), solver_options=solver_options,
+            search_budget=search_budget
+        )
+    result = {
+        "status": pulp.LpStatus[status],
+        "relaxed_constraints": report.relaxed_constraints,
+        "n_solves": report.n_solves,
+        "stop_reason": report.stop_reason,
+        "objective": None,
+        "results": [],
+    }
+    if solution is not None:
+        result["objective"] = solution.objective
+        result["results"] = build_results_frame(df_foods, solution.food_units, df_constraints).to_dicts()
+    return result
+
+class _HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[tuple[str, str, dict, bytes]]:
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, path, _ = request_line.decode("latin-1").split()
+    except ValueError:
+        raise _HttpError(400, "リクエスト行が不正です。")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        raise _HttpError(400, "Content-Length が不正です。")
+    if length > MAX_BODY_BYTES:
+        raise _HttpError(413, f"リクエストの本文が大きすぎます (上限: {MAX_BODY_BYTES}バイト)。")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method.upper(), path.split("?", 1)[0], headers, body
+
+def _write_response(writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool):
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + body)
+
+class OptimizationService:
+    """
+    食品データと基準値の表を読み込んだワーカープロセスを保持し, HTTPで最適化を受け付けるサービス
+
+    POST /optimize  {"food_set": 設定名2, "profile": {...}} または {"food_set": ..., "constraints": [...]}
+    GET  /metrics   リクエスト数, 待ち行列の長さ, 待ち時間・求解時間・全体の処理時間の百分位数
+    GET  /health    稼働確認
+
+    同時にワーカーへ渡すのは max_concurrency 件までで, それ以上は max_queue 件まで待たせる.
+    """
+
+    def __init__(self, config: ServiceConfig):
+        self.config = config
+        self.metrics = ServiceMetrics()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    @property
+    def n_workers(self) -> int:
+        return self.config.workers or os.cpu_count() or 1
+
+    async def start(self):
+        # Polarsのスレッドプールはforkに対応していないため, ワーカーはspawnで起動する
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(list(self.config.preload_food_sets),)
+        )
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._executor, _ready) for _ in range(self.n_workers)))
+        self._semaphore = asyncio.Semaphore(self.config.max_concurrency or self.n_workers)
+        self._server = await asyncio.start_server(self._handle_connection, self.config.host, self.config.port)
+
+    @property
+    def port(self) -> int:
+        """実際に待ち受けているポート番号 (port=0 で起動した場合に使う)"""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _release(self):
+        self.metrics.in_flight -= 1
+        self._semaphore.release()
+
+    async def optimize(self, payload: dict) -> tuple[int, dict]:
+        """待ち行列と同時実行数の上限を守りながら, ワーカープロセスで最適化する"""
+        start_time = time.perf_counter()
+        if self.metrics.queued >= self.config.max_queue:
+            self.metrics.n_rejected += 1
+            return 503, {"error": "待ち行列が上限に達しています。"}
+
+        self.metrics.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.metrics.queued -= 1
+        self.metrics.in_flight += 1
+        solve_start = time.perf_counter()
+        self.metrics.queue_wait.add(solve_start - start_time)
+
+        loop = asyncio.get_running_loop()
+        task = loop.run_in_executor(self._executor, run_optimization, payload, self.config.method, self.config.solver_options, self.config.effective_search_budget())
+        release_on_done = False
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), self.config.request_timeout)
+        except asyncio.TimeoutError:
+            # ワーカーは処理を続けるため, 終わるまで同時実行数の枠は空けない
+            task.add_done_callback(lambda _: self._release())
+            release_on_done = True
+            self.metrics.n_timeouts += 1
+            return 504, {"error": f"制限時間 ({self.config.request_timeout}秒) 内に最適化が終わりませんでした。"}
+        except FileNotFoundError as e:
+            return 404, {"error": str(e)}
+        except (ValueError, TypeError, KeyError) as e:
+            return 400, {"error": f"{type(e).__name__}: {e}"}
+        except Exception as e:
+            self.metrics.n_errors += 1
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            if not release_on_done:
+                self._release()
+
+        elapsed = time.perf_counter() - start_time
+        self.metrics.solve.add(time.perf_counter() - solve_start)
+        self.metrics.total.add(elapsed)
+        self.metrics.statuses[result["status"]] += 1
+        result["elapsed"] = elapsed
+        return 200, result
+
+    async def _route(self, method: str, path: str, body: bytes) -> tuple[int, dict]:
+        if path == "/health":
+            return (200, {"status": "ok"}) if method == "GET" else (405, {"error": "GETのみ使用できます。"})
+        if path == "/metrics":
+            return (200, self.metrics.snapshot()) if method == "GET" else (405, {"error": "GETのみ使用できます。"})
+        if path == "/optimize":
+            if method != "POST":
+                return 405, {"error": "POSTのみ使用できます。"}
+            self.metrics.n_requests += 1
+            try:
+                payload = json.loads(body or b"{}")
+            except ValueError:
+                return 400, {"error": "本文がJSONではありません。"}
+            if not isinstance(payload, dict):
+                return 400, {"error": "本文はJSONオブジェクトにしてください。"}
+            return await self.optimize(payload)
+        return 404, {"error": f"見つかりません: {path}"}
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except _HttpError as e:
+                    _write_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                status, payload = await self._route(method, path, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                _write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
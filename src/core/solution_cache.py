@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from typing import Optional
+import polars as pl
+
+SOLUTION_CACHE_DIR = "/app/data/cache/solutions/"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# 求解や結果の出力方法を変更した場合は, 古いキャッシュを使わないよう値を上げる
+CACHE_VERSION = 2
+
+@dataclass
+class CachedSolution:
+    """キャッシュされた最適化の結果"""
+    status: int
+    relaxed_constraints: list[str] = field(default_factory=list)
+    file_name: Optional[str] = None
+    content: Optional[str] = None
+    n_solves: int = 0
+    # --presolve で取り除いた食品と栄養素 (PresolveReport の各項目)
+    presolve: Optional[dict] = None
+
+def _normalize_constraints(df_constraints: pl.DataFrame) -> pl.DataFrame:
+    # 行の順序と, 数値の読み込まれ方 (全て空欄の列が文字列になる等) の違いを吸収する
+    return df_constraints.select(
+        pl.col("nutrient_id").cast(pl.Utf8),
+        pl.col("lower", "upper").cast(pl.Float64, strict=False),
+    ).sort("nutrient_id")
+
+def solution_key(df_foods: pl.DataFrame, df_constraints: pl.DataFrame, options: Optional[dict] = None) -> str:
+    """
+    制約条件, 食品データ, 求解の設定から, キャッシュのキーとなるハッシュ値を求める
+
+    食品データは結果の行の順序に影響するため, 並べ替えずにそのまま使う.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({"version": CACHE_VERSION, "options": options or {}}, sort_keys=True, default=str).encode())
+    digest.update(b"\0constraints\0")
+    digest.update(_normalize_constraints(df_constraints).write_csv().encode())
+    digest.update(b"\0foods\0")
+    digest.update(df_foods.write_csv().encode())
+    return digest.hexdigest()
+
+class SolutionCache:
+    """
+    最適化の結果をローカルディスクに保存するキャッシュ
+
+    1件を1つのJSONファイルとして保存し, 読み出すたびに更新時刻を新しくする.
+    合計サイズが max_bytes を超えたら, 更新時刻の古いものから削除する.
+    """
+
+    def __init__(self, cache_dir: str = SOLUTION_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[CachedSolution]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            solution = CachedSolution(**data)
+            os.utime(path)
+        except (OSError, ValueError, TypeError):
+            # 読めないファイルや, 項目の異なる古い形式のファイルは保存されていないものとして扱う
+            return None
+        return solution
+
+    def put(self, key: str, solution: CachedSolution):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(solution.__dict__, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """合計サイズが上限以下になるまで, 最後に使われた時刻の古いものから削除する"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                os.remove(entry.path)
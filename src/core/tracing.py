@@ -0,0 +1,133 @@
+import atexit
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import time
+import uuid
+from typing import Optional
+
+# 環境変数で有効にする場合の出力先. コマンドライン引数 (--trace, --profile) でも指定できる
+TRACE_ENV = "NUTRITION_OPTIMIZER_TRACE"
+PROFILE_ENV = "NUTRITION_OPTIMIZER_PROFILE"
+
+def _peak_rss_kb() -> int:
+    # Linuxではキロバイト単位の, プロセス開始からの最大常駐メモリ
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class Tracer:
+    """
+    処理段階ごとの所要時間と, 求解ごとのモデルの大きさや反復回数を記録する
+
+    trace_path を指定すると1件ごとにJSON Linesで追記し, profile_path を指定すると
+    close() までの間をcProfileで計測して書き出す. どちらも指定しなければ何も記録しない.
+    profile_path の "{pid}" はプロセスIDに置き換えられる.
+    """
+
+    def __init__(self, trace_path: Optional[str] = None, profile_path: Optional[str] = None):
+        self.trace_path = trace_path
+        self.profile_path = profile_path.format(pid=os.getpid()) if profile_path else None
+        self.run_id = uuid.uuid4().hex[:12]
+        self._stack: list[str] = []
+        self._file = None
+        self._profiler = None
+
+        if self.trace_path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.trace_path)), exist_ok=True)
+            self._file = open(self.trace_path, "a", encoding="utf-8")
+        if self.profile_path:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    @property
+    def enabled(self) -> bool:
+        return self._file is not None
+
+    def _write(self, record: dict):
+        record = {"run_id": self.run_id, "pid": os.getpid(), "time": time.time(), **record}
+        self._file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self._file.flush()
+
+    @contextlib.contextmanager
+    def stage(self, name: str, **attrs):
+        """
+        with ブロックの経過時間, CPU時間, 最大常駐メモリを1件の記録として書き出す
+
+        yield される辞書に値を追加すると, 記録に含まれる
+        """
+        if not self.enabled:
+            yield attrs
+            return
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield attrs
+        finally:
+            self._stack.pop()
+            self._write({
+                "type": "stage",
+                "name": name,
+                "parent": parent,
+                "wall": time.perf_counter() - start_wall,
+                "cpu": time.process_time() - start_cpu,
+                "peak_rss_kb": _peak_rss_kb(),
+                **attrs,
+            })
+
+    def record_solve(self, solver: str, model, status: int, wall: float, cpu: float, iterations: Optional[int] = None, **attrs):
+        """1回の求解について, モデルの行数・列数・非ゼロ要素数と反復回数を書き出す"""
+        if not self.enabled:
+            return
+        import pulp
+
+        self._write({
+            "type": "solve",
+            "solver": solver,
+            "stage": self._stack[-1] if self._stack else None,
+            "status": pulp.LpStatus.get(status, status),
+            "rows": model.n_rows,
+            "cols": model.n_cols,
+            "nonzeros": model.n_nonzeros,
+            "iterations": iterations,
+            "wall": wall,
+            "cpu": cpu,
+            "peak_rss_kb": _peak_rss_kb(),
+            **attrs,
+        })
+
+    def close(self):
+        if self._profiler is not None:
+            self._profiler.disable()
+            os.makedirs(os.path.dirname(os.path.abspath(self.profile_path)), exist_ok=True)
+            self._profiler.dump_stats(self.profile_path)
+            self._profiler = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+_tracer: Optional[Tracer] = None
+
+def get_tracer() -> Tracer:
+    """プロセス全体で共有するTracer. 初回の呼び出し時に環境変数から設定する"""
+    global _tracer
+    if _tracer is None:
+        configure_tracing(os.environ.get(TRACE_ENV), os.environ.get(PROFILE_ENV))
+    return _tracer
+
+def configure_tracing(trace_path: Optional[str] = None, profile_path: Optional[str] = None) -> Tracer:
+    """記録先を設定し直す. 以前の記録は閉じる"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = Tracer(trace_path, profile_path)
+    return _tracer
+
+def trace_stage(name: str, **attrs):
+    return get_tracer().stage(name, **attrs)
+
+@atexit.register
+def _close_tracer():
+    if _tracer is not None:
+        _tracer.close()
@@ -0,0 +1,53 @@
+import argparse
+from core.options import RELAXATION_METHODS, add_search_arguments, add_solver_arguments, search_budget_from_args, solver_options_from_args
+
+async def serve(config):
+    from core.service import OptimizationService
+
+    service = OptimizationService(config)
+    await service.start()
+    print(f"最適化サービスを起動しました: http://{config.host}:{service.port} (ワーカー: {service.n_workers})")
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+def main(args: argparse.Namespace):
+    import asyncio
+    from core.service import ServiceConfig
+
+    config = ServiceConfig(
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        request_timeout=args.timeout,
+        preload_food_sets=args.food_sets,
+        method=args.relaxation,
+        solver_options=solver_options_from_args(args),
+        search_budget=search_budget_from_args(args),
+    )
+    try:
+        asyncio.run(serve(config))
+    except KeyboardInterrupt:
+        print("最適化サービスを停止しました。")
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="待ち受けるアドレス")
+    parser.add_argument("-p", "--port", type=int, default=8080, help="待ち受けるポート番号")
+    parser.add_argument("-j", "--workers", type=int, required=False, help="ワーカープロセス数 (省略時はCPUコア数)")
+    parser.add_argument("--max_concurrency", type=int, required=False, help="同時に最適化するリクエスト数の上限 (省略時はワーカー数)")
+    parser.add_argument("--max_queue", type=int, default=100, help="空きを待つリクエスト数の上限. 超えた場合は503を返す")
+    parser.add_argument("--timeout", type=float, default=60.0, help="1件の最適化の制限時間 (秒). 超えた場合は504を返す")
+    parser.add_argument("-f", "--food_sets", type=str, nargs="+", default=[], help="起動時に読み込んでおく食品データの設定名2")
+    parser.add_argument("-r", "--relaxation", type=str, choices=RELAXATION_METHODS, default="elastic", help="最適解が見つからない場合の制約の緩和方法 (anytime は --search_time, --max_solves の範囲で最も少ない緩和を探す)")
+    add_solver_arguments(parser)
+    add_search_arguments(parser)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    main(args)
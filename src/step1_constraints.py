@@ -12,10 +12,26 @@ from datetime import datetime
 from typing import Dict, Any
 import argparse
 
-from core.nutrients_calculator import UserProfile, NutrientsCalculator
+def main_cohort(args: argparse.Namespace):
+    """複数人分のプロファイルから制約条件をまとめて計算する"""
+    import polars as pl
+    from core.nutrients_calculator import NutrientsCalculator
+
+    print("=== Step1: 制約条件設定 (一括) ===")
+    output_dir = f"/app/data/step1_constraints/{args.setting_name}/"
+    cohort_constraints_path = os.path.join(output_dir, "cohort_constraints.csv")
+    df_profiles = pl.read_csv(args.cohort)
+    df_constraints = NutrientsCalculator.calculate_cohort_constraints(df_profiles)
+    os.makedirs(output_dir, exist_ok=True)
+    df_constraints.write_csv(cohort_constraints_path)
+    print(f"{df_profiles.height}人分の制約条件が保存されました: {cohort_constraints_path}")
 
 def main(args: argparse.Namespace):
     """メイン処理"""
+    if args.cohort is not None:
+        main_cohort(args)
+        return
+
     print("=== Step1: 制約条件設定 ===")
 
     setting_name = args.setting_name
@@ -26,14 +42,14 @@ def main(args: argparse.Namespace):
         print("設定ファイルが見つかりました。")
         with open(user_profile_path, "r") as f:
             profile_data = json.load(f)
-        user_profile = UserProfile(
-            sex_code=profile_data["sex_code"],
-            weight=profile_data["weight"],
-            height=profile_data["height"],
-            age=profile_data["age"],
-            activity_level=profile_data["activity_level"],
-            life_code=profile_data["life_code"]
-        )
+        profile_fields = {
+            "sex_code": profile_data["sex_code"],
+            "weight": profile_data["weight"],
+            "height": profile_data["height"],
+            "age": profile_data["age"],
+            "activity_level": profile_data["activity_level"],
+            "life_code": profile_data["life_code"]
+        }
     else:
         print("ユーザープロファイルを新規作成します。")
 
@@ -108,18 +124,33 @@ def main(args: argparse.Namespace):
             else:
                 print("無効な選択です。1から4の数字を入力してください。")
 
-        user_profile = UserProfile(sex_code, weight, height, age, activity_level, life_code)
+        profile_fields = {
+            "sex_code": sex_code,
+            "weight": weight,
+            "height": height,
+            "age": age,
+            "activity_level": activity_level,
+            "life_code": life_code
+        }
 
+    # 基準値の表の読み込みに時間がかかるため, 入力が終わってから読み込む
+    from core.nutrients_calculator import NutrientsCalculator, UserProfile
+
+    user_profile = UserProfile(**profile_fields)
     calculator = NutrientsCalculator(user_profile)
     os.makedirs(output_dir, exist_ok=True)
     calculator.save_nutrient_values_to_csv(nutrient_constraints_path)
     calculator.save_user_profile_to_json(user_profile_path)
     print(f"制約条件が保存されました: {nutrient_constraints_path}")
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
+def add_arguments(parser: argparse.ArgumentParser):
     parser.add_argument("-s", "--setting_name", type=str, required=True, help="設定名")
     parser.add_argument("-u", "--use_profile", action="store_true", help="ファイルから設定を読み込む場合に指定")
+    parser.add_argument("-c", "--cohort", type=str, required=False, help="複数人分のプロファイル (sex_code, weight, height, age, activity_level, life_code 列) を持つCSVファイルのパス")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
     args = parser.parse_args()
 
-    main(args)
\ No newline at end of file
+    main(args)
@@ -1,45 +1,51 @@
 import argparse
-import polars as pl
+import json
 import os
 
 def load_food_nutrient_data():
-    TEMPLATE_FOOD_NUTRIENT_DATA_PATH = "/app/resources/step2/template/food_nutrient_data.csv"
-    CUSTOM_FOOD_NUTRIENT_DATA_DIR = "/app/resources/step2/custom/"
-    df_input = pl.read_csv(TEMPLATE_FOOD_NUTRIENT_DATA_PATH)
-    # 食品名とunitはstr、それ以外はfloat64にキャスト
-    df_input = df_input.with_columns(
-        pl.col("food_name").cast(pl.Utf8),
-        pl.col("unit").cast(pl.Utf8)
-    )
-    for col_name in df_input.columns:
-        if col_name not in ["food_name", "unit"]:
-            df_input = df_input.with_columns(
-                pl.col(col_name).cast(pl.Float64, strict=False)
-            )
-    
-    n_custom_data = len(os.listdir(CUSTOM_FOOD_NUTRIENT_DATA_DIR))
-    # 食品名が重複する場合、カスタムデータを優先
-    if n_custom_data > 0:
-        for filename in os.listdir(CUSTOM_FOOD_NUTRIENT_DATA_DIR):
-            if filename.endswith(".csv"):
-                custom_data_path = os.path.join(CUSTOM_FOOD_NUTRIENT_DATA_DIR, filename)
-                df_custom = pl.read_csv(custom_data_path)
-                df_custom = df_custom.with_columns(
-                    pl.col("food_name").cast(pl.Utf8),
-                    pl.col("unit").cast(pl.Utf8)
-                )
-                for col_name in df_custom.columns:
-                    if col_name not in ["food_name", "unit"]:
-                        df_custom = df_custom.with_columns(
-                            pl.col(col_name).cast(pl.Float64, strict=False)
-                        )
-                df_input = df_input.filter(~pl.col("food_name").is_in(df_custom["food_name"]))
-                df_input = pl.concat([df_input, df_custom])
-    return df_input
+    from core.food_store import load_food_store
+
+    # テンプレートとカスタムデータを結合済みのファイルを読み込む. 元のCSVが更新されていれば作り直す
+    return load_food_store()
+
+def main_batch(args: argparse.Namespace):
+    """指定ファイルから使用する食品を対話なしで一度に設定する"""
+    import polars as pl
+    from core.food_list_builder import build_food_list, read_food_spec
+
+    df_input = load_food_nutrient_data()
+    output_path = f"/app/data/step2_foods/{args.setting_name}/food_nutrient_data.csv"
+
+    defaults = {}
+    if args.defaults is not None:
+        with open(args.defaults, "r") as f:
+            defaults = json.load(f)
+    if args.default_cost is not None:
+        defaults["cost"] = args.default_cost
+
+    df_food_list = build_food_list(df_input, read_food_spec(args.batch), defaults=defaults)
+
+    # 既存の設定がある場合, 同じ食品は指定ファイルの内容で上書きする
+    if os.path.exists(output_path):
+        df_output = pl.read_csv(output_path, schema=df_input.schema)
+        df_food_list = pl.concat([
+            df_output.filter(~pl.col("food_name").is_in(df_food_list["food_name"].implode())),
+            df_food_list
+        ])
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    df_food_list.write_csv(output_path)
+    print(f"{df_food_list.height}件の食品データが保存されました: {output_path}")
 
 def main(args: argparse.Namespace):
+    if args.batch is not None:
+        main_batch(args)
+        return
+
+    import polars as pl
+    from core.food_search import FoodSearchIndex
 
     df_input = load_food_nutrient_data()
+    search_index = FoodSearchIndex.from_frame(df_input)
 
     output_path = f"/app/data/step2_foods/{args.setting_name}/food_nutrient_data.csv"
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
@@ -60,23 +66,24 @@ def main(args: argparse.Namespace):
                 print(f"選択した食品データが保存されました: {output_path}")
             break
 
-        # まず完全一致で検索
-        df_food = df_input.filter(pl.col("food_name") == food_name)
+        # まず完全一致で検索 (全角・半角, カタカナ・ひらがな, 空白の違いは無視する)
+        matched_name = search_index.lookup(food_name)
+        df_food = df_input.filter(pl.col("food_name") == matched_name) if matched_name is not None else df_input.clear()
         
-        # 完全一致しなかった場合、部分一致検索を行う
+        # 完全一致しなかった場合、あいまい検索を行う
         if df_food.is_empty():
             print(f"食品名 '{food_name}' は存在しません。部分一致で検索します...")
             
-            # 部分一致する候補を検索
-            df_search_results = df_input.filter(pl.col("food_name").str.contains(food_name))
+            # 一致度の高い候補を検索
+            search_hits = search_index.search(food_name, k=args.top_k)
             
-            if df_search_results.is_empty():
+            if not search_hits:
                 print(f"'{food_name}' を含む食品は見つかりませんでした。")
                 continue # 次の入力を待つ
             
             # 候補を番号付きで表示
             print("----------------------------------------")
-            food_name_list = df_search_results["food_name"].to_list()
+            food_name_list = [hit.food_name for hit in search_hits]
             for i, name in enumerate(food_name_list, 1):
                 print(f"{i}: {name}")
             print("----------------------------------------")
@@ -165,11 +172,16 @@ def main(args: argparse.Namespace):
             df_output = pl.concat([df_output, df_food])
             print(f"食品名 '{selected_food_name}' を追加しました。")
 
-
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-s", "--setting_name", type=str, required=True, help="設定名")
+    parser.add_argument("-b", "--batch", type=str, required=False, help="food_name (食品名または検索語), cost, amount, min, max の列を持つCSVファイルのパス. 指定すると対話なしで設定する")
+    parser.add_argument("-d", "--defaults", type=str, required=False, help="欠けている値を補う既定値 (列名 -> 値) を記述したJSONファイルのパス")
+    parser.add_argument("--default_cost", type=float, required=False, help="値段が指定されていない食品の値段")
+    parser.add_argument("-k", "--top_k", type=int, default=20, help="部分一致検索で表示する候補数の上限")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-s", "--setting_name", type=str, required=True, help="設定名")
-
+    add_arguments(parser)
     args = parser.parse_args()
-    main(args)
\ No newline at end of file
+
+    main(args)
@@ -0,0 +1,51 @@
+import argparse
+import json
+import os
+from core.options import RELAXATION_METHODS, RESULT_FORMATS, add_search_arguments, add_solver_arguments, search_budget_from_args, solver_options_from_args
+
+def main(args: argparse.Namespace):
+    from core.batch_optimizer import load_manifest, run_batch
+
+    jobs = load_manifest(args.manifest)
+    summary_path = args.output or f"{os.path.splitext(args.manifest)[0]}_summary.csv"
+
+    penalty_weights = None
+    if args.penalty_weights is not None:
+        with open(args.penalty_weights, "r") as f:
+            penalty_weights = json.load(f)
+
+    print(f"=== {len(jobs)}件の最適化を実行します ===")
+    summary = run_batch(
+        jobs,
+        summary_path,
+        max_workers=args.workers,
+        method=args.relaxation,
+        penalty_weights=penalty_weights,
+        solver_options=solver_options_from_args(args),
+        result_formats=args.formats,
+        search_budget=search_budget_from_args(args)
+    )
+
+    print("\n=== 集計 ===")
+    print(f"件数: {summary.n_jobs} (最適解: {summary.n_optimal}, 制約を緩和: {summary.n_relaxed}, 失敗: {summary.n_failed})")
+    print(f"所要時間: {summary.wall_time:.3f}秒, スループット: {summary.throughput:.1f}件/秒")
+    if summary.latencies:
+        print(f"1件あたりの処理時間: 中央値 {summary.latency_percentile(0.5):.3f}秒, 95%点 {summary.latency_percentile(0.95):.3f}秒")
+    print(f"結果の一覧が出力されました: {summary_path}")
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-m", "--manifest", type=str, required=True, help="setting_name, setting_name_1, setting_name_2 の列を持つCSVファイルのパス")
+    parser.add_argument("-o", "--output", type=str, required=False, help="ジョブごとの結果を書き出すCSVファイルのパス")
+    parser.add_argument("-j", "--workers", type=int, required=False, help="ワーカープロセス数 (省略時はCPUコア数)")
+    parser.add_argument("-r", "--relaxation", type=str, choices=RELAXATION_METHODS, default="elastic", help="最適解が見つからない場合の制約の緩和方法 (anytime は --search_time, --max_solves の範囲で最も少ない緩和を探す)")
+    parser.add_argument("-w", "--penalty_weights", type=str, required=False, help="制約違反の重みを記述したJSONファイルのパス")
+    add_solver_arguments(parser)
+    add_search_arguments(parser)
+    parser.add_argument("--formats", type=str, nargs="+", choices=RESULT_FORMATS, default=["csv"], help="各人の結果の出力形式 (CSVは常に出力する)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    main(args)
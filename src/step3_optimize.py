@@ -1,8 +1,8 @@
 import argparse
 import json
 import os
-import polars as pl
-from core.optimizer import *
+from core.options import RELAXATION_METHODS, RESULT_FORMATS, add_search_arguments, add_solver_arguments, search_budget_from_args, solver_options_from_args
+from core.tracing import PROFILE_ENV, TRACE_ENV, configure_tracing, get_tracer, trace_stage
 
 def load_settings(args: argparse.Namespace):
     setting_name = args.setting_name
@@ -31,6 +31,8 @@ def load_settings(args: argparse.Namespace):
     return setting_name, setting_name_1, setting_name_2
 
 def load_data(setting_name_1: str, setting_name_2: str):
+    import polars as pl
+
     setting_1_path = f"/app/data/step1_constraints/{setting_name_1}/nutrient_constraints.csv"
     setting_2_path = f"/app/data/step2_foods/{setting_name_2}/food_nutrient_data.csv"
     if not os.path.exists(setting_1_path):
@@ -41,19 +43,106 @@ def load_data(setting_name_1: str, setting_name_2: str):
     df_foods = pl.read_csv(setting_2_path)
     return df_constraints, df_foods
 
+def save_alternatives(args: argparse.Namespace, df_foods, df_constraints, report, base_output_path: str, solver_options):
+    """最適解と同じ制約 (緩和した制約は外す) で, 組み合わせの異なる最適に近い献立を結果と同じ形式で出力する"""
+    from core.alternatives import find_alternative_menus
+    from core.optimizer import save_results
+
+    with trace_stage("alternatives", k=args.alternatives, cost_tolerance=args.cost_tolerance) as stage:
+        menus = find_alternative_menus(
+            df_foods, df_constraints, k=args.alternatives, cost_tolerance=args.cost_tolerance,
+            min_difference=args.min_difference, constraints_to_ignore=report.relaxed_constraints, solver_options=solver_options
+        )
+        stage.update(n_menus=len(menus))
+    if not menus:
+        return
+    print(f"\n=== 費用が最適解の{1 + args.cost_tolerance:.2f}倍以下の献立: {len(menus)}件 ===")
+    stem = os.path.splitext(report.output_path or base_output_path)[0]
+    best = set(menus[0].foods)
+    for menu in menus:
+        removed, added = sorted(best - set(menu.foods)), sorted(set(menu.foods) - best)
+        diff = f" (外した食品: {', '.join(removed) or 'なし'} / 加えた食品: {', '.join(added) or 'なし'})" if menu.rank > 1 else ""
+        print(f"{menu.rank}: 費用 {menu.objective:.2f}, 食品 {len(menu.foods)}種類{diff}")
+    for menu in menus[1:]:
+        save_results(df_foods, menu.food_units, f"{stem}_alternative_{menu.rank}.csv", df_constraints, args.formats)
+
+def print_progress(progress):
+    """-r anytime の途中経過のうち, 緩和が減ったときだけを表示する"""
+    if progress.improved:
+        print(f"  - {progress.elapsed:.3f}秒 ({progress.n_solves}回目の求解): {len(progress.relaxed_constraints)}個の制約を外した解 {progress.relaxed_constraints}")
+
 def main(args: argparse.Namespace):
+    if args.trace is not None or args.profile is not None:
+        configure_tracing(args.trace, args.profile)
+    with trace_stage("step3_optimize", setting_name=args.setting_name):
+        run(args)
+    get_tracer().close()
+
+def run(args: argparse.Namespace):
+    import pulp
+    from core.optimizer import SolutionCache, find_optimal_solution_by_column_generation, find_optimal_solution_cached, find_optimal_solution_iteratively
+
     setting_name, setting_name_1, setting_name_2 = load_settings(args)
-    df_constraints, df_foods = load_data(setting_name_1, setting_name_2)
+    with trace_stage("load_data") as stage:
+        df_constraints, df_foods = load_data(setting_name_1, setting_name_2)
+        stage.update(n_foods=df_foods.height, n_constraints=df_constraints.height)
 
     # 基本となる出力パスを定義
     base_output_path = f"/app/data/step3_optimize/{setting_name}/results.csv"
 
-    # 新しいラッパー関数を呼び出す
-    prob, status = find_optimal_solution_iteratively(
-        df_foods,
-        df_constraints,
-        base_output_path
-    )
+    penalty_weights = None
+    if args.penalty_weights is not None:
+        with open(args.penalty_weights, "r") as f:
+            penalty_weights = json.load(f)
+
+    solver_options = solver_options_from_args(args)
+    search_budget = search_budget_from_args(args)
+
+    # 新しいラッパー関数を呼び出す. 同じ問題を解いたことがあれば保存済みの結果を使う
+    if args.column_generation:
+        prob, status, report = find_optimal_solution_by_column_generation(
+            df_foods,
+            df_constraints,
+            base_output_path,
+            penalty_weights=penalty_weights,
+            solver_options=solver_options,
+            result_formats=args.formats
+        )
+    elif args.no_cache:
+        prob, status, report = find_optimal_solution_iteratively(
+            df_foods,
+            df_constraints,
+            base_output_path,
+            method=args.relaxation,
+            penalty_weights=penalty_weights,
+            solver_options=solver_options,
+            presolve=args.presolve,
+            result_formats=args.formats,
+            search_budget=search_budget,
+            progress_callback=print_progress
+        )
+    else:
+        prob, status, report = find_optimal_solution_cached(
+            df_foods,
+            df_constraints,
+            base_output_path,
+            method=args.relaxation,
+            penalty_weights=penalty_weights,
+            cache=SolutionCache(max_bytes=int(args.cache_size * 1024 * 1024)),
+            solver_options=solver_options,
+            presolve=args.presolve,
+            result_formats=args.formats,
+            search_budget=search_budget,
+            progress_callback=print_progress
+        )
+
+    if report.presolve is not None:
+        presolve_path = f"/app/data/step3_optimize/{setting_name}/presolve.csv"
+        report.presolve.to_frame().write_csv(presolve_path)
+        print(f"前処理で取り除いた食品と栄養素が出力されました: {presolve_path}")
+
+    if args.alternatives > 1 and status == pulp.LpStatusOptimal:
+        save_alternatives(args, df_foods, df_constraints, report, base_output_path, solver_options)
 
     # 最終的なステータスを表示
     if status == pulp.LpStatusOptimal:
@@ -63,13 +152,29 @@ def main(args: argparse.Namespace):
 
     
 
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser()
+def add_arguments(parser: argparse.ArgumentParser):
     parser.add_argument("-s", "--setting_name", type=str, required=True, help="設定名")
     parser.add_argument("-s1", "--setting_name_1", type=str, required=False, help="設定名1")
     parser.add_argument("-s2", "--setting_name_2", type=str, required=False, help="設定名2")
     parser.add_argument("-u", "--use_profile", action="store_true", help="ファイルから設定を読み込む場合に指定")
+    parser.add_argument("-r", "--relaxation", type=str, choices=RELAXATION_METHODS, default="elastic", help="最適解が見つからない場合の制約の緩和方法 (anytime は --search_time, --max_solves の範囲で最も少ない緩和を探す)")
+    parser.add_argument("-w", "--penalty_weights", type=str, required=False, help="制約違反の重みを記述したJSONファイルのパス (例: {\"folate\": 2.0, \"Max_vitamin_a\": 0.5})")
+    add_solver_arguments(parser)
+    add_search_arguments(parser)
+    parser.add_argument("--formats", type=str, nargs="+", choices=RESULT_FORMATS, default=["csv"], help="結果の出力形式 (CSVは常に出力する)")
+    parser.add_argument("-k", "--alternatives", type=int, default=1, help="出力する献立の数. 2以上を指定すると, 最適解に加えて使用する食品の組み合わせが異なる献立を安い順に出力する")
+    parser.add_argument("--cost_tolerance", type=float, default=0.1, help="-k で出力する献立の費用の上限 (最適解の費用に対する増加の割合)")
+    parser.add_argument("--min_difference", type=int, default=1, help="-k で出力する各献立が, それより安い全ての献立から外す食品の数の下限")
+    parser.add_argument("--presolve", action="store_true", help="最適解に影響しない, 他の食品に支配される食品などを取り除いてから求解する")
+    parser.add_argument("--column_generation", action="store_true", help="少数の食品から始め, 被約費用が負の食品だけを追加しながら解く (食品数の多いデータ向け. -r, --presolve と保存済みの結果は使わない)")
+    parser.add_argument("--no_cache", action="store_true", help="保存済みの結果を使わずに必ず求解する")
+    parser.add_argument("--cache_size", type=float, default=256, help="保存する結果の合計サイズの上限 (MB)")
+    parser.add_argument("--trace", type=str, required=False, help=f"処理段階ごとの所要時間と求解の記録を追記するJSON Linesファイルのパス (環境変数 {TRACE_ENV} でも指定可)")
+    parser.add_argument("--profile", type=str, required=False, help=f"cProfileの結果を書き出すファイルのパス (環境変数 {PROFILE_ENV} でも指定可)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
     args = parser.parse_args()
 
     main(args)
@@ -0,0 +1,65 @@
+import argparse
+import os
+
+def main(args: argparse.Namespace):
+    import polars as pl
+    import pulp
+    from core.batch_optimizer import constraints_path, foods_path
+    from core.menu_planner import PlanOptions, plan_menu
+
+    for path in (constraints_path(args.setting_name_1), foods_path(args.setting_name_2)):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"設定ファイルが見つかりません: {path}")
+    df_constraints = pl.read_csv(constraints_path(args.setting_name_1))
+    df_foods = pl.read_csv(foods_path(args.setting_name_2))
+    output_dir = f"/app/data/step3_optimize/{args.setting_name}/"
+    os.makedirs(output_dir, exist_ok=True)
+
+    options = PlanOptions(
+        n_days=args.days,
+        daily_tolerance=args.daily_tolerance,
+        max_days_per_food=args.max_days_per_food,
+        min_foods_per_day=args.min_foods_per_day,
+        max_units_per_day=args.max_units_per_day,
+        integer_units=args.integer,
+        time_limit=args.time_limit,
+        mip_gap=args.mip_gap,
+    )
+    plan = plan_menu(df_foods, df_constraints, options, args.ignore)
+    print(f"変数: {plan.n_cols}, 制約: {plan.n_rows}, 非ゼロ要素: {plan.n_nonzeros}, 所要時間: {plan.elapsed:.2f}秒")
+    if plan.df_plan is None and plan.time_limit_reached:
+        print(f"制限時間 ({options.time_limit}秒) 内に献立が見つかりませんでした。--time_limit を延ばすか, --max_days_per_food などの条件を緩めてください。")
+        return
+    if plan.df_plan is None:
+        print(f"献立が見つかりませんでした (ステータス: {pulp.LpStatus[plan.status]})。-i で無視する制約を指定するか, 条件を緩めてください。")
+        return
+
+    if plan.time_limit_reached:
+        gap = f" (相対ギャップ: {plan.mip_gap:.2%})" if plan.mip_gap is not None else ""
+        print(f"制限時間に達したため, その時点で最良の献立を出力します{gap}。")
+    print(f"{options.n_days}日分の費用: {plan.objective:.2f}")
+    plan.df_plan.write_csv(os.path.join(output_dir, "plan.csv"))
+    plan.df_daily_totals.write_csv(os.path.join(output_dir, "daily_totals.csv"))
+    plan.df_purchases.write_csv(os.path.join(output_dir, "purchases.csv"))
+    print(f"献立が出力されました: {output_dir}")
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-s", "--setting_name", type=str, required=True, help="設定名")
+    parser.add_argument("-s1", "--setting_name_1", type=str, required=True, help="設定名1")
+    parser.add_argument("-s2", "--setting_name_2", type=str, required=True, help="設定名2")
+    parser.add_argument("-d", "--days", type=int, default=7, help="計画する日数")
+    parser.add_argument("--daily_tolerance", type=float, default=0.2, help="1日ごとの栄養素の上下限の緩め幅 (0.2なら下限の80%%〜上限の120%%)")
+    parser.add_argument("--max_days_per_food", type=int, required=False, help="1つの食品を使ってよい日数の上限")
+    parser.add_argument("--min_foods_per_day", type=int, required=False, help="1日に使う食品の種類数の下限")
+    parser.add_argument("--max_units_per_day", type=float, default=10.0, help="maxが未設定の食品の1日の購入単位数の上限")
+    parser.add_argument("--integer", action="store_true", help="期間全体の購入量を amount 単位の整数にする")
+    parser.add_argument("--time_limit", type=float, required=False, help="求解の制限時間 (秒). 食品数の多い表で --max_days_per_food などを指定する場合は長めに設定する")
+    parser.add_argument("--mip_gap", type=float, required=False, help="整数計画の相対ギャップの許容値 (例: 0.01)")
+    parser.add_argument("-i", "--ignore", type=str, nargs="+", default=[], help="無視する制約名 (例: Min_chromium)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    main(args)
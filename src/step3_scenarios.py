@@ -0,0 +1,54 @@
+import argparse
+import os
+from core.options import RESULT_FORMATS, add_solver_arguments, solver_options_from_args
+
+def main(args: argparse.Namespace):
+    import time
+    import polars as pl
+    from core.batch_optimizer import constraints_path, foods_path
+    from core.price_scenarios import read_price_table, solve_price_scenarios
+    from core.results_writer import write_results
+
+    for path in (constraints_path(args.setting_name_1), foods_path(args.setting_name_2), args.prices):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"設定ファイルが見つかりません: {path}")
+    df_constraints = pl.read_csv(constraints_path(args.setting_name_1))
+    df_foods = pl.read_csv(foods_path(args.setting_name_2))
+    df_prices = read_price_table(args.prices)
+
+    print(f"=== {df_prices.width - 1}件の値段のシナリオを解きます ===")
+    start_time = time.perf_counter()
+    df_scenarios = solve_price_scenarios(
+        df_foods, df_constraints, df_prices,
+        max_workers=args.workers, solver_options=solver_options_from_args(args), constraints_to_ignore=args.ignore
+    )
+    elapsed = time.perf_counter() - start_time
+
+    n_optimal = df_scenarios.filter(pl.col("status") == "Optimal").height
+    print(f"最適解: {n_optimal}/{df_scenarios.height}件, 所要時間: {elapsed:.3f}秒")
+    if n_optimal < df_scenarios.height:
+        print("最適解が見つからないシナリオがあります。-i で無視する制約を指定してください。")
+    if n_optimal > 0:
+        costs = df_scenarios["cost"].drop_nulls()
+        print(f"費用: 最小 {costs.min():.2f}, 中央値 {costs.median():.2f}, 最大 {costs.max():.2f}")
+
+    output_path = f"/app/data/step3_optimize/{args.setting_name}/scenarios.csv"
+    paths = write_results(df_scenarios, output_path, ["csv", *[fmt for fmt in args.formats if fmt != "csv"]])
+    print(f"シナリオごとの結果が出力されました: {', '.join(paths)}")
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-s", "--setting_name", type=str, required=True, help="設定名")
+    parser.add_argument("-s1", "--setting_name_1", type=str, required=True, help="設定名1")
+    parser.add_argument("-s2", "--setting_name_2", type=str, required=True, help="設定名2")
+    parser.add_argument("-p", "--prices", type=str, required=True, help="food_name の列とシナリオごとの値段の列を持つCSVファイルのパス (空欄は設定名2の値段を使う)")
+    parser.add_argument("-j", "--workers", type=int, required=False, help="ワーカープロセス数 (省略時はCPUコア数)")
+    parser.add_argument("-i", "--ignore", type=str, nargs="+", default=[], help="無視する制約名 (例: Min_chromium)")
+    add_solver_arguments(parser)
+    parser.add_argument("--formats", type=str, nargs="+", choices=RESULT_FORMATS, default=["csv"], help="結果の出力形式 (CSVは常に出力する)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,71 @@
+import argparse
+import os
+
+def _format_bound(value) -> str:
+    return "" if value is None else f"{value:.4g}"
+
+def main(args: argparse.Namespace):
+    import numpy as np
+    import polars as pl
+    import pulp
+    from core.batch_optimizer import constraints_path, foods_path
+    from core.options import SolverOptions
+    from core.persistent_model import PersistentDietModel
+    from core.sensitivity import analyze_sensitivity, parametric_sweep
+
+    for path in (constraints_path(args.setting_name_1), foods_path(args.setting_name_2)):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"設定ファイルが見つかりません: {path}")
+    df_constraints = pl.read_csv(constraints_path(args.setting_name_1))
+    df_foods = pl.read_csv(foods_path(args.setting_name_2))
+    output_dir = f"/app/data/step3_optimize/{args.setting_name}/"
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 双対価格と値段の範囲の計算, 制約値を変えた再求解で同じモデルを使い回す
+    persistent_model = PersistentDietModel.from_frames(df_foods, df_constraints, SolverOptions(scaling=args.scaling))
+    report = analyze_sensitivity(df_foods, df_constraints, args.ignore, persistent_model=persistent_model)
+    if report.status != pulp.LpStatusOptimal:
+        print(f"最適解が見つかりませんでした (ステータス: {pulp.LpStatus[report.status]})。-i で無視する制約を指定してください。")
+        return
+
+    print(f"最小費用: {report.objective:.2f}")
+    print("\n--- 効いている制約 (制約値を1増やしたときの費用の変化) ---")
+    for row in report.df_constraints.filter(pl.col("is_binding")).iter_rows(named=True):
+        print(f"  {row['constraint']}: {row['shadow_price']:+.4f} (制約値 {_format_bound(row['range_lower'])} 〜 {_format_bound(row['range_upper'])} の範囲で有効)")
+    report.df_constraints.write_csv(os.path.join(output_dir, "sensitivity_constraints.csv"))
+    report.df_foods.write_csv(os.path.join(output_dir, "sensitivity_foods.csv"))
+    print(f"\n感度分析の結果が出力されました: {output_dir}")
+
+    if args.parameter is None:
+        return
+    if args.values is not None:
+        values = args.values
+    elif args.range is not None:
+        values = np.linspace(args.range[0], args.range[1], int(args.range[2])).tolist()
+    else:
+        raise ValueError("--values または --range で値を指定してください。")
+    df_sweep = parametric_sweep(df_foods, df_constraints, args.parameter, values, args.ignore, persistent_model=persistent_model)
+    sweep_path = os.path.join(output_dir, f"sweep_{args.parameter.replace(':', '_')}.csv")
+    df_sweep.write_csv(sweep_path)
+    print(f"\n--- {args.parameter} を変化させた結果 ---")
+    for row in df_sweep.iter_rows(named=True):
+        objective = f"{row['objective']:.2f}" if row["objective"] is not None else "-"
+        print(f"  {row['value']:.4g}: {row['status']} 最小費用 {objective} (反復 {row['iterations']}回)")
+    print(f"結果が出力されました: {sweep_path}")
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("-s", "--setting_name", type=str, required=True, help="設定名")
+    parser.add_argument("-s1", "--setting_name_1", type=str, required=True, help="設定名1")
+    parser.add_argument("-s2", "--setting_name_2", type=str, required=True, help="設定名2")
+    parser.add_argument("-i", "--ignore", type=str, nargs="+", default=[], help="無視する制約名 (例: Min_chromium)")
+    parser.add_argument("-p", "--parameter", type=str, required=False, help="変化させる制約名 (例: Min_energy) または cost:食品名")
+    parser.add_argument("--values", type=float, nargs="+", required=False, help="制約値または値段の一覧")
+    parser.add_argument("--range", type=float, nargs=3, metavar=("START", "STOP", "NUM"), required=False, help="制約値または値段の範囲と点数")
+    parser.add_argument("--scaling", action="store_true", help="行 (栄養素) と列 (食品) の係数の大きさを幾何平均で均してから解く (双対価格と範囲はスケーリング前の値で出力する)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    main(args)